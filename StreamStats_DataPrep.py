@@ -1093,6 +1093,20 @@ class HydroDEM(object):
 			Defaults to -50000 vertical map units.
 		Bowl Depth : GPDouble (optional)
 			Defaults to 2000 vertical map units.
+		Engine : GPString (optional)
+			Processing engine, either arcpy (Spatial Analyst) or numpy (array engines in :mod:`hydro_arrays`), defaults to arcpy.
+		Tiled : GPBoolean (optional)
+			Run the whole pipeline tile by tile on memory-mapped arrays in the scratch workspace, for local folders too large for memory. Uses the numpy engine, defaults to False. Memory use is a few tiles per worker, plus small tables of the watersheds and flats that reach the tile edges.
+		Tile Size : GPLong (optional)
+			Number of rows and columns in each tile of the tiled mode, defaults to 2048.
+		Resume : GPBoolean (optional)
+			Checkpoint each stage and, on a rerun, resume at the first stage whose inputs or parameters changed, defaults to False.
+		Profile : GPBoolean (optional)
+			Write the time, memory and I/O of each stage to hydrodem_profile.jsonl next to the outputs, defaults to False.
+		Tile Workers : GPLong (optional)
+			Number of workers the tiled mode runs at once, processes for the fill and threads for the bowling distance, defaults to 1.
+		Sink Polygons : GPBoolean (optional)
+			Trace the sink polygons, defaults to True. The numpy engine and tiled mode also write a sink table, which is all they write when this is unchecked.
 
 		Returns
 		-------
@@ -1261,7 +1275,71 @@ class HydroDEM(object):
 
 		param17.value = 2000
 
-		params = [param0,param18,param1,param2,param3,param4,param5,param6,param7,param8,param9,param10,param11,param12,param13,param14,param15,param16,param17]
+		param19 = arcpy.Parameter(
+			displayName = "Engine",
+			name = "engine",
+			datatype = "GPString",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param19.filter.list = ["arcpy", "numpy"]
+		param19.value = "arcpy"
+
+		param20 = arcpy.Parameter(
+			displayName = "Tiled",
+			name = "tiled",
+			datatype = "GPBoolean",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param20.value = False
+
+		param21 = arcpy.Parameter(
+			displayName = "Tile Size",
+			name = "tileSize",
+			datatype = "GPLong",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param21.value = 2048
+
+		param22 = arcpy.Parameter(
+			displayName = "Resume",
+			name = "resume",
+			datatype = "GPBoolean",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param22.value = False
+
+		param23 = arcpy.Parameter(
+			displayName = "Profile",
+			name = "profile",
+			datatype = "GPBoolean",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param23.value = False
+
+		param24 = arcpy.Parameter(
+			displayName = "Tile Workers",
+			name = "tileWorkers",
+			datatype = "GPLong",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param24.value = 1
+
+		param25 = arcpy.Parameter(
+			displayName = "Sink Polygons",
+			name = "sinkPolygons",
+			datatype = "GPBoolean",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param25.value = True
+
+		params = [param0,param18,param1,param2,param3,param4,param5,param6,param7,param8,param9,param10,param11,param12,param13,param14,param15,param16,param17,param19,param20,param21,param22,param23,param24,param25]
 
 		return params
 
@@ -1288,8 +1366,15 @@ class HydroDEM(object):
 		agreesharp = int(parameters[17].valueAsText)
 		bowldepth = int(parameters[18].valueAsText)
 		scratchWS = parameters[1].valueAsText
+		engine = parameters[19].valueAsText
+		tiled = bool(parameters[20].value)
+		tileSize = int(parameters[21].valueAsText)
+		resume = bool(parameters[22].value)
+		profile = bool(parameters[23].value)
+		tileWorkers = int(parameters[24].valueAsText)
+		sinkPolygons = bool(parameters[25].value)
 
-		hydrodem(outdir, huc8cov, origdem, dendrite, snap_grid, bowl_polys, bowl_lines, inwall, drainplug, buffdist, inwallbuffdist, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, cellsz, scratchWS, version = version)
+		hydrodem(outdir, huc8cov, origdem, dendrite, snap_grid, bowl_polys, bowl_lines, inwall, drainplug, buffdist, inwallbuffdist, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, cellsz, scratchWS, version = version, engine = engine, tiled = tiled, tileSize = tileSize, tileWorkers = tileWorkers, resume = resume, profile = profile, sinkPolygons = sinkPolygons)
 
 		return None
 
@@ -1320,6 +1405,10 @@ class AdjustAccum(object):
 			Upstream flow direction grids corresponding to the grids listed above.
 		Workspace : Workspace (Geodatabase)
 			Geodatabase to work in.
+		Engine : GPString (optional)
+			Path tracing engine, either arcpy (CostPath from each inlet) or numpy (one pass down the flow directions from all inlets, see :func:`hydro_arrays.propagate_paths`), defaults to arcpy.
+		Encoding : GPString (optional)
+			Compact encoding of fac_global with the numpy engine, none, scaled or log uint32 codes, defaults to none.
 
 		Returns
 		-------
@@ -1366,7 +1455,27 @@ class AdjustAccum(object):
 
 		param4.filter.list = ["Local Database","File System"]
 
-		params = [param0,param1,param2,param3,param4]
+		param5 = arcpy.Parameter(
+			displayName = "Engine",
+			name = "engine",
+			datatype = "GPString",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param5.filter.list = ["arcpy", "numpy"]
+		param5.value = "arcpy"
+
+		param6 = arcpy.Parameter(
+			displayName = "Encoding",
+			name = "encoding",
+			datatype = "GPString",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param6.filter.list = ["none", "scaled", "log"]
+		param6.value = "none"
+
+		params = [param0,param1,param2,param3,param4,param5,param6]
 		return params
 
 	def execute(self, parameters, messages):
@@ -1377,8 +1486,12 @@ class AdjustAccum(object):
 		upstreamFACpths = (parameters[2].valueAsText).split(';') # list of upstream flow accumulation grids
 		upstreamFDRpths = (parameters[3].valueAsText).split(';') # list of upstream flow direction grids
 		workspace = parameters[4].valueAsText # path to geodatabase workspace to work in
+		engine = parameters[5].valueAsText # path tracing engine
+		encoding = parameters[6].valueAsText # compact encoding of fac_global
+		if encoding in [None, "none"]:
+			encoding = None
 
-		adjust_accum(facPth, fdrPth, upstreamFACpths,upstreamFDRpths, workspace, version = version)
+		adjust_accum(facPth, fdrPth, upstreamFACpths,upstreamFDRpths, workspace, version = version, engine = engine, encoding = encoding)
 
 		return None
 
@@ -1390,7 +1503,7 @@ class AdjustAccumSimp(object):
 
 	def __init__(self):
 		self.label = "D.2 Adjust Accumulation (Simple)"
-		self.description = "Simplified flow accumulation adjustment tool. Takes a single point feature class as input, and adjusts fac downstream of that point. Use this when the more automated Flow Accum Adjust tool fails. First make a point at the inlet. Make a separate point feature class and run this separately for each inlet."
+		self.description = "Simplified flow accumulation adjustment tool. Takes a single point feature class as input, and adjusts fac downstream of that point. Use this when the more automated Flow Accum Adjust tool fails. First make a point at the inlet. Make a separate point feature class and run this separately for each inlet, or put every inlet in one feature class with its value in an increment field."
 		self.canRunInBackground = False
 		self.category = "4 - HydroDEM"
 
@@ -1411,6 +1524,10 @@ class AdjustAccumSimp(object):
 			Corrected flow accumulation grid.
 		Adjustment Value : GPString
 			Upstream flow accumulation value to correct the downstream hydrologic unit with, defaults to 150000 grid cells.
+		Increment Field : Field (optional)
+			Field of the inlet points holding the upstream flow accumulation value of each inlet. All inlets are traced down the flow direction grid at once and the adjustment value is used for inlets with no value.
+		Engine : GPString (optional)
+			Adjustment engine, either arcpy (CostPath and map algebra) or numpy (the flow paths are walked and the grid is corrected block by block with no intermediate rasters), defaults to arcpy. The numpy engine is always used with an increment field.
 
 		Returns
 		-------
@@ -1464,7 +1581,26 @@ class AdjustAccumSimp(object):
 
 		param5.value = '150000'
 
-		params = [param0,param1,param2,param3,param4,param5]
+		param6 = arcpy.Parameter(
+			displayName = "Increment Field",
+			name = "incrField",
+			datatype = "Field",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param6.parameterDependencies = [param0.name]
+
+		param7 = arcpy.Parameter(
+			displayName = "Engine",
+			name = "engine",
+			datatype = "GPString",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param7.filter.list = ["arcpy", "numpy"]
+		param7.value = "arcpy"
+
+		params = [param0,param1,param2,param3,param4,param5,param6,param7]
 		return params
 
 	def execute(self, parameters, messages):
@@ -1476,8 +1612,10 @@ class AdjustAccumSimp(object):
 		filin = parameters[3].valueAsText
 		facout = parameters[4].valueAsText
 		incrval = int(parameters[5].valueAsText)
+		incrField = parameters[6].valueAsText # None unless every inlet has its own value
+		engine = parameters[7].valueAsText # adjustment engine
 
-		adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval, version = version)
+		adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval, version = version, incrField = incrField, engine = engine)
 
 		return None
 
@@ -1488,12 +1626,12 @@ class posthydrodem(object):
 
 	Notes
 	-----
-	This tool only functions with ESRI ArcMap / Python 2, ESRI ArcPro / Python 3 are currently not supported.
+	This tool only functions with ESRI ArcMap / Python 2, ESRI ArcPro / Python 3 are currently not supported except for the rasters made by the numpy engine.
 	"""
 
 	def __init__(self):
 		self.label = "E. Post Hydrodem"
-		self.description = "This fucntion uses ESRI ArcHydroTools to generate the following rasters: str, str900, cat, and lnk. Feature classes of drainageLine, catchment, adjointCatchment, and drainagePoint are also created. This tool only runs using Python 2 as ESRI ArcHydro tools are not fully implemented with Python 3."
+		self.description = "This fucntion uses ESRI ArcHydroTools to generate the following rasters: str, str900, cat, and lnk. Feature classes of drainageLine, catchment, adjointCatchment, and drainagePoint are also created. This tool only runs using Python 2 as ESRI ArcHydro tools are not fully implemented with Python 3. With the numpy engine the str, str900, lnk and cat rasters and the drainagePoint feature class are also created in Python 3."
 		self.canRunInBackground = False
 		self.category = "4 - HydroDEM"
 
@@ -1514,6 +1652,8 @@ class posthydrodem(object):
 			str900 grid or similar threshold, in raster cells.
 		Sink Link : DERasterBand
 			Sink link raster name.
+		Engine : GPString (optional)
+			Stream definition, catchment and drainage point engine, either arcpy (Spatial Analyst and ArcHydro) or numpy (one pass over the flow accumulation grid, links numbered with :func:`hydro_arrays.stream_links`, catchments flooded upstream with :func:`hydro_arrays.catchment_grid` and drainage points from :func:`hydro_arrays.catchment_outlets`), defaults to arcpy.
 		
 		Returns
 		-------
@@ -1565,7 +1705,17 @@ class posthydrodem(object):
 			parameterType = "Optional",
 			direction = "Input")
 
-		params = [param0,param1,param2,param3,param4, param5]
+		param6 = arcpy.Parameter(
+			displayName = "Engine",
+			name = "engine",
+			datatype = "GPString",
+			parameterType = "Optional",
+			direction = "Input")
+
+		param6.filter.list = ["arcpy", "numpy"]
+		param6.value = "arcpy"
+
+		params = [param0,param1,param2,param3,param4, param5, param6]
 		return params
 
 	def execute(self, parameters, messages):
@@ -1577,7 +1727,8 @@ class posthydrodem(object):
 		thresh1 = int(parameters[3].valueAsText)
 		thresh2 = int(parameters[4].valueAsText)
 		sinksPth = parameters[5].valueAsText
+		engine = parameters[6].valueAsText # stream, catchment and drainage point engine
 
-		postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = sinksPth, version = version)
+		postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = sinksPth, version = version, engine = engine)
 
 		return None
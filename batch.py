@@ -0,0 +1,542 @@
+'''Run tools over every local folder of a processing domain in parallel.
+
+:func:`databaseSetup.databaseSetup` creates one local folder, usually a HUC8, per hydrologic unit, each holding an input_data.gdb geodatabase and a tmp folder. The functions here find those folders and run a tool for each one in its own worker process, so a statewide domain is processed several folders at a time rather than one after the other.
+
+Each worker is a fresh process that exits after its folder, uses the folder's tmp folder as its scratch workspace and temporary directory, and writes its messages to a log file in the folder. Failed folders are retried and a summary table of every folder is written to the workspace.
+'''
+import arcpy
+import sys
+import os
+import time
+import json
+import csv
+import traceback
+import multiprocessing
+
+from hydro_arrays import set_worker_executable
+
+GDB_name = "input_data.gdb" # geodatabase created in each local folder by databaseSetup
+
+def local_folders(workspace, gdbName = GDB_name):
+	'''Find the local folders in a workspace.
+
+	Parameters
+	----------
+	workspace : str
+		Folder-type workspace passed to :func:`databaseSetup.databaseSetup`.
+	gdbName : str (optional)
+		Name of the geodatabase that marks a local folder, defaults to input_data.gdb.
+
+	Returns
+	-------
+	folders : list
+		Sorted paths to the local folders.
+	'''
+	folders = []
+	for name in sorted(os.listdir(workspace)):
+		pth = os.path.join(workspace, name)
+		if os.path.isdir(pth) and os.path.isdir(os.path.join(pth, gdbName)):
+			folders.append(pth)
+	return folders
+
+def _runFolder(task):
+	'''Run a tool for one local folder, in a worker process.
+
+	Parameters
+	----------
+	task : tuple
+		(module name, function name, folder, positional arguments, keyword arguments, log file name, attempt).
+
+	Returns
+	-------
+	result : dict
+		Folder, status ('ok' or 'failed'), attempt, seconds, error message and the value returned by the tool.
+	'''
+	moduleName, funcName, folder, args, kwargs, logName, attempt = task
+	strtTime = time.time()
+
+	# give the worker its own scratch space so concurrent folders never share temporary files
+	tmp = os.path.join(folder, 'tmp')
+	if not os.path.isdir(tmp):
+		os.makedirs(tmp)
+	for var in ['TEMP', 'TMP', 'TMPDIR']:
+		os.environ[var] = tmp
+	import tempfile
+	tempfile.tempdir = tmp
+
+	log = open(os.path.join(folder, logName), 'a')
+	stdout, stderr = sys.stdout, sys.stderr
+	sys.stdout = sys.stderr = log # arcpy.AddMessage prints to stdout outside of a tool
+	try:
+		print('---- %s attempt %s, %s ----'%(funcName, attempt, time.strftime('%Y-%m-%d %H:%M:%S')))
+		arcpy.env.scratchWorkspace = tmp
+		module = __import__(moduleName)
+		value = getattr(module, funcName)(*args, **kwargs)
+		status, error = 'ok', ''
+	except (Exception, SystemExit) as e:
+		traceback.print_exc()
+		status, error, value = 'failed', ('%s: %s'%(type(e).__name__, e)).strip(), None
+	finally:
+		sys.stdout, sys.stderr = stdout, stderr
+		log.close()
+
+	return {'folder': folder, 'status': status, 'attempt': attempt, 'seconds': time.time() - strtTime, 'error': error, 'value': value}
+
+def run_folders(tasks, workers = None, retries = 1, logName = 'batch.log'):
+	'''Run a tool for many local folders in a pool of worker processes.
+
+	Parameters
+	----------
+	tasks : list
+		(module name, function name, folder, positional arguments, keyword arguments) for each folder. The function is imported from the module in the worker, so it must be importable from the worker's path.
+	workers : int (optional)
+		Number of folders processed at a time, defaults to the number of CPUs.
+	retries : int (optional)
+		Number of times a failed folder is rerun, defaults to 1.
+	logName : str (optional)
+		Name of the log file written in each folder, defaults to batch.log.
+
+	Returns
+	-------
+	results : list
+		Result of the last attempt for each folder, in the order of *tasks*, see :func:`_runFolder`.
+	'''
+	if workers is None:
+		workers = multiprocessing.cpu_count()
+	workers = max(1, int(workers))
+	set_worker_executable()
+
+	results = {}
+	pending = list(tasks)
+	for attempt in range(1, retries + 2):
+		if not pending:
+			break
+		if attempt > 1:
+			arcpy.AddMessage('Retrying %s failed local folders, attempt %s.'%(len(pending), attempt))
+
+		jobs = [(t[0], t[1], t[2], t[3], t[4], logName, attempt) for t in pending]
+		pool = multiprocessing.Pool(min(workers, len(jobs)), maxtasksperchild = 1) # a fresh process for every folder
+		try:
+			for res in pool.imap_unordered(_runFolder, jobs):
+				results[res['folder']] = res
+				arcpy.AddMessage('	%s %s, %.1f minutes.'%(os.path.basename(res['folder']), res['status'], res['seconds']/60.))
+		finally:
+			pool.close()
+			pool.join()
+
+		pending = [t for t in pending if results[t[2]]['status'] != 'ok']
+
+	return [results[t[2]] for t in tasks]
+
+def write_summary(results, outPth):
+	'''Write a summary table of a batch run as comma separated values and report it.
+
+	Parameters
+	----------
+	results : list
+		Results from :func:`run_folders`.
+	outPth : str
+		Path to the output csv file.
+
+	Returns
+	-------
+	None
+	'''
+	fields = ['folder', 'status', 'attempt', 'seconds', 'error']
+	fl = open(outPth, 'wb') if sys.version_info[0] < 3 else open(outPth, 'w', newline = '') # as the csv module expects
+	with fl:
+		writer = csv.writer(fl)
+		writer.writerow(fields)
+		for res in results:
+			writer.writerow([os.path.basename(res['folder']), res['status'], res['attempt'], '%.1f'%res['seconds'], res['error']])
+
+	nFailed = len([res for res in results if res['status'] != 'ok'])
+	arcpy.AddMessage('%s local folders processed, %s failed. Summary written to %s'%(len(results), nFailed, outPth))
+	for res in results:
+		if res['status'] != 'ok':
+			arcpy.AddMessage('	%s failed after %s attempts: %s'%(os.path.basename(res['folder']), res['attempt'], res['error']))
+
+def hydrodem_batch(workspace, snap_grid, origdem = 'dem', huc8cov = os.path.join(GDB_name, 'local'), dendrite = os.path.join(GDB_name, 'Hydrography', 'NHDFlowline'), bowl_polys = None, bowl_lines = None, inwall = os.path.join(GDB_name, 'inwall_edit'), drainplug = None, buffdist = 50, inwallbuffdist = 15, inwallht = 150000, outwallht = 300000, agreebuf = 60, agreesmooth = -500, agreesharp = -50000, bowldepth = 2000, cellsz = 10, outdir = GDB_name, folders = None, workers = None, retries = 1, version = None, **kwargs):
+	'''Run :func:`make_hydrodem.hydrodem` for every local folder in a workspace in parallel.
+
+	Dataset parameters are paths relative to each local folder, e.g. the default dendrite is input_data.gdb/Hydrography/NHDFlowline in every folder. Absolute paths, such as the shared snap grid, are used as is. Each folder's tmp folder is used as its scratch workspace.
+
+	Parameters
+	----------
+	workspace : str
+		Folder-type workspace holding the local folders created by :func:`databaseSetup.databaseSetup`.
+	snap_grid : str
+		Path to the snap grid shared by all local folders.
+	origdem : str (optional)
+		DEM to be enforced, defaults to dem.
+	huc8cov : str (optional)
+		Local folder polygon, defaults to input_data.gdb/local.
+	dendrite : str (optional)
+		Stream dendrite, defaults to input_data.gdb/Hydrography/NHDFlowline.
+	bowl_polys : str (optional)
+		NHD waterbody grid from :func:`make_hydrodem.bathymetricGradient`, defaults to None.
+	bowl_lines : str (optional)
+		NHD flowline grid from :func:`make_hydrodem.bathymetricGradient`, defaults to None.
+	inwall : str (optional)
+		Inner walls, defaults to input_data.gdb/inwall_edit.
+	drainplug : str (optional)
+		Drain plugs, e.g. input_data.gdb/sinkpoint_edit, defaults to None.
+	buffdist, inwallbuffdist, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, cellsz : numeric (optional)
+		See :func:`make_hydrodem.hydrodem`, default to the HydroDEM tool defaults.
+	outdir : str (optional)
+		Geodatabase-type workspace where the outputs are saved, defaults to input_data.gdb.
+	folders : list (optional)
+		Names of the local folders to process, defaults to every local folder in the workspace.
+	workers : int (optional)
+		Number of local folders processed at a time, defaults to the number of CPUs.
+	retries : int (optional)
+		Number of times a failed local folder is rerun, defaults to 1.
+	version : str (optional)
+		Package version number.
+	**kwargs
+		Other keyword arguments passed to :func:`make_hydrodem.hydrodem`, e.g. engine or resume.
+
+	Returns
+	-------
+	results : list
+		Result of each local folder, also written to hydrodem_batch_summary.csv in the workspace.
+
+	Notes
+	-----
+	Each worker runs in its own process with its own ESRI ArcPy session and Spatial Analyst license. Messages from each local folder are written to hydrodem_batch.log in the folder rather than to the tool window.
+	'''
+	strtTime = time.time()
+	if version:
+		arcpy.AddMessage('StreamStats Data Preparation Tools version: %s'%(version))
+
+	if folders is None:
+		folders = local_folders(workspace)
+	else:
+		folders = [os.path.join(workspace, fl) for fl in folders]
+	arcpy.AddMessage('Running HydroDEM for %s local folders.'%(len(folders)))
+
+	def inFolder(folder, pth):
+		return None if pth is None else os.path.join(folder, pth) # absolute paths are kept by os.path.join
+
+	tasks = []
+	for folder in folders:
+		args = (inFolder(folder, outdir), inFolder(folder, huc8cov), inFolder(folder, origdem), inFolder(folder, dendrite), snap_grid, inFolder(folder, bowl_polys), inFolder(folder, bowl_lines), inFolder(folder, inwall), inFolder(folder, drainplug), buffdist, inwallbuffdist, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, cellsz, os.path.join(folder, 'tmp'))
+		tasks.append(('make_hydrodem', 'hydrodem', folder, args, dict(kwargs, version = version)))
+
+	results = run_folders(tasks, workers = workers, retries = retries, logName = 'hydrodem_batch.log')
+	write_summary(results, os.path.join(workspace, 'hydrodem_batch_summary.csv'))
+
+	totalTime = time.time() - strtTime
+	arcpy.AddMessage('HydroDEM batch complete, %s minutes.'%(totalTime/60.))
+
+	return results
+
+def posthydrodem_batch(workspace, thresh1, thresh2, fac = os.path.join(GDB_name, 'fac'), fdr = os.path.join(GDB_name, 'fdr'), sinks = None, outdir = GDB_name, folders = None, workers = None, retries = 1, engine = 'numpy', version = None):
+	'''Run :func:`make_hydrodem.postHydroDEM` for every local folder in a workspace in parallel.
+
+	Dataset parameters are paths relative to each local folder, as in :func:`hydrodem_batch`. With the numpy engine the stream grids are made without ArcHydro, so the folders can be processed in Python 3.
+
+	Parameters
+	----------
+	workspace : str
+		Folder-type workspace holding the local folders created by :func:`databaseSetup.databaseSetup`.
+	thresh1 : int
+		Threshold of the str grid, in raster cells.
+	thresh2 : int
+		Threshold of the str900 grid or similar, in raster cells.
+	fac : str (optional)
+		Flow accumulation grid, defaults to input_data.gdb/fac.
+	fdr : str (optional)
+		Flow direction grid, defaults to input_data.gdb/fdr.
+	sinks : str (optional)
+		Sink link grid, defaults to None.
+	outdir : str (optional)
+		Geodatabase-type workspace passed to postHydroDEM, defaults to input_data.gdb.
+	folders : list (optional)
+		Names of the local folders to process, defaults to every local folder in the workspace.
+	workers : int (optional)
+		Number of local folders processed at a time, defaults to the number of CPUs.
+	retries : int (optional)
+		Number of times a failed local folder is rerun, defaults to 1.
+	engine : str (optional)
+		Stream definition engine passed to postHydroDEM, defaults to 'numpy'.
+	version : str (optional)
+		Package version number.
+
+	Returns
+	-------
+	results : list
+		Result of each local folder, also written to posthydrodem_batch_summary.csv in the workspace.
+	'''
+	strtTime = time.time()
+	if version:
+		arcpy.AddMessage('StreamStats Data Preparation Tools version: %s'%(version))
+
+	if folders is None:
+		folders = local_folders(workspace)
+	else:
+		folders = [os.path.join(workspace, fl) for fl in folders]
+	arcpy.AddMessage('Running Post HydroDEM for %s local folders.'%(len(folders)))
+
+	tasks = []
+	for folder in folders:
+		args = (os.path.join(folder, outdir), os.path.join(folder, fac), os.path.join(folder, fdr), thresh1, thresh2)
+		kwargs = {'sinksPth': None if sinks is None else os.path.join(folder, sinks), 'engine': engine, 'version': version}
+		tasks.append(('make_hydrodem', 'postHydroDEM', folder, args, kwargs))
+
+	results = run_folders(tasks, workers = workers, retries = retries, logName = 'posthydrodem_batch.log')
+	write_summary(results, os.path.join(workspace, 'posthydrodem_batch_summary.csv'))
+
+	totalTime = time.time() - strtTime
+	arcpy.AddMessage('Post HydroDEM batch complete, %s minutes.'%(totalTime/60.))
+
+	return results
+
+def dependency_levels(downstream):
+	'''Order local folders from upstream to downstream.
+
+	Parameters
+	----------
+	downstream : dict
+		Local folder each local folder drains into, None for folders draining out of the domain.
+
+	Returns
+	-------
+	levels : list
+		Lists of local folders. Every folder draining into a folder is in an earlier list, so the folders of a list do not depend on each other and can be processed at the same time. Headwater folders are in the first list.
+	'''
+	upstream = dict((folder, []) for folder in downstream)
+	for folder, down in downstream.items():
+		if down is not None:
+			upstream.setdefault(down, []).append(folder)
+
+	# longest path from a headwater folder, computed in topological order
+	remaining = dict((folder, len(ups)) for folder, ups in upstream.items())
+	level = {}
+	ready = sorted(folder for folder, n in remaining.items() if n == 0)
+	while ready:
+		folder = ready.pop()
+		level[folder] = max([level[u] + 1 for u in upstream[folder]] + [0])
+		down = downstream.get(folder)
+		if down is not None:
+			remaining[down] -= 1
+			if remaining[down] == 0:
+				ready.append(down)
+
+	if len(level) != len(upstream):
+		raise ValueError('The local folders drain into each other in a loop: %s'%(', '.join(sorted(os.path.basename(f) for f in upstream if f not in level))))
+
+	levels = [[] for i in range(max(level.values()) + 1)] if level else []
+	for folder in sorted(level):
+		levels[level[folder]].append(folder)
+	return levels
+
+def _drainsInto(outlet, extent, fdrPth):
+	'''Whether the point an outlet drains to holds data in a flow direction grid with the given [xmin, ymin, xmax, ymax] extent.'''
+	xmin, ymin, xmax, ymax = extent
+	if not (xmin < outlet['x'] < xmax and ymin < outlet['y'] < ymax):
+		return False
+	value = arcpy.GetCellValue_management(fdrPth, '%s %s'%(outlet['x'], outlet['y'])).getOutput(0)
+	return value.strip() not in ['', 'NoData']
+
+def _gridExtent(pth):
+	'''[xmin, ymin, xmax, ymax] extent of a grid, None if it cannot be read.'''
+	try:
+		ext = arcpy.Describe(pth).extent
+	except Exception: # missing or unreadable
+		return None
+	return [ext.XMin, ext.YMin, ext.XMax, ext.YMax]
+
+def _touches(a, b):
+	'''Whether two [xmin, ymin, xmax, ymax] extents overlap or share an edge.'''
+	return a[0] <= b[2] and b[0] <= a[2] and a[1] <= b[3] and b[1] <= a[3]
+
+def adjust_accum_batch(workspace, fac = os.path.join(GDB_name, 'fac'), fdr = os.path.join(GDB_name, 'fdr'), outdir = GDB_name, folders = None, workers = None, retries = 1, engine = 'numpy', encoding = None, version = None):
+	'''Adjust the flow accumulation grids of every local folder in a workspace for the local folders draining into them.
+
+	The outlet of each local folder, the largest cell of its fac, is found and the folder it drains into is the other local folder whose fdr has data where the outlet flows. The folders are then ordered from upstream to downstream (see :func:`dependency_levels`) and :func:`make_hydrodem.adjust_accum` is run for every folder with folders draining into it, taking the fac_global of those folders where they have one. Folders at the same level are run in parallel.
+
+	Parameters
+	----------
+	workspace : str
+		Folder-type workspace holding the local folders created by :func:`databaseSetup.databaseSetup`.
+	fac : str (optional)
+		Flow accumulation grid relative to each local folder, defaults to input_data.gdb/fac.
+	fdr : str (optional)
+		Flow direction grid relative to each local folder, defaults to input_data.gdb/fdr.
+	outdir : str (optional)
+		Geodatabase-type workspace where fac_global is saved, relative to each local folder, defaults to input_data.gdb.
+	folders : list (optional)
+		Names of the local folders to process, defaults to every local folder in the workspace.
+	workers : int (optional)
+		Number of local folders processed at a time, defaults to the number of CPUs.
+	retries : int (optional)
+		Number of times a failed local folder is rerun, defaults to 1.
+	engine : str (optional)
+		Path tracing engine of :func:`make_hydrodem.adjust_accum`, defaults to numpy.
+	encoding : str (optional)
+		Compact encoding of the fac_global grids written by the numpy engine, 'scaled' or 'log', defaults to None, see :func:`make_hydrodem.adjust_accum`.
+	version : str (optional)
+		Package version number.
+
+	Returns
+	-------
+	manifest : dict
+		For each local folder, the folder it drains into, the folders draining into it, the failed folders that may drain into it, its level, the point its outlet drains to, its local and global accumulation at the outlet, the accumulation grid to use downstream and its status. Also written to adjust_accum_manifest.json in the workspace.
+
+	Notes
+	-----
+	The global accumulation of a local folder is its own accumulation at the outlet plus the global accumulation of the folders draining into it, the value added downstream of its outlet. A local folder is skipped if a folder upstream of it failed. A folder whose outlet could not be found may drain into any folder whose extent touches its own, or into any folder if its extent cannot be read either, so those folders are listed with it in unresolved_upstream and skipped too.
+	'''
+	strtTime = time.time()
+	if version:
+		arcpy.AddMessage('StreamStats Data Preparation Tools version: %s'%(version))
+
+	if folders is None:
+		folders = local_folders(workspace)
+	else:
+		folders = [os.path.join(workspace, fl) for fl in folders]
+
+	# find the outlet of every local folder
+	arcpy.AddMessage('Finding the outlets of %s local folders.'%(len(folders)))
+	tasks = [('make_hydrodem', 'find_outlet', folder, (os.path.join(folder, fac), os.path.join(folder, fdr)), {}) for folder in folders]
+	results = run_folders(tasks, workers = workers, retries = retries, logName = 'adjust_accum_batch.log')
+	outlets = dict((res['folder'], res['value']) for res in results if res['status'] == 'ok')
+
+	# the local folder each outlet drains into
+	downstream = {}
+	for folder, outlet in outlets.items():
+		downstream[folder] = None
+		if outlet['x'] is None:
+			continue
+		for other in folders:
+			if other != folder and other in outlets and _drainsInto(outlet, outlets[other]['extent'], os.path.join(other, fdr)):
+				downstream[folder] = other
+				break
+	levels = dependency_levels(downstream)
+
+	# a folder without an outlet could drain into any folder next to it
+	unresolved = dict((folder, []) for folder in folders)
+	for res in results:
+		if res['status'] == 'ok':
+			continue
+		extent = _gridExtent(os.path.join(res['folder'], fdr))
+		for other in outlets:
+			if extent is None or _touches(extent, outlets[other]['extent']):
+				unresolved[other].append(os.path.basename(res['folder']))
+
+	manifest = {}
+	for res in results:
+		folder = res['folder']
+		manifest[folder] = {'folder': os.path.basename(folder), 'downstream': None, 'upstream': [], 'unresolved_upstream': unresolved[folder], 'level': None, 'outlet_x': None, 'outlet_y': None, 'local_fac': None, 'global_fac': None, 'fac_global': None, 'status': 'failed' if res['status'] != 'ok' else 'pending'}
+	for level, group in enumerate(levels):
+		for folder in group:
+			entry = manifest[folder]
+			entry.update({'level': level, 'outlet_x': outlets[folder]['x'], 'outlet_y': outlets[folder]['y'], 'local_fac': outlets[folder]['fac']})
+			if downstream[folder] is not None:
+				entry['downstream'] = os.path.basename(downstream[folder])
+				manifest[downstream[folder]]['upstream'].append(os.path.basename(folder))
+	manifestPth = os.path.join(workspace, 'adjust_accum_manifest.json')
+
+	def writeManifest():
+		with open(manifestPth, 'w') as fl:
+			json.dump({'levels': [[os.path.basename(f) for f in group] for group in levels], 'folders': [manifest[f] for f in folders]}, fl, indent = 1, sort_keys = True)
+
+	# adjust level by level, the folders of a level in parallel
+	adjusted = []
+	for level, group in enumerate(levels):
+		tasks = []
+		for folder in group:
+			entry = manifest[folder]
+			ups = [os.path.join(workspace, u) for u in entry['upstream']]
+			if entry['unresolved_upstream'] or any(manifest[u]['status'] not in ['ok', 'headwater'] for u in ups):
+				entry['status'] = 'skipped'
+				continue
+			entry['global_fac'] = entry['local_fac'] + sum(manifest[u]['global_fac'] for u in ups)
+			if not ups:
+				entry['status'] = 'headwater'
+				entry['fac_global'] = os.path.join(folder, fac)
+				continue
+			entry['fac_global'] = os.path.join(os.path.join(folder, outdir), 'fac_global')
+			args = (os.path.join(folder, fac), os.path.join(folder, fdr), [manifest[u]['fac_global'] for u in ups], [os.path.join(u, fdr) for u in ups], os.path.join(folder, outdir))
+			tasks.append(('make_hydrodem', 'adjust_accum', folder, args, {'engine': engine, 'encoding': encoding, 'version': version}))
+
+		if tasks:
+			arcpy.AddMessage('Adjusting %s local folders at level %s.'%(len(tasks), level))
+			for res in run_folders(tasks, workers = workers, retries = retries, logName = 'adjust_accum_batch.log'):
+				manifest[res['folder']]['status'] = res['status']
+				adjusted.append(res)
+		writeManifest()
+
+	writeManifest()
+	if adjusted:
+		write_summary(adjusted, os.path.join(workspace, 'adjust_accum_batch_summary.csv'))
+
+	totalTime = time.time() - strtTime
+	arcpy.AddMessage('FAC adjustment complete, %s minutes. Manifest written to %s'%(totalTime/60., manifestPth))
+
+	return manifest
+
+def update_accum_batch(workspace, folder, fac = os.path.join(GDB_name, 'fac'), fdr = os.path.join(GDB_name, 'fdr'), outdir = GDB_name, engine = 'numpy', encoding = None, version = None):
+	'''Update the fac_global grids downstream of a local folder whose fac changed, e.g. after it was hydro-enforced again.
+
+	Uses the manifest written by :func:`adjust_accum_batch`. If the changed folder has folders draining into it its fac_global is rebuilt with :func:`make_hydrodem.adjust_accum`. The change of its outlet is then passed down the chain of folders below it with :func:`make_hydrodem.update_accum`, which only walks the flow path of the change in each one.
+
+	Parameters
+	----------
+	workspace : str
+		Folder-type workspace holding the local folders and adjust_accum_manifest.json.
+	folder : str
+		Name of the local folder whose fac changed.
+	fac, fdr, outdir : str (optional)
+		Grids and geodatabase relative to each local folder, as passed to :func:`adjust_accum_batch`.
+	engine : str (optional)
+		Path tracing engine used to rebuild the changed folder's fac_global, defaults to numpy.
+	encoding : str (optional)
+		Compact encoding of a rebuilt fac_global, defaults to None.
+	version : str (optional)
+		Package version number.
+
+	Returns
+	-------
+	manifest : dict
+		The updated manifest, also written back to adjust_accum_manifest.json.
+	'''
+	from make_hydrodem import adjust_accum, update_accum, find_outlet
+
+	strtTime = time.time()
+	if version:
+		arcpy.AddMessage('StreamStats Data Preparation Tools version: %s'%(version))
+
+	manifestPth = os.path.join(workspace, 'adjust_accum_manifest.json')
+	assert os.path.exists(manifestPth), "%s does not exist, run adjust_accum_batch first"%(manifestPth)
+	with open(manifestPth) as fl:
+		record = json.load(fl)
+	entries = dict((entry['folder'], entry) for entry in record['folders'])
+	assert folder in entries, "%s is not in %s"%(folder, manifestPth)
+
+	# the changed folder itself, its outlet and, if it has inflows, its fac_global
+	entry = entries[folder]
+	folderPth = os.path.join(workspace, folder)
+	entry['local_fac'] = find_outlet(os.path.join(folderPth, fac), os.path.join(folderPth, fdr))['fac']
+	if entry['upstream']:
+		arcpy.AddMessage('Rebuilding fac_global for %s.'%(folder))
+		ups = [entries[u] for u in entry['upstream']]
+		adjust_accum(os.path.join(folderPth, fac), os.path.join(folderPth, fdr), [u['fac_global'] for u in ups], [os.path.join(workspace, u['folder'], fdr) for u in ups], os.path.join(folderPth, outdir), engine = engine, encoding = encoding)
+	entry['global_fac'] = entry['local_fac'] + sum(entries[u]['global_fac'] for u in entry['upstream'])
+
+	# pass the change down the chain of folders below it
+	while entry['downstream'] is not None:
+		down = entries[entry['downstream']]
+		arcpy.AddMessage('Updating %s.'%(down['folder']))
+		delta = update_accum(down['fac_global'], entry['fac_global'])
+		down['global_fac'] += delta
+		entry = down
+
+	with open(manifestPth, 'w') as fl:
+		json.dump(record, fl, indent = 1, sort_keys = True)
+
+	totalTime = time.time() - strtTime
+	arcpy.AddMessage('FAC update complete, %s minutes.'%(totalTime/60.))
+
+	return record
@@ -0,0 +1,62 @@
+'''Stage checkpoints for long running workflows.
+
+A manifest (a JSON file) records, for each completed stage, a key computed from the stage's inputs and parameters and the outputs it wrote. When a workflow is rerun, stages whose key matches and whose outputs still exist are skipped and their outputs reused, so the run resumes at the first stage whose inputs changed. Keys are chained, each stage's key includes the key of the stage before it, so a change invalidates every later stage.
+
+This module does not require ESRI ArcPy.
+'''
+import hashlib
+import json
+import os
+
+class StageManifest(object):
+	'''Record and look up completed stages in a JSON manifest.
+
+	Parameters
+	----------
+	path : str
+		Path to the manifest file, None to disable checkpointing so every stage runs and nothing is recorded.
+	exists : function (optional)
+		Function testing whether an output exists, defaults to os.path.exists. Use arcpy.Exists for datasets in geodatabases.
+	'''
+
+	def __init__(self, path, exists = os.path.exists):
+		self.path = path
+		self.exists = exists
+		self.stages = {}
+		if path is not None and os.path.exists(path):
+			try:
+				with open(path) as fl:
+					self.stages = json.load(fl).get('stages', {})
+			except (ValueError, AttributeError): # a corrupt manifest only means every stage is rerun
+				self.stages = {}
+
+	@property
+	def enabled(self):
+		return self.path is not None
+
+	@staticmethod
+	def key(*parts):
+		'''Key of a stage from its inputs and parameters, anything that can be written as JSON.'''
+		text = json.dumps(parts, sort_keys = True, default = str)
+		return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+	def done(self, stage, key):
+		'''Whether a stage has completed with this key and all of its outputs still exist.'''
+		if not self.enabled:
+			return False
+		entry = self.stages.get(stage)
+		if entry is None or entry['key'] != key:
+			return False
+		return all(self.exists(out) for out in entry['outputs'])
+
+	def record(self, stage, key, outputs):
+		'''Record a completed stage and its outputs, rewriting the manifest.'''
+		if not self.enabled:
+			return
+		self.stages[stage] = {'key': key, 'outputs': list(outputs)}
+		tmp = self.path + '.tmp'
+		with open(tmp, 'w') as fl:
+			json.dump({'stages': self.stages}, fl, indent = 1, sort_keys = True)
+		if os.path.exists(self.path):
+			os.remove(self.path)
+		os.rename(tmp, self.path)
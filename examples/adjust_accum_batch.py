@@ -0,0 +1,12 @@
+import sys
+sys.path.append("..") # change environment to see tools
+from batch import adjust_accum_batch, update_accum_batch
+
+workspace = r"" # path to folder type workspace holding the local folders
+workers = 4 # number of local folders to process at a time
+
+if __name__ == '__main__': # required for worker processes on Windows
+	adjust_accum_batch(workspace, fac = "input_data.gdb/fac", fdr = "input_data.gdb/fdr", workers = workers)
+
+	# after a local folder is hydro-enforced again, pass only the change of its accumulation downstream
+	# update_accum_batch(workspace, "01010002", fac = "input_data.gdb/fac", fdr = "input_data.gdb/fdr")
@@ -8,5 +8,6 @@ facin = r"" # path to the downstream flow accumulation grid
 filin = r"" # path to downstream hydro-enforced DEM
 facout = r"" # path to ouput the downstream corrected flow accumulation grid.
 incrval = # value to correct the downstream grid with.
+incrField = None # field of ptin holding a value for each inlet, to correct for all the inlets at once.
 
-adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval)
\ No newline at end of file
+adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval, incrField = incrField)
\ No newline at end of file
@@ -0,0 +1,11 @@
+import sys
+sys.path.append("..") # change environment to see tools
+from batch import hydrodem_batch
+
+workspace = r"" # path to folder type workspace holding the local folders
+snap_grid = r"" # path to snap grid
+workers = 4 # number of local folders to process at a time
+retries = 1 # number of times to rerun a failed local folder
+
+if __name__ == '__main__': # required for worker processes on Windows
+	hydrodem_batch(workspace, snap_grid, origdem = "dem", bowl_polys = "input_data.gdb/nhd_wbg", bowl_lines = "input_data.gdb/wb_srcg", workers = workers, retries = retries)
@@ -0,0 +1,2546 @@
+'''Array-based engines for hydro-enforcing digital elevation models.
+
+The functions in this module operate on NumPy arrays and do not require ESRI ArcPy, so they can be run on any platform and tested against synthetic DEMs. The ArcPy-aware functions in :mod:`make_hydrodem` move rasters into and out of these engines.
+
+Conventions
+-----------
+- Grids are 2D arrays indexed [row, column] with row 0 at the top (north) of the raster, as returned by ``arcpy.RasterToNumPyArray``.
+- Floating point outputs mark NoData cells with NaN. Integer inputs take an explicit ``nodata`` value.
+- Feature grids (streams, walls, etc.) are boolean arrays that are True where the feature is present.
+'''
+import numpy as np
+from scipy import ndimage
+from concurrent.futures import ThreadPoolExecutor
+from collections import deque, namedtuple
+import heapq
+import hashlib
+import mmap
+import os
+import sys
+
+# ESRI D8 flow direction encoding, E, SE, S, SW, W, NW, N, NE
+D8_CODES = np.array([1, 2, 4, 8, 16, 32, 64, 128], dtype=np.uint8)
+D8_ROWS = np.array([0, 1, 1, 1, 0, -1, -1, -1])
+D8_COLS = np.array([1, 1, 0, -1, -1, -1, 0, 1])
+D8_DIST = np.array([1., np.sqrt(2.), 1., np.sqrt(2.), 1., np.sqrt(2.), 1., np.sqrt(2.)])
+FDR_NODATA = 255 # NoData value of uint8 flow direction grids, 0 marks sinks and drain plugs
+
+_D8_INDEX = np.full(256, -1, dtype=np.int8) # flow direction code to position in D8_CODES
+_D8_INDEX[D8_CODES] = np.arange(8)
+_EDGE_ORDER = [0, 2, 4, 6, 1, 3, 5, 7] # forced edge cells flow outward, cardinal directions first
+
+def iter_tiles(shape, tileSize):
+	'''Iterate over the tiles covering a grid.
+
+	Parameters
+	----------
+	shape : tuple
+		Number of rows and columns in the grid.
+	tileSize : int
+		Number of rows and columns in each tile, tiles on the right and bottom edges may be smaller.
+
+	Returns
+	-------
+	tiles : generator
+		(row start, row end, column start, column end) of each tile.
+	'''
+	nrows, ncols = shape
+	for r0 in range(0, nrows, tileSize):
+		for c0 in range(0, ncols, tileSize):
+			yield r0, min(r0 + tileSize, nrows), c0, min(c0 + tileSize, ncols)
+
+def _window(tile, halo, shape):
+	'''Expand a tile by a halo, clipped to the grid.'''
+	r0, r1, c0, c1 = tile
+	return max(r0 - halo, 0), min(r1 + halo, shape[0]), max(c0 - halo, 0), min(c1 + halo, shape[1])
+
+def _edgeDistance(win, shape):
+	'''Number of cells from each cell in a window to the nearest cell outside the window that is still inside the grid.
+
+	Sides of the window on the grid boundary do not count, so a window covering the whole grid is infinitely far from its edge.
+	'''
+	r0, r1, c0, c1 = win
+	rows = np.arange(r1 - r0, dtype=np.float32)
+	cols = np.arange(c1 - c0, dtype=np.float32)
+	inf = np.float32(np.inf)
+	top = rows + 1 if r0 > 0 else np.full_like(rows, inf)
+	bottom = (r1 - r0) - rows if r1 < shape[0] else np.full_like(rows, inf)
+	left = cols + 1 if c0 > 0 else np.full_like(cols, inf)
+	right = (c1 - c0) - cols if c1 < shape[1] else np.full_like(cols, inf)
+	return np.minimum(np.minimum(top, bottom)[:, None], np.minimum(left, right)[None, :])
+
+class ArrayStore(object):
+	'''Create the intermediate grids of a pipeline in memory or as memory-mapped files.
+
+	With a folder, every array is a memory-mapped ``.npy`` file in that folder, so the operating system pages tiles in and out as they are used and the grids never need to fit in memory. Without one, plain arrays are returned.
+
+	Parameters
+	----------
+	folder : str (optional)
+		Folder to write the memory-mapped arrays to, e.g. the scratch workspace.
+	'''
+
+	def __init__(self, folder = None):
+		self.folder = folder
+		self.paths = {}
+
+	def create(self, name, shape, dtype, fill = None):
+		'''Create an array, filled with fill if given.'''
+		if self.folder is None:
+			arr = np.empty(shape, dtype=dtype)
+		else:
+			path = os.path.join(self.folder, '%s.npy'%name)
+			arr = np.lib.format.open_memmap(path, mode = 'w+', dtype = dtype, shape = shape)
+			self.paths[name] = path
+		if fill is not None:
+			arr[...] = fill
+		return arr
+
+	def delete(self, name):
+		'''Remove the file backing an array, the array must no longer be referenced.'''
+		path = self.paths.pop(name, None)
+		if path is not None and os.path.exists(path):
+			try:
+				os.remove(path)
+			except OSError: # still mapped, e.g. on Windows
+				pass
+
+	def cleanup(self):
+		'''Remove the files backing every array.'''
+		for name in list(self.paths):
+			self.delete(name)
+
+def peak_rss():
+	'''Peak resident set size of this process in bytes, None if it cannot be determined.'''
+	try:
+		import resource
+	except ImportError: # Windows
+		try:
+			import ctypes
+			from ctypes import wintypes
+
+			class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+				_fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD), ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t), ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t), ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+			counters = PROCESS_MEMORY_COUNTERS()
+			counters.cb = ctypes.sizeof(counters)
+			process = ctypes.windll.kernel32.GetCurrentProcess()
+			if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+				return None
+			return int(counters.PeakWorkingSetSize)
+		except (AttributeError, OSError):
+			return None
+
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	if sys.platform == 'darwin': # bytes on macOS, kilobytes elsewhere
+		return int(rss)
+	return int(rss) * 1024
+
+def nearest_source(sources):
+	'''Exact Euclidean distance to, and allocation of, the nearest source cell.
+
+	This computes the equivalent of Spatial Analyst's EucDistance and EucAllocation in a single pass.
+
+	Parameters
+	----------
+	sources : ndarray of bool
+		True at source cells.
+
+	Returns
+	-------
+	dist : ndarray of float32
+		Distance to the nearest source in cells, infinite if there are no sources.
+	rows, cols : ndarray of int32
+		Row and column of the nearest source, None if there are no sources.
+	'''
+	if not sources.any():
+		return np.full(sources.shape, np.inf, dtype=np.float32), None, None
+
+	idx = np.empty((2,) + sources.shape, dtype=np.int32)
+	ndimage.distance_transform_edt(~sources, return_distances=False, return_indices=True, indices=idx)
+
+	dr = idx[0] - np.arange(sources.shape[0], dtype=np.int32)[:, None]
+	dc = idx[1] - np.arange(sources.shape[1], dtype=np.int32)[None, :]
+	dist = np.sqrt((dr * dr + dc * dc).astype(np.float32))
+	return dist, idx[0], idx[1]
+
+def expand(mask, cells, out = None, tileSize = 2048):
+	'''Grow a zone by a number of cells, tile by tile.
+
+	This is the array counterpart of Spatial Analyst's Expand for a single zone.
+
+	Parameters
+	----------
+	mask : ndarray of bool
+		True inside the zone.
+	cells : int
+		Number of cells to grow the zone by, diagonal neighbors count as one cell.
+	out : ndarray of bool (optional)
+		Array, such as a memory-mapped array, to write the expanded zone to.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+
+	Returns
+	-------
+	expanded : ndarray of bool
+		True inside the expanded zone.
+	'''
+	if out is None:
+		out = np.empty(mask.shape, dtype=bool)
+	structure = np.ones((3, 3), dtype=bool)
+	for tile in iter_tiles(mask.shape, tileSize):
+		r0, r1, c0, c1 = tile
+		wr0, wr1, wc0, wc1 = _window(tile, cells, mask.shape)
+		grown = ndimage.binary_dilation(np.asarray(mask[wr0:wr1, wc0:wc1]), structure = structure, iterations = cells) if cells > 0 else np.asarray(mask[wr0:wr1, wc0:wc1])
+		out[r0:r1, c0:c1] = grown[r0 - wr0:r1 - wr0, c0 - wc0:c1 - wc0]
+	return out
+
+def source_distance(sources, region = None, out = None, tileSize = 2048):
+	'''Exact Euclidean distance to the nearest source cell, tile by tile.
+
+	This is the tiled counterpart of the distance from :func:`nearest_source`. Each tile is padded with a halo that is doubled until the distance of every cell in the tile is closer than the edge of the padded window, so the distances are exact without holding the whole grid.
+
+	Parameters
+	----------
+	sources : ndarray of bool
+		True at source cells.
+	region : ndarray of bool (optional)
+		Only compute distances for cells where region is True, other cells are set to infinity.
+	out : ndarray of float32 (optional)
+		Array, such as a memory-mapped array, to write the distances to.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+
+	Returns
+	-------
+	dist : ndarray of float32
+		Distance to the nearest source in cells, infinite if there are no sources.
+	'''
+	shape = sources.shape
+	if out is None:
+		out = np.empty(shape, dtype=np.float32)
+	for tile in iter_tiles(shape, tileSize):
+		r0, r1, c0, c1 = tile
+		need = np.ones((r1 - r0, c1 - c0), dtype=bool) if region is None else np.asarray(region[r0:r1, c0:c1])
+		if not need.any():
+			out[r0:r1, c0:c1] = np.inf
+			continue
+		halo = 16
+		while True:
+			win = _window(tile, halo, shape)
+			wr0, wr1, wc0, wc1 = win
+			dist = nearest_source(np.asarray(sources[wr0:wr1, wc0:wc1]))[0]
+			core = (slice(r0 - wr0, r1 - wr0), slice(c0 - wc0, c1 - wc0))
+			dist = dist[core]
+			if win == (0, shape[0], 0, shape[1]) or np.all(dist[need] <= _edgeDistance(win, shape)[core][need]):
+				break
+			halo *= 2
+		dist[~need] = np.inf
+		out[r0:r1, c0:c1] = dist
+	return out
+
+def region_distance(sources, region, out = None, labels = None, tileSize = 2048, workers = 1):
+	'''Exact Euclidean distance to the nearest source cell, computed only around each connected part of a region.
+
+	This gives the same distances as :func:`source_distance` with a region, but rather than every tile of the grid only windows around the 8-connected components of the region are processed, so the work follows the area of the region, e.g. the waterbodies of a local folder, instead of the whole grid. Each window is the component's bounding box, cut into tiles for large components, padded with a halo that is grown until every cell of the component in it is closer to a source than to the edge of the window. The halo is doubled while no source is in reach and then set to the farthest distance found, which is always wide enough.
+
+	Parameters
+	----------
+	sources : ndarray of bool
+		True at source cells.
+	region : ndarray of bool
+		Only compute distances for cells where region is True, other cells are set to infinity.
+	out : ndarray of float32 (optional)
+		Array, such as a memory-mapped array, to write the distances to.
+	labels : ndarray of int32 (optional)
+		Array, such as a memory-mapped array, to hold the component labels of the region.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+	workers : int (optional)
+		Number of threads processing windows at once, defaults to 1.
+
+	Returns
+	-------
+	dist : ndarray of float32
+		Distance to the nearest source in cells, infinite outside the region or if there are no sources.
+	'''
+	shape = sources.shape
+	if out is None:
+		out = np.empty(shape, dtype=np.float32)
+	for r0, r1, c0, c1 in iter_tiles(shape, tileSize):
+		out[r0:r1, c0:c1] = np.inf
+	labels, boxes = label_components(region, labels, tileSize)
+
+	# one task per component, or per tile of the bounding box of a large component
+	tasks = []
+	for i, (br0, br1, bc0, bc1) in enumerate(boxes.tolist()):
+		for r0, r1, c0, c1 in iter_tiles((br1 - br0, bc1 - bc0), tileSize):
+			tasks.append((i + 1, (br0 + r0, br0 + r1, bc0 + c0, bc0 + c1)))
+
+	def run(task):
+		label, box = task
+		r0, r1, c0, c1 = box
+		need = np.asarray(labels[r0:r1, c0:c1]) == label
+		if not need.any():
+			return
+		halo = 16
+		while True:
+			win = _window(box, halo, shape)
+			wr0, wr1, wc0, wc1 = win
+			dist = nearest_source(np.asarray(sources[wr0:wr1, wc0:wc1]))[0]
+			core = (slice(r0 - wr0, r1 - wr0), slice(c0 - wc0, c1 - wc0))
+			dist = dist[core]
+			if win == (0, shape[0], 0, shape[1]) or np.all(dist[need] <= _edgeDistance(win, shape)[core][need]):
+				break
+			far = dist[need].max()
+			halo = int(np.ceil(far)) + 1 if np.isfinite(far) else halo * 2 # a source this close is inside a halo this wide
+		block = out[r0:r1, c0:c1]
+		block[need] = dist[need] # only this component's cells, windows of other components may overlap
+
+	if workers > 1:
+		with ThreadPoolExecutor(max_workers = workers) as pool:
+			list(pool.map(run, tasks))
+	else:
+		for task in tasks:
+			run(task)
+	return out
+
+def _agree_tile(dem, nodata, stream, tile, agreebuf, agreesmooth, agreesharp, cellsize):
+	'''Run AGREE on one tile, growing the halo until every result in the tile is exact.'''
+	shape = dem.shape
+	tr0, tr1, tc0, tc1 = tile
+	thresh = agreebuf - (cellsize / 2.) # (L180 AGREE.aml)
+	hv = int(np.ceil(agreebuf / float(cellsize))) + 1 # halo needed to know if a cell is inside the buffer
+	hb = hv # halo for the buffer distance, grown if it is too small
+
+	while True:
+		win = _window(tile, hv + hb, shape)
+		wr0, wr1, wc0, wc1 = win
+		w = (slice(wr0, wr1), slice(wc0, wc1))
+		core = (slice(tr0 - wr0, tr1 - wr0), slice(tc0 - wc0, tc1 - wc0))
+
+		demw = np.asarray(dem[w])
+		validw = _validMask(demw, nodata)
+		vectsrc = stream[w] & validw
+
+		# vector distance and allocation (vectdist, vectallo)
+		vectdist, vr, vc = nearest_source(vectsrc)
+		vectdist *= cellsize
+
+		# cells farther than the buffer from the streams are the buffer sources (bufgrid2), only trust cells far enough from the window edge.
+		inner = _window((tr0, tr1, tc0, tc1), hb, shape)
+		ir0, ir1, ic0, ic1 = inner
+		iw = (slice(ir0 - wr0, ir1 - wr0), slice(ic0 - wc0, ic1 - wc0))
+		bufsrc = validw[iw] & (vectdist[iw] > thresh)
+
+		bufdist, br, bc = nearest_source(bufsrc)
+		icore = (slice(tr0 - ir0, tr1 - ir0), slice(tc0 - ic0, tc1 - ic0))
+
+		vd = vectdist[core]
+		inbuf = validw[core] & (vd <= thresh) & ~vectsrc[core] # cells needing the interpolated elevation
+
+		exact = bufdist[icore] <= _edgeDistance(inner, shape)[icore]
+		if np.all(exact[inbuf]) or inner == (0, shape[0], 0, shape[1]):
+			break
+		hb *= 2
+
+	out = np.full((tr1 - tr0, tc1 - tc0), np.nan, dtype=np.float32)
+	d = demw[core]
+	v = validw[core]
+
+	# outside the buffer the smooth elevation is the original elevation
+	out[v] = np.trunc(d[v])
+
+	if vr is not None:
+		# smoothed elevation of the closest stream cell (smogrid / vectallo)
+		va = np.trunc(demw[vr[core], vc[core]].astype(np.float64) + agreesmooth)
+
+		if br is not None:
+			bd = bufdist[icore] * cellsize
+			ba = np.trunc(demw[iw][br[icore], bc[icore]].astype(np.float64))
+			smoelev = va + ((ba - va) / (bd + vd)) * vd # (L196 AGREE.aml)
+			ok = inbuf & np.isfinite(bd)
+			out[ok] = smoelev[ok]
+		else: # no cells outside the buffer, Spatial Analyst returns NoData here.
+			out[inbuf] = np.nan
+
+		# sharp drop/raise on the stream cells
+		onstream = vectsrc[core]
+		out[onstream] = np.trunc(va[onstream] + agreesharp)
+
+	return out
+
+def agree(dem, dendrite, agreebuf, agreesmooth, agreesharp, cellsize, nodata = None, out = None, tileSize = 2048, workers = 1):
+	'''Adjust a DEM to match a vector (AGREE) using arrays.
+
+	This is an array implementation of :func:`make_hydrodem.agree` that does not require ArcPy. The grid is processed in tiles. Each tile is padded with a halo of at least the AGREE buffer so the Euclidean distances and allocations computed in the tile are exact, the halo is grown for any tile where that is not enough.
+
+	Parameters
+	----------
+	dem : ndarray
+		Original DEM.
+	dendrite : ndarray of bool
+		True where the rasterized dendrite is present.
+	agreebuf : float
+		Buffer smoothing distance (same units as horizontal map units).
+	agreesmooth : float
+		Smoothing distance (same units as the vertical map units).
+	agreesharp : float
+		Distance for sharp feature (same units as the vertical map units).
+	cellsize : float
+		Raster cell size (same units as horizontal map units).
+	nodata : float (optional)
+		NoData value of the DEM, NaN is always treated as NoData.
+	out : ndarray (optional)
+		float32 array, such as a memory-mapped array, to write the conditioned elevations to.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+	workers : int (optional)
+		Number of threads processing tiles at once, defaults to 1.
+
+	Returns
+	-------
+	elevgrid : ndarray of float32
+		Conditioned elevation grid, NaN where the DEM is NoData.
+
+	Notes
+	-----
+	Distances are exact, but ties between equidistant source cells may be allocated to a different cell than Spatial Analyst would choose.
+	'''
+	stream = dendrite
+	elevgrid = np.empty(dem.shape, dtype=np.float32) if out is None else out
+
+	def run(tile):
+		r0, r1, c0, c1 = tile
+		elevgrid[r0:r1, c0:c1] = _agree_tile(dem, nodata, stream, tile, agreebuf, agreesmooth, agreesharp, cellsize)
+
+	tiles = list(iter_tiles(dem.shape, tileSize))
+	if workers > 1:
+		with ThreadPoolExecutor(max_workers = workers) as pool:
+			list(pool.map(run, tiles))
+	else:
+		for tile in tiles:
+			run(tile)
+
+	return elevgrid
+
+def enforce(elevgrid, stream, ridge = None, huc = None, outwallht = 0, bowldist = None, bowldepth = 0, inwall = None, inwallht = 0, plugs = None, mask = None, out = None, tileSize = 2048):
+	'''Burn the walls, bowls, inner walls and drain plugs into the AGREE grid in one pass.
+
+	This fuses the walling, bowling, inwalling and drain plug steps of :func:`make_hydrodem.hydrodem` into a single kernel, so each tile is read once and the enforced DEM is written once without any intermediate grids. The arithmetic is done in the same order as the Spatial Analyst chain, so the results match it.
+
+	Parameters
+	----------
+	elevgrid : ndarray of float
+		AGREE grid, NaN where NoData. May be the same array as out to enforce it in place.
+	stream : ndarray of bool
+		True on the rasterized dendrite, where no walls are added.
+	ridge, huc : ndarray of bool (optional)
+		Expanded local division (ridgeEXP) and local division (ridgeNL), the outer wall is the ring in ridge but not in huc.
+	outwallht : float (optional)
+		Outer wall height.
+	bowldist : ndarray of float (optional)
+		Distance to the bowl lines in map units, NaN or infinite outside the bowling areas.
+	bowldepth : float (optional)
+		Bowling depth.
+	inwall : ndarray of bool (optional)
+		True in the inner wall buffer.
+	inwallht : float (optional)
+		Inner wall height.
+	plugs : ndarray of bool or SparseCells (optional)
+		True at drain plugs, which are set to NoData. As :class:`SparseCells` the plugs are set cell by cell.
+	mask : ndarray of bool (optional)
+		Cells outside the mask are set to NoData.
+	out : ndarray of float32 (optional)
+		Array, such as a memory-mapped array, to write the enforced DEM to.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+
+	Returns
+	-------
+	dem_enforced : ndarray of float32
+		Enforced DEM, NaN where NoData.
+	'''
+	if out is None:
+		out = np.empty(elevgrid.shape, dtype=np.float32)
+	for r0, r1, c0, c1 in iter_tiles(elevgrid.shape, tileSize):
+		t = (slice(r0, r1), slice(c0, c1))
+		e = np.array(elevgrid[t], dtype=np.float32)
+		offStream = ~np.asarray(stream[t])
+		if ridge is not None:
+			wall = np.asarray(ridge[t]) & ~np.asarray(huc[t]) & offStream
+			e[wall] += outwallht # (L182 in hydroDEM_work_mod.aml)
+		if bowldist is not None:
+			d = np.asarray(bowldist[t])
+			bowl = np.isfinite(d)
+			e[bowl] -= bowldepth / (d[bowl] + 1) # (L210 in hydroDEM_work_mod.aml)
+		if inwall is not None:
+			e[np.asarray(inwall[t]) & offStream] += inwallht # (L226 in hydroDEM_work_mod.aml)
+		if plugs is not None:
+			e[_plugCells(plugs, r0, r1, c0, c1)] = np.nan # (L242 in hydroDEM_work_mod.aml)
+		if mask is not None:
+			e[~np.asarray(mask[t])] = np.nan
+		out[t] = e
+	return out
+
+def _validMask(arr, nodata):
+	'''Boolean mask of cells holding data.'''
+	if np.issubdtype(arr.dtype, np.floating):
+		valid = ~np.isnan(arr)
+	else:
+		valid = np.ones(arr.shape, dtype=bool)
+	if nodata is not None:
+		valid &= arr != nodata
+	return valid
+
+def _edgeSeeds(valid):
+	'''Boolean mask of the valid cells on the grid edge or next to NoData, where water leaves the grid.'''
+	interior = ndimage.binary_erosion(valid, structure = np.ones((3, 3), dtype=bool), border_value = 0)
+	return valid & ~interior
+
+class _BucketQueue(object):
+	'''Priority queue for integer elevations, cells at one elevation share a bucket so only distinct elevations go through the heap.'''
+
+	def __init__(self):
+		self.buckets = {}
+		self.levels = []
+
+	def push(self, level, cell):
+		bucket = self.buckets.get(level)
+		if bucket is None:
+			self.buckets[level] = [cell]
+			heapq.heappush(self.levels, level)
+		else:
+			bucket.append(cell)
+
+	def pop(self):
+		level = self.levels[0]
+		bucket = self.buckets[level]
+		cell = bucket.pop()
+		if not bucket:
+			del self.buckets[level]
+			heapq.heappop(self.levels)
+		return level, cell
+
+	def __len__(self):
+		return len(self.levels)
+
+class _HeapQueue(object):
+	'''Priority queue for floating point elevations.'''
+
+	def __init__(self):
+		self.heap = []
+
+	def push(self, level, cell):
+		heapq.heappush(self.heap, (level, cell))
+
+	def pop(self):
+		return heapq.heappop(self.heap)
+
+	def __len__(self):
+		return len(self.heap)
+
+def priority_flood_fill(dem, nodata = None, reference = None):
+	'''Fill the depressions in a DEM with a priority-flood.
+
+	This is the array counterpart of Spatial Analyst's Fill with no z limit, using the Priority-Flood algorithm of Barnes and others (2014). Water leaves the grid through the cells on the grid edge or next to NoData cells. Cells raised to a spill elevation are drained through a plain FIFO queue, so only cells on the rim of a depression pass through the priority queue. Integer DEMs use a bucket queue keyed on elevation, floating point DEMs use a binary heap.
+
+	Parameters
+	----------
+	dem : ndarray
+		DEM to be filled, usually the enforced DEM.
+	nodata : float (optional)
+		NoData value of the DEM, NaN is always treated as NoData.
+	reference : ndarray (optional)
+		Grid to report the fill depth against, e.g. the original DEM, instead of the input DEM.
+
+	Returns
+	-------
+	filled : ndarray
+		Filled DEM with the same type as the input, NoData cells are left untouched.
+	depth : ndarray
+		Fill depth, the filled DEM minus the input DEM (or the reference grid if given). NaN where either grid is NoData for floating point depths, 0 for integer depths.
+
+	Notes
+	-----
+	Barnes, R., Lehman, C., and Mulla, D., 2014, Priority-flood: An optimal depression-filling and watershed-labeling algorithm for digital elevation models: Computers & Geosciences, v. 62, p. 117-127.
+	'''
+	nrows, ncols = dem.shape
+	valid = _validMask(dem, nodata)
+
+	# pad by one cell so neighbors never fall off the grid, the padding is closed like NoData
+	width = ncols + 2
+	z = np.zeros((nrows + 2, width), dtype=dem.dtype)
+	z[1:-1, 1:-1] = dem
+	closed = np.ones((nrows + 2, width), dtype=np.uint8)
+	closed[1:-1, 1:-1] = ~valid
+	raised = np.zeros((nrows + 2, width), dtype=bool)
+
+	integer = np.issubdtype(dem.dtype, np.integer)
+	queue = _BucketQueue() if integer else _HeapQueue()
+	pit = deque()
+
+	seeds = np.zeros(closed.shape, dtype=bool)
+	seeds[1:-1, 1:-1] = _edgeSeeds(valid)
+	for cell in np.flatnonzero(seeds).tolist():
+		queue.push(z.flat[cell].item(), cell)
+	closed[seeds] = 1
+
+	# memoryviews on the flat arrays are much faster to index from Python than the arrays themselves
+	zf = memoryview(z.reshape(-1))
+	cf = memoryview(closed.reshape(-1))
+	rf = memoryview(raised.reshape(-1).view(np.uint8))
+	offsets = (-width - 1, -width, -width + 1, -1, 1, width - 1, width, width + 1)
+
+	while pit or queue:
+		if pit:
+			cell = pit.popleft()
+			elev = zf[cell]
+		else:
+			elev, cell = queue.pop()
+
+		for off in offsets:
+			nbr = cell + off
+			if cf[nbr]:
+				continue
+			cf[nbr] = 1
+			nz = zf[nbr]
+			if nz <= elev: # in a depression, raise to the spill elevation
+				if nz < elev:
+					zf[nbr] = elev
+					rf[nbr] = 1
+				pit.append(nbr)
+			else:
+				queue.push(nz, nbr)
+
+	filled = z[1:-1, 1:-1].copy()
+	del z, closed
+
+	if reference is None:
+		depth = np.zeros(dem.shape, dtype=dem.dtype)
+		r = raised[1:-1, 1:-1]
+		depth[r] = filled[r] - dem[r]
+		if not integer:
+			depth[~valid] = np.nan
+	else:
+		depth = filled - reference
+		refValid = _validMask(reference, nodata) & valid
+		if np.issubdtype(depth.dtype, np.floating):
+			depth[~refValid] = np.nan
+		else:
+			depth[~refValid] = 0
+
+	return filled, depth
+
+_UNLABELLED = -1
+_OCEAN = 0 # watershed label of the cells draining off the grid
+
+def _flood_tile(dem, nodata, tile, shape):
+	'''Fill one tile as if its perimeter drained freely, labelling the watershed of every perimeter cell.
+
+	Returns the locally filled tile, the labels, the number of labels and the spill elevations between the watersheds that meet inside the tile.
+	'''
+	r0, r1, c0, c1 = tile
+	win = _window(tile, 1, shape)
+	wr0, wr1, wc0, wc1 = win
+	demw = np.asarray(dem[wr0:wr1, wc0:wc1])
+	validw = _validMask(demw, nodata)
+	core = (slice(r0 - wr0, r1 - wr0), slice(c0 - wc0, c1 - wc0))
+	valid = validw[core]
+	ocean = _edgeSeeds(validw)[core] # on the grid edge or next to NoData, also across the tile edge
+
+	nrows, ncols = valid.shape
+	width = ncols + 2
+	z = np.zeros((nrows + 2, width), dtype=dem.dtype)
+	z[1:-1, 1:-1] = demw[core]
+	labels = np.full((nrows + 2, width), _UNLABELLED - 1, dtype=np.int32) # padding and NoData are never labelled
+	labels[1:-1, 1:-1][valid] = _UNLABELLED
+
+	perimeter = np.zeros(valid.shape, dtype=bool)
+	perimeter[[0, -1], :] = True
+	perimeter[:, [0, -1]] = True
+	seeds = np.zeros(z.shape, dtype=bool)
+	seeds[1:-1, 1:-1] = valid & (perimeter | ocean)
+	labels[1:-1, 1:-1][valid & ocean] = _OCEAN
+
+	queue = _BucketQueue() if np.issubdtype(dem.dtype, np.integer) else _HeapQueue()
+	pit = deque()
+	for cell in np.flatnonzero(seeds).tolist():
+		queue.push(z.flat[cell].item(), cell)
+
+	zf = memoryview(z.reshape(-1))
+	lf = memoryview(labels.reshape(-1))
+	offsets = (-width - 1, -width, -width + 1, -1, 1, width - 1, width, width + 1)
+	nlabels = 1
+	spill = {}
+
+	while pit or queue:
+		if pit:
+			cell = pit.popleft()
+			elev = zf[cell]
+		else:
+			elev, cell = queue.pop()
+		label = lf[cell]
+		if label == _UNLABELLED: # a perimeter cell no other watershed has reached
+			label = nlabels
+			lf[cell] = label
+			nlabels += 1
+
+		for off in offsets:
+			nbr = cell + off
+			nl = lf[nbr]
+			if nl != _UNLABELLED:
+				if nl >= 0 and nl != label: # two watersheds meet, keep the lowest pass between them
+					nz = zf[nbr]
+					key = (label, nl) if label < nl else (nl, label)
+					level = elev if elev > nz else nz
+					if level < spill.get(key, level + 1):
+						spill[key] = level
+				continue
+			lf[nbr] = label
+			nz = zf[nbr]
+			if nz <= elev:
+				if nz < elev:
+					zf[nbr] = elev
+				pit.append(nbr)
+			else:
+				queue.push(nz, nbr)
+
+	return z[1:-1, 1:-1], labels[1:-1, 1:-1], nlabels, spill
+
+def _spill_edges(a, b, level):
+	'''Keep the lowest pass between each pair of watersheds, given as arrays of the two labels (a < b) and the pass elevation.'''
+	if not a.size:
+		return a, b, level
+	order = np.lexsort((level, b, a))
+	a, b, level = a[order], b[order], level[order]
+	first = np.ones(a.size, dtype=bool)
+	first[1:] = (a[1:] != a[:-1]) | (b[1:] != b[:-1])
+	return a[first], b[first], level[first]
+
+def _spill_levels(nlabels, a, b, level):
+	'''Lowest elevation water must rise to in each watershed to reach the ocean label (minimax Dijkstra), over the edges given as arrays.'''
+	# adjacency of both directions in compressed rows, a few bytes per edge
+	src = np.concatenate([a, b])
+	dst = np.concatenate([b, a])
+	lev = np.concatenate([level, level]).astype(np.float64)
+	order = np.argsort(src, kind='mergesort')
+	dst, lev = dst[order], lev[order]
+	start = np.zeros(nlabels + 1, dtype=np.int64)
+	np.cumsum(np.bincount(src, minlength = nlabels), out = start[1:])
+	del src, order
+
+	levels = np.full(nlabels, np.inf)
+	levels[_OCEAN] = -np.inf
+	heap = [(-np.inf, _OCEAN)]
+	done = np.zeros(nlabels, dtype=bool)
+	while heap:
+		lvl, label = heapq.heappop(heap)
+		if done[label]:
+			continue
+		done[label] = True
+		s0, s1 = start[label], start[label + 1]
+		nbrs = dst[s0:s1]
+		nlevels = np.maximum(lev[s0:s1], lvl)
+		better = nlevels < levels[nbrs]
+		for nbr, nlevel in zip(nbrs[better].tolist(), nlevels[better].tolist()):
+			if nlevel < levels[nbr]:
+				levels[nbr] = nlevel
+				heapq.heappush(heap, (nlevel, nbr))
+	return levels
+
+def _shared(arr):
+	'''Description of a memory-mapped array that a worker process can open, None for arrays that are not memory-mapped.'''
+	if arr is None:
+		return None
+	if not isinstance(arr, np.memmap) or not isinstance(arr.base, mmap.mmap) or not arr.flags.c_contiguous:
+		raise ValueError('Worker processes need whole memory-mapped arrays, e.g. from ArrayStore with a folder.')
+	return (arr.filename, arr.dtype.str, arr.shape, arr.offset)
+
+def _attach(spec):
+	'''Open an array described by :func:`_shared` in a worker process, arrays are passed through.'''
+	if isinstance(spec, tuple):
+		filename, dtype, shape, offset = spec
+		return np.memmap(filename, dtype = dtype, mode = 'r+', offset = offset, shape = shape)
+	return spec
+
+def set_worker_executable():
+	'''Point multiprocessing at the Python executable when running inside ArcGIS, whose own executable cannot start worker processes.'''
+	import multiprocessing
+	exe = os.path.basename(sys.executable).lower()
+	if not exe.startswith('python'):
+		for pth in [os.path.join(sys.exec_prefix, 'python.exe'), os.path.join(sys.exec_prefix, 'bin', 'python')]:
+			if os.path.exists(pth):
+				multiprocessing.set_executable(pth)
+				break
+
+def _map(func, tasks, workers):
+	'''Map a function over tasks, in a pool of worker processes if workers > 1.'''
+	if workers > 1 and len(tasks) > 1:
+		from concurrent.futures import ProcessPoolExecutor
+		set_worker_executable()
+		with ProcessPoolExecutor(max_workers = min(workers, len(tasks))) as pool:
+			return list(pool.map(func, tasks))
+	return [func(task) for task in tasks]
+
+def _fill_tile_flood(task):
+	'''First pass of the tiled fill for one tile, writing the locally filled tile and its watershed labels and returning the number of labels and the spill elevations.'''
+	demSpec, outSpec, labelsSpec, nodata, tile = task
+	dem, out, labels = _attach(demSpec), _attach(outSpec), _attach(labelsSpec)
+	r0, r1, c0, c1 = tile
+	filled, lab, n, spill = _flood_tile(dem, nodata, tile, dem.shape)
+	out[r0:r1, c0:c1] = filled
+	labels[r0:r1, c0:c1] = lab
+	pairs = np.array(list(spill.keys()), dtype=np.int64).reshape(-1, 2)
+	return n, (pairs[:, 0], pairs[:, 1], np.array(list(spill.values()), dtype=np.float64))
+
+def _fill_tile_raise(task):
+	'''Last pass of the tiled fill for one tile, raising each cell to the spill elevation of its watershed and writing the depth.
+
+	tileLevels holds the spill elevation of each label of the tile, indexed by the tile's own labels.
+	'''
+	demSpec, outSpec, labelsSpec, depthSpec, referenceSpec, nodata, tile, tileLevels = task
+	dem, out, labels, depth, reference = [_attach(spec) for spec in (demSpec, outSpec, labelsSpec, depthSpec, referenceSpec)]
+	r0, r1, c0, c1 = tile
+	t = (slice(r0, r1), slice(c0, c1))
+	d = np.asarray(dem[t])
+	valid = _validMask(d, nodata)
+	lab = np.asarray(labels[t])
+	filled = np.asarray(out[t]).copy()
+	rise = np.full(filled.shape, -np.inf)
+	rise[valid] = tileLevels[lab[valid]]
+	up = valid & (rise > filled)
+	filled[up] = rise[up].astype(filled.dtype)
+	out[t] = filled
+
+	if reference is None:
+		dep = np.zeros(filled.shape, dtype=depth.dtype)
+		dep[valid] = filled[valid] - d[valid]
+		if not np.issubdtype(dem.dtype, np.integer):
+			dep[~valid] = np.nan
+	else:
+		dep = (filled - np.asarray(reference[t])).astype(depth.dtype)
+		refValid = _validMask(np.asarray(reference[t]), nodata) & valid
+		if np.issubdtype(dep.dtype, np.floating):
+			dep[~refValid] = np.nan
+		else:
+			dep[~refValid] = 0
+	depth[t] = dep
+
+def priority_flood_fill_tiled(dem, nodata = None, reference = None, out = None, depth = None, labels = None, tileSize = 2048, workers = 1):
+	'''Fill the depressions in a DEM one tile at a time.
+
+	This gives the same result as :func:`priority_flood_fill` while holding only one tile of the grids in memory, using the parallel Priority-Flood of Barnes (2016). Each tile is filled as if its perimeter drained freely, and every cell is labelled with the watershed of the perimeter cell (or the grid edge) it drains to. The lowest pass between each pair of neighboring watersheds, inside the tiles and across the tile edges, forms a spill graph that is solved for the elevation each watershed must rise to before it drains off the grid. A final pass raises every cell to at least the elevation of its watershed.
+
+	Besides the tiles, the calling process holds the spill graph as arrays: about 20 bytes for each pair of neighboring watersheds and 16 bytes for each watershed. Only watersheds that reach a tile perimeter are labelled, so this grows with the length of the tile edges (roughly 4 / tileSize labels per cell) rather than with the grid.
+
+	With more than one worker, the first and last passes run in a pool of worker processes. Each worker opens the memory-mapped grids itself and reads and writes only its own tile, so only the spill graph and the rows and columns along the tile edges are handled by the calling process.
+
+	Parameters
+	----------
+	dem : ndarray
+		DEM to be filled, usually the enforced DEM. May be a memory-mapped array.
+	nodata : float (optional)
+		NoData value of the DEM, NaN is always treated as NoData.
+	reference : ndarray (optional)
+		Grid to report the fill depth against, e.g. the original DEM, instead of the input DEM.
+	out : ndarray (optional)
+		Array, such as a memory-mapped array, to write the filled DEM to.
+	depth : ndarray (optional)
+		Array, such as a memory-mapped array, to write the fill depth to.
+	labels : ndarray of int32 (optional)
+		Array, such as a memory-mapped array, to hold the watershed labels between the passes.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+	workers : int (optional)
+		Number of worker processes filling tiles at once, defaults to 1. With more than one worker every grid passed in must be a whole memory-mapped array, e.g. from :class:`ArrayStore` with a folder, and out, depth and labels must be given.
+
+	Returns
+	-------
+	filled : ndarray
+		Filled DEM with the same type as the input, NoData cells are left untouched.
+	depth : ndarray
+		Fill depth as returned by :func:`priority_flood_fill`.
+
+	Notes
+	-----
+	Barnes, R., 2016, Parallel Priority-Flood depression filling for trillion cell digital elevation models on desktops or clusters: Computers & Geosciences, v. 96, p. 56-68.
+	'''
+	shape = dem.shape
+	if out is None:
+		out = np.empty(shape, dtype=dem.dtype)
+	if labels is None:
+		labels = np.empty(shape, dtype=np.int32)
+	if depth is None:
+		depth = np.empty(shape, dtype=dem.dtype if reference is None else np.result_type(dem.dtype, reference.dtype))
+	if workers > 1:
+		demS, outS, labelsS, depthS, referenceS = [_shared(arr) for arr in (dem, out, labels, depth, reference)]
+	else:
+		demS, outS, labelsS, depthS, referenceS = dem, out, labels, depth, reference
+
+	# fill every tile on its own, each tile numbers its own watersheds from 1
+	tiles = list(iter_tiles(shape, tileSize))
+	floods = _map(_fill_tile_flood, [(demS, outS, labelsS, nodata, tile) for tile in tiles], workers)
+
+	# number the watersheds across tiles, label l > 0 of tile t is offsets[t] + l
+	offsets = np.zeros(len(tiles), dtype=np.int64)
+	edges = [] # (a, b, level) arrays, one per tile and per tile edge
+	nlabels = 1
+	for t, (n, (a, b, level)) in enumerate(floods):
+		offset = nlabels - 1
+		offsets[t] = offset
+		edges.append((np.where(a > _OCEAN, a + offset, a), b + offset, level))
+		nlabels += n - 1
+	del floods
+	ntc = (shape[1] + tileSize - 1) // tileSize
+	offsets = offsets.reshape(-1, ntc)
+
+	# passes between watersheds across tile edges, read one row or column pair at a time
+	def link(la, lb, za, zb):
+		ok = (la >= 0) & (lb >= 0) & (la != lb)
+		la, lb = la[ok], lb[ok]
+		edges.append(_spill_edges(np.minimum(la, lb), np.maximum(la, lb), np.maximum(za[ok], zb[ok]).astype(np.float64)))
+
+	def globalLabels(lab, tileOffsets):
+		lab = lab.astype(np.int64)
+		up = lab > _OCEAN
+		lab[up] += tileOffsets[up]
+		return lab
+
+	nrows, ncols = shape
+	colTiles = np.arange(ncols) // tileSize
+	rowTiles = np.arange(nrows) // tileSize
+	for r in range(tileSize, nrows, tileSize):
+		la = globalLabels(np.asarray(labels[r - 1]), offsets[(r - 1) // tileSize, colTiles])
+		lb = globalLabels(np.asarray(labels[r]), offsets[r // tileSize, colTiles])
+		za, zb = np.asarray(out[r - 1]), np.asarray(out[r])
+		link(la, lb, za, zb)
+		link(la[1:], lb[:-1], za[1:], zb[:-1])
+		link(la[:-1], lb[1:], za[:-1], zb[1:])
+	for c in range(tileSize, ncols, tileSize):
+		la = globalLabels(np.asarray(labels[:, c - 1]), offsets[rowTiles, (c - 1) // tileSize])
+		lb = globalLabels(np.asarray(labels[:, c]), offsets[rowTiles, c // tileSize])
+		za, zb = np.asarray(out[:, c - 1]), np.asarray(out[:, c])
+		link(la, lb, za, zb)
+		link(la[1:], lb[:-1], za[1:], zb[:-1])
+		link(la[:-1], lb[1:], za[:-1], zb[1:])
+
+	a, b, level = _spill_edges(*[np.concatenate(e) for e in zip(*edges)])
+	del edges
+	levels = _spill_levels(nlabels, a, b, level)
+	del a, b, level
+
+	# raise each cell to the spill elevation of its watershed and compute the depth
+	offsets = offsets.reshape(-1).tolist()
+	ends = offsets[1:] + [nlabels - 1]
+	tasks = []
+	for tile, offset, end in zip(tiles, offsets, ends):
+		tileLevels = np.concatenate([levels[:1], levels[offset + 1:end + 1]]) # by the tile's own labels
+		tasks.append((demS, outS, labelsS, depthS, referenceS, nodata, tile, tileLevels))
+	_map(_fill_tile_raise, tasks, workers)
+
+	return out, depth
+
+def _find_sorted(cells, idx):
+	'''Position of each index in a sorted array of cells and whether it is there.'''
+	pos = np.searchsorted(cells, idx)
+	pos[pos == cells.size] = 0
+	return pos, cells[pos] == idx if cells.size else np.zeros(idx.shape, dtype=bool)
+
+def _pad_tile(arr, tile, fill, pad = 1):
+	'''Copy of a tile and the cells next to it, padded to pad cells on every side, cells off the grid take the fill value.'''
+	r0, r1, c0, c1 = tile
+	wr0, wr1, wc0, wc1 = _window(tile, 1, arr.shape)
+	out = np.full((r1 - r0 + 2 * pad, c1 - c0 + 2 * pad), fill, dtype=np.result_type(arr.dtype, np.min_scalar_type(fill)))
+	out[wr0 - r0 + pad:wr1 - r0 + pad, wc0 - c0 + pad:wc1 - c0 + pad] = arr[wr0:wr1, wc0:wc1]
+	return out
+
+def _pad_valid(dem, nodata, plugs, tile):
+	'''Elevations of a tile padded by one cell, as float64, and whether they hold data and are not drain plugs.'''
+	r0, r1, c0, c1 = tile
+	wr0, wr1, wc0, wc1 = _window(tile, 1, dem.shape)
+	zw = np.full((r1 - r0 + 2, c1 - c0 + 2), np.nan)
+	vw = np.zeros(zw.shape, dtype=bool)
+	win = (slice(wr0 - r0 + 1, wr1 - r0 + 1), slice(wc0 - c0 + 1, wc1 - c0 + 1))
+	block = np.asarray(dem[wr0:wr1, wc0:wc1])
+	zw[win] = block
+	vw[win] = _validMask(block, nodata)
+	if plugs is not None:
+		pr, pc = _plugCells(plugs, wr0, wr1, wc0, wc1)
+		vw[win][pr, pc] = False
+	return zw, vw
+
+def _shifted(k, nr, nc):
+	'''Slices of a tile padded by one cell that hold the neighbor in direction k of each cell of the tile.'''
+	return (slice(1 + D8_ROWS[k], nr + 1 + D8_ROWS[k]), slice(1 + D8_COLS[k], nc + 1 + D8_COLS[k]))
+
+def _steepest_tile(dem, nodata, plugs, tile):
+	'''D8 steepest descent for one tile, with forced outward flow at the edge seeds.'''
+	r0, r1, c0, c1 = tile
+	nr = r1 - r0
+	nc = c1 - c0
+
+	# pad the tile by one cell so every cell has eight neighbors, cells off the grid are NoData
+	zw, vw = _pad_valid(dem, nodata, plugs, tile)
+	seeds = vw & ~ndimage.binary_erosion(vw, structure = np.ones((3, 3), dtype=bool), border_value = 0)
+	core = (slice(1, nr + 1), slice(1, nc + 1))
+	zc = zw[core]
+
+	best = np.zeros((nr, nc))
+	fdr = np.zeros((nr, nc), dtype=np.uint8)
+	outward = np.zeros((nr, nc), dtype=np.uint8)
+	for k in range(8):
+		sl = _shifted(k, nr, nc)
+		drop = (zc - zw[sl]) / D8_DIST[k]
+		steeper = vw[sl] & (drop > best)
+		best[steeper] = drop[steeper]
+		fdr[steeper] = D8_CODES[k]
+	for k in reversed(_EDGE_ORDER):
+		outward[~vw[_shifted(k, nr, nc)]] = D8_CODES[k]
+
+	s = seeds[core]
+	fdr[s] = outward[s]
+	fdr[~vw[core]] = FDR_NODATA
+	return fdr
+
+def _flat_edges_tile(dem, nodata, plugs, labels, tile):
+	'''Flat cells of a tile next to a cell of the same elevation that drains (low edges) and next to higher terrain (high edges).'''
+	r0, r1, c0, c1 = tile
+	nr = r1 - r0
+	nc = c1 - c0
+	zw, vw = _pad_valid(dem, nodata, plugs, tile)
+	flat = _pad_tile(labels, tile, 0) > 0
+	core = (slice(1, nr + 1), slice(1, nc + 1))
+	zc = zw[core]
+	low = np.zeros((nr, nc), dtype=bool)
+	high = np.zeros((nr, nc), dtype=bool)
+	for k in range(8):
+		sl = _shifted(k, nr, nc)
+		low |= vw[sl] & ~flat[sl] & (zw[sl] == zc)
+		high |= vw[sl] & (zw[sl] > zc)
+	return low & flat[core], high & flat[core]
+
+def _relax_flat_tile(labels, dist, tile):
+	'''Shorten the distances through the flat cells of one tile, starting from the distances already in and around it.
+
+	Distances count 8-connected steps through flat cells, 0 is unreached. The tile is searched breadth first from every cell with a distance, in order of distance, with the cells around the tile as fixed sources. Returns whether a cell on the border of the tile changed, which changes the sources of the tiles around it.
+	'''
+	r0, r1, c0, c1 = tile
+	nr = r1 - r0
+	nc = c1 - c0
+	# pad by two cells so the neighbors of the cells around the tile are in the window too
+	unreached = np.iinfo(np.int64).max
+	flat = _pad_tile(labels, tile, 0, pad = 2) > 0
+	target = np.zeros(flat.shape, dtype=bool)
+	target[2:nr + 2, 2:nc + 2] = flat[2:nr + 2, 2:nc + 2]
+	val = _pad_tile(dist, tile, 0, pad = 2).astype(np.int64)
+	val[~flat | (val == 0)] = unreached # only flat cells hold distances
+	before = val[2:nr + 2, 2:nc + 2].copy()
+	tf = target.reshape(-1)
+	vf = val.reshape(-1)
+	offsets = [D8_ROWS[k] * (nc + 4) + D8_COLS[k] for k in range(8)]
+
+	src = np.flatnonzero(vf < unreached)
+	src = src[np.argsort(vf[src], kind='stable')]
+	srcVal = vf[src]
+	i = 0
+	frontier = src[:0]
+	while frontier.size or i < src.size:
+		if not frontier.size: # jump to the next source
+			cur = srcVal[i]
+		j = np.searchsorted(srcVal, cur, side='right')
+		start = src[i:j]
+		frontier = np.concatenate([frontier, start[vf[start] == cur]]) # sources that a shorter path has not reached
+		i = j
+		found = []
+		for off in offsets:
+			nbr = frontier + off
+			nbr = nbr[tf[nbr] & (vf[nbr] > cur + 1)]
+			vf[nbr] = cur + 1
+			found.append(nbr)
+		frontier = np.unique(np.concatenate(found))
+		cur += 1
+
+	after = val[2:nr + 2, 2:nc + 2]
+	dist[r0:r1, c0:c1] = np.where(after < unreached, after, 0)
+	changed = after != before
+	return bool(changed[0].any() or changed[-1].any() or changed[:, 0].any() or changed[:, -1].any())
+
+def _flat_distances(labels, dist, tiles, tileSize):
+	'''Distances through the flats of a grid from the cells holding a distance, relaxing the tiles until no tile changes the border of another.'''
+	nrows, ncols = labels.shape
+	queue = deque(tiles)
+	queued = set(tiles)
+	flatTiles = set(tiles)
+	while queue:
+		tile = queue.popleft()
+		queued.discard(tile)
+		if not _relax_flat_tile(labels, dist, tile):
+			continue
+		r0, r1, c0, c1 = tile
+		for dr in (-tileSize, 0, tileSize):
+			for dc in (-tileSize, 0, tileSize):
+				if (dr or dc) and 0 <= r0 + dr < nrows and 0 <= c0 + dc < ncols:
+					nbr = (r0 + dr, min(r0 + dr + tileSize, nrows), c0 + dc, min(c0 + dc + tileSize, ncols))
+					if nbr in flatTiles and nbr not in queued:
+						queue.append(nbr)
+						queued.add(nbr)
+
+def _resolve_flats(dem, nodata, plugs, fdr, labels, nflats, distances, tileSize):
+	'''Drain the cells without a downslope neighbor towards lower terrain and away from higher terrain, tile by tile.
+
+	Two breadth-first searches are run through each flat from its edges, one from the cells it drains to and one from the cells next to higher terrain, as in Barnes and others (2014). Each tile is searched on its own from the distances around it, and the tiles whose border changes pass the change on to their neighbors until no distance changes, so only a tile and the cells around it are held in memory. The resulting increments form a surface on each flat that always has a lower neighbor, and the flat cells are given the steepest D8 direction on that surface. Flats that cannot drain are left as sinks (0).
+	'''
+	towards, away = distances[0], distances[1]
+	flatTiles = []
+	for tile in iter_tiles(dem.shape, tileSize):
+		r0, r1, c0, c1 = tile
+		t = (slice(r0, r1), slice(c0, c1))
+		if not (np.asarray(labels[t]) > 0).any():
+			continue
+		flatTiles.append(tile)
+		low, high = _flat_edges_tile(dem, nodata, plugs, labels, tile)
+		towards[t] = low
+		away[t] = high # high edges, kept below only on flats that can drain
+	_flat_distances(labels, towards, flatTiles, tileSize)
+
+	# distances away from higher terrain, the high edges and the cells next to them are 1
+	for r0, r1, c0, c1 in flatTiles:
+		t = (slice(r0, r1), slice(c0, c1))
+		away[t] = np.asarray(away[t]) * (np.asarray(towards[t]) > 0)
+	_flat_distances(labels, away, flatTiles, tileSize)
+	flatHeight = np.zeros(nflats + 1, dtype=np.int64)
+	for r0, r1, c0, c1 in flatTiles:
+		t = (slice(r0, r1), slice(c0, c1))
+		a = np.asarray(away[t])
+		a = np.where(a > 1, a - 1, a)
+		away[t] = a
+		np.maximum.at(flatHeight, np.asarray(labels[t]).reshape(-1), a.reshape(-1))
+
+	# steepest descent on the flat mask surface, the low edges sit at 0
+	for tile in flatTiles:
+		r0, r1, c0, c1 = tile
+		nr = r1 - r0
+		nc = c1 - c0
+		zw, vw = _pad_valid(dem, nodata, plugs, tile)
+		lw = _pad_tile(labels, tile, 0)
+		tw = _pad_tile(towards, tile, 0)
+		aw = _pad_tile(away, tile, 0)
+		mask = np.where(lw > 0, 2 * tw.astype(np.int64) + np.where(aw > 0, flatHeight[lw] - aw, 0), 0)
+		core = (slice(1, nr + 1), slice(1, nc + 1))
+		zc = zw[core]
+		mc = mask[core]
+		best = np.zeros((nr, nc))
+		codes = np.zeros((nr, nc), dtype=np.uint8)
+		for k in range(8):
+			sl = _shifted(k, nr, nc)
+			drop = (mc - mask[sl]) / D8_DIST[k]
+			steeper = vw[sl] & (zw[sl] == zc) & (drop > best)
+			best[steeper] = drop[steeper]
+			codes[steeper] = D8_CODES[k]
+		codes[tw[core] == 0] = 0
+		flat = lw[core] > 0
+		block = np.asarray(fdr[r0:r1, c0:c1])
+		block[flat] = codes[flat]
+		fdr[r0:r1, c0:c1] = block
+
+def flow_direction(dem, nodata = None, plugs = None, out = None, labels = None, distances = None, tileSize = 1024):
+	'''D8 flow direction with resolved flats.
+
+	This is the array counterpart of Spatial Analyst's FlowDirection with the FORCE option. Cells on the grid edge, or next to NoData, flow outward. Every other cell flows to the neighbor with the steepest drop, and cells without a downslope neighbor are drained across their flat with the method of Garbrecht and Martz (1997) as implemented by Barnes and others (2014), which always produces the same result. Drain plug cells are set to 0 as in hydroDEM. Every step works tile by tile: the flats are labelled across the tiles and searched one tile at a time, passing distances across the tile edges, so with memory-mapped labels and distances only a few tiles are held in memory whatever the size of the flats.
+
+	Parameters
+	----------
+	dem : ndarray
+		Filled DEM.
+	nodata : float (optional)
+		NoData value of the DEM, NaN is always treated as NoData.
+	plugs : ndarray of bool or SparseCells (optional)
+		True at drain plug cells. Drain plugs are NoData in the filled DEM, so the cells around them flow into them.
+	out : ndarray (optional)
+		uint8 array, such as a memory-mapped array, to write the flow directions to.
+	labels : ndarray of int32 (optional)
+		Array, such as a memory-mapped array, to hold the flat labels.
+	distances : ndarray of int32 (optional)
+		Array of shape (2, rows, columns), such as a memory-mapped array, to hold the distances through the flats towards lower and away from higher terrain.
+	tileSize : int (optional)
+		Number of rows and columns processed at once, defaults to 1024.
+
+	Returns
+	-------
+	fdr : ndarray of uint8
+		Flow direction coded 1 (E), 2 (SE), 4 (S), 8 (SW), 16 (W), 32 (NW), 64 (N), 128 (NE), with 0 at drain plugs and FDR_NODATA at NoData cells.
+
+	Notes
+	-----
+	Garbrecht, J., and Martz, L.W., 1997, The assignment of drainage direction over flat surfaces in raster digital elevation models: Journal of Hydrology, v. 193, p. 204-213.
+
+	Barnes, R., Lehman, C., and Mulla, D., 2014, An efficient assignment of drainage direction over flat surfaces in raster digital elevation models: Computers & Geosciences, v. 62, p. 128-135.
+	'''
+	fdr = np.empty(dem.shape, dtype=np.uint8) if out is None else out
+	for tile in iter_tiles(dem.shape, tileSize):
+		r0, r1, c0, c1 = tile
+		fdr[r0:r1, c0:c1] = _steepest_tile(dem, nodata, plugs, tile)
+
+	# the cells without a downslope neighbor, labelled as flats across the tiles
+	labels, boxes = _label_components(lambda t: np.asarray(fdr[t]) == 0, dem.shape, labels, tileSize)
+	if boxes.shape[0]:
+		if distances is None:
+			distances = np.zeros((2,) + dem.shape, dtype=np.int32)
+		_resolve_flats(dem, nodata, plugs, fdr, labels, boxes.shape[0], distances, tileSize)
+
+	if isinstance(plugs, SparseCells):
+		fdr.reshape(-1)[plugs.index] = 0
+	elif plugs is not None:
+		for r0, r1, c0, c1 in iter_tiles(dem.shape, tileSize):
+			block = fdr[r0:r1, c0:c1]
+			block[np.asarray(plugs[r0:r1, c0:c1])] = 0
+	return fdr
+
+def fac_nodata(dtype):
+	'''NoData value used for flow accumulation grids of the given type: NaN for floats, -1 for signed integers and the largest value for unsigned integers.'''
+	dtype = np.dtype(dtype)
+	if np.issubdtype(dtype, np.floating):
+		return np.nan
+	if np.issubdtype(dtype, np.signedinteger):
+		return -1
+	return np.iinfo(dtype).max
+
+_DONE = 255 # in-degree of cells that have been passed downstream
+
+def _indegree(fdr, tileSize):
+	'''Number of neighbors flowing into each cell, computed tile by tile into a single one byte grid.'''
+	nrows, ncols = fdr.shape
+	indeg = np.zeros((nrows, ncols), dtype=np.uint8)
+	for r0, r1, c0, c1 in iter_tiles(fdr.shape, tileSize):
+		block = np.asarray(fdr[r0:r1, c0:c1])
+		for k in range(8):
+			dr, dc = D8_ROWS[k], D8_COLS[k]
+			# the part of the block whose neighbor in direction k is on the grid
+			br0, br1 = max(0, -(r0 + dr)), min(r1 - r0, nrows - r0 - dr)
+			bc0, bc1 = max(0, -(c0 + dc)), min(c1 - c0, ncols - c0 - dc)
+			if br0 < br1 and bc0 < bc1:
+				indeg[r0 + br0 + dr:r0 + br1 + dr, c0 + bc0 + dc:c0 + bc1 + dc] += block[br0:br1, bc0:bc1] == D8_CODES[k]
+	return indeg
+
+def _receivers(idx, fdrf, shape):
+	'''Cells that flow into a valid neighbor and that neighbor.'''
+	k = _D8_INDEX[fdrf[idx]]
+	idx = idx[k >= 0]
+	k = k[k >= 0]
+	rows, cols = np.divmod(idx, shape[1])
+	nr = rows + D8_ROWS[k]
+	nc = cols + D8_COLS[k]
+	inside = (nr >= 0) & (nr < shape[0]) & (nc >= 0) & (nc < shape[1])
+	idx = idx[inside]
+	recv = (nr * shape[1] + nc)[inside]
+	ok = fdrf[recv] != FDR_NODATA
+	return idx[ok], recv[ok]
+
+def flow_accumulation(fdr, weights = None, dtype = np.uint32, out = None, inflow = None, tileSize = 1024):
+	'''Accumulate flow down a D8 flow direction grid.
+
+	This is the array counterpart of Spatial Analyst's FlowAccumulation. Every cell holds the number of upstream cells (or the sum of their weights) that flow into it, not counting itself. The in-degree of every cell is counted tile by tile, then cells are visited in topological (Kahn) order: a frontier of cells with no unprocessed upstream neighbors passes its accumulation to its downstream neighbors, and the neighbors whose last upstream cell has been processed form the next frontier. Frontiers are started one tile at a time, so apart from the output only the flow direction and a one byte in-degree per cell of the whole grid are held in memory. :func:`flow_accumulation_tiled` only needs the in-degree of one tile.
+
+	Parameters
+	----------
+	fdr : ndarray of uint8
+		Flow direction grid as returned by :func:`flow_direction`, FDR_NODATA cells are NoData.
+	weights : ndarray (optional)
+		Amount each cell contributes to its downstream neighbors, defaults to 1. NaN weights contribute nothing.
+	dtype : data-type (optional)
+		Type of the accumulation grid, defaults to uint32. Use int64 for grids whose accumulation may exceed 4,294,967,294 or a float type for weighted accumulation.
+	out : ndarray (optional)
+		Array, such as a memory-mapped array, to write the accumulation to. Its type is used instead of dtype.
+	inflow : ndarray (optional)
+		Accumulation entering each cell from outside the grid, e.g. from an upstream grid. It is added to the cell and carried downstream.
+	tileSize : int (optional)
+		Number of rows and columns whose headwater cells are started at once, defaults to 1024.
+
+	Returns
+	-------
+	fac : ndarray
+		Flow accumulation grid, NoData cells hold :func:`fac_nodata` for the type.
+	'''
+	shape = fdr.shape
+	fdrf = fdr.reshape(-1)
+	indeg = _indegree(fdr, tileSize)
+	indegf = indeg.reshape(-1)
+
+	if out is None:
+		out = np.zeros(shape, dtype=dtype)
+	else:
+		out[...] = 0
+	if inflow is not None:
+		out += np.nan_to_num(inflow).astype(out.dtype)
+	accf = out.reshape(-1)
+	if weights is not None:
+		wf = np.nan_to_num(np.asarray(weights).reshape(-1)).astype(out.dtype)
+
+	for r0, r1, c0, c1 in iter_tiles(shape, tileSize):
+		rows, cols = np.nonzero((indeg[r0:r1, c0:c1] == 0) & (fdr[r0:r1, c0:c1] != FDR_NODATA))
+		frontier = (rows + r0) * shape[1] + cols + c0
+		while frontier.size:
+			indegf[frontier] = _DONE # so later tiles do not start these cells again
+			idx, recv = _receivers(frontier, fdrf, shape)
+			if weights is None:
+				np.add.at(accf, recv, accf[idx] + 1)
+			else:
+				np.add.at(accf, recv, accf[idx] + wf[idx])
+			np.subtract.at(indegf, recv, 1)
+			recv = np.unique(recv)
+			frontier = recv[indegf[recv] == 0]
+
+	out[fdr == FDR_NODATA] = fac_nodata(out.dtype)
+	return out
+
+def _tile_exits(fdr, tile, shape):
+	'''Cells of a tile whose flow leaves the tile into a valid cell, and the cells they flow into.'''
+	r0, r1, c0, c1 = tile
+	wr0, wr1, wc0, wc1 = _window(tile, 1, shape)
+	fdrw = np.asarray(fdr[wr0:wr1, wc0:wc1])
+	block = fdrw[r0 - wr0:r1 - wr0, c0 - wc0:c1 - wc0]
+	k = _D8_INDEX[block]
+	rows, cols = np.nonzero(k >= 0)
+	k = k[rows, cols]
+	nr = rows + D8_ROWS[k]
+	nc = cols + D8_COLS[k]
+	leaves = (nr < 0) | (nr >= r1 - r0) | (nc < 0) | (nc >= c1 - c0)
+	rows, cols, nr, nc = rows[leaves], cols[leaves], nr[leaves] + r0, nc[leaves] + c0
+	inside = (nr >= 0) & (nr < shape[0]) & (nc >= 0) & (nc < shape[1])
+	rows, cols, nr, nc = rows[inside], cols[inside], nr[inside], nc[inside]
+	ok = fdrw[nr - wr0, nc - wc0] != FDR_NODATA
+	return (rows[ok] + r0) * shape[1] + cols[ok] + c0, nr[ok] * shape[1] + nc[ok]
+
+def _tile_outlets(block, cells, tile, shape):
+	'''Cell of the tile each of the given cells drains to, following the flow directions with pointer doubling.'''
+	r0, r1, c0, c1 = tile
+	tr, tc = r1 - r0, c1 - c0
+	nxt = np.arange(tr * tc).reshape(tr, tc)
+	k = _D8_INDEX[block]
+	rows, cols = np.nonzero(k >= 0)
+	k = k[rows, cols]
+	nr = rows + D8_ROWS[k]
+	nc = cols + D8_COLS[k]
+	inside = (nr >= 0) & (nr < tr) & (nc >= 0) & (nc < tc)
+	inside[inside] = block[nr[inside], nc[inside]] != FDR_NODATA
+	nxt[rows[inside], cols[inside]] = nr[inside] * tc + nc[inside]
+	nxt = nxt.reshape(-1)
+
+	rows, cols = np.divmod(cells, shape[1])
+	local = (rows - r0) * tc + cols - c0
+	while True:
+		step = nxt[local]
+		if np.array_equal(step, local):
+			break
+		nxt = nxt[nxt] # each pass doubles the distance jumped
+		local = step
+	rows, cols = np.divmod(local, tc)
+	return (rows + r0) * shape[1] + cols + c0
+
+def flow_accumulation_tiled(fdr, weights = None, dtype = np.uint32, out = None, tileSize = 2048):
+	'''Accumulate flow down a D8 flow direction grid one tile at a time.
+
+	This gives the same result as :func:`flow_accumulation` while holding only one tile in memory. Each tile is accumulated on its own and the cells where flow leaves it are linked into a graph: a cell leaving one tile flows into a cell of the next tile, which drains to one of that tile's exits or ends inside it. The flow carried along this graph is solved in topological order, and a second pass accumulates each tile again with the flow entering from its neighbors.
+
+	Parameters
+	----------
+	fdr : ndarray of uint8
+		Flow direction grid as returned by :func:`flow_direction`, may be a memory-mapped array.
+	weights : ndarray (optional)
+		Amount each cell contributes to its downstream neighbors, defaults to 1. NaN weights contribute nothing.
+	dtype : data-type (optional)
+		Type of the accumulation grid, defaults to uint32.
+	out : ndarray (optional)
+		Array, such as a memory-mapped array, to write the accumulation to. Its type is used instead of dtype.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+
+	Returns
+	-------
+	fac : ndarray
+		Flow accumulation grid, NoData cells hold :func:`fac_nodata` for the type.
+	'''
+	shape = fdr.shape
+	if out is None:
+		out = np.empty(shape, dtype=dtype)
+	dtype = out.dtype
+	tiles = list(iter_tiles(shape, tileSize))
+
+	def weight(tile, cells):
+		if weights is None:
+			return np.ones(cells.size, dtype=dtype)
+		rows, cols = np.divmod(cells, shape[1])
+		r0, r1, c0, c1 = tile
+		return np.nan_to_num(np.asarray(weights[r0:r1, c0:c1])[rows - r0, cols - c0]).astype(dtype)
+
+	# local accumulation at the exits and the cell each exit and entry drains to inside its tile
+	exits, recv, base = [], [], []
+	for tile in tiles:
+		r0, r1, c0, c1 = tile
+		e, rc = _tile_exits(fdr, tile, shape)
+		if not e.size:
+			continue
+		block = np.asarray(fdr[r0:r1, c0:c1])
+		local = flow_accumulation(block, None if weights is None else weights[r0:r1, c0:c1], dtype = dtype, tileSize = tileSize)
+		rows, cols = np.divmod(e, shape[1])
+		exits.append(e)
+		recv.append(rc)
+		base.append(local[rows - r0, cols - c0] + weight(tile, e))
+	if exits:
+		exits = np.concatenate(exits)
+		recv = np.concatenate(recv)
+		base = np.concatenate(base)
+	else:
+		exits = recv = np.zeros(0, dtype=np.int64)
+		base = np.zeros(0, dtype=dtype)
+	order = np.argsort(exits)
+	exits, recv, base = exits[order], recv[order], base[order]
+
+	# the exit downstream of each exit, found from the outlet of the cell it flows into
+	down = np.full(exits.size, -1, dtype=np.int64)
+	rows, cols = np.divmod(recv, shape[1])
+	tileOf = (rows // tileSize) * ((shape[1] + tileSize - 1) // tileSize) + cols // tileSize
+	for t in np.unique(tileOf).tolist():
+		tile = tiles[t]
+		r0, r1, c0, c1 = tile
+		sel = np.flatnonzero(tileOf == t)
+		outlet = _tile_outlets(np.asarray(fdr[r0:r1, c0:c1]), recv[sel], tile, shape)
+		pos, hit = _find_sorted(exits, outlet)
+		down[sel[hit]] = pos[hit]
+
+	# carry the flow down the forest of exits in topological order
+	passed = base.copy()
+	indeg = np.bincount(down[down >= 0], minlength = exits.size)
+	frontier = np.flatnonzero(indeg == 0)
+	while frontier.size:
+		frontier = frontier[down[frontier] >= 0]
+		np.add.at(passed, down[frontier], passed[frontier])
+		np.subtract.at(indeg, down[frontier], 1)
+		nxt = np.unique(down[frontier])
+		frontier = nxt[indeg[nxt] == 0]
+
+	# accumulate every tile again with the flow entering it
+	for t, tile in enumerate(tiles):
+		r0, r1, c0, c1 = tile
+		sel = tileOf == t
+		inflow = np.zeros((r1 - r0, c1 - c0), dtype=dtype)
+		np.add.at(inflow, (rows[sel] - r0, cols[sel] - c0), passed[sel])
+		out[r0:r1, c0:c1] = flow_accumulation(np.asarray(fdr[r0:r1, c0:c1]), None if weights is None else weights[r0:r1, c0:c1], dtype = dtype, inflow = inflow, tileSize = tileSize)
+
+	return out
+
+def max_cell(arr, nodata = None, tileSize = 2048):
+	'''Row, column and value of the largest valid cell of a grid, read tile by tile, e.g. the outlet of a flow accumulation grid.
+
+	Parameters
+	----------
+	arr : ndarray
+		Grid, usually a flow accumulation grid, may be memory-mapped.
+	nodata : float (optional)
+		Value marking NoData cells, NaN cells of float grids are always NoData.
+	tileSize : int (optional)
+		Number of rows and columns read at once, defaults to 2048.
+
+	Returns
+	-------
+	cell : tuple
+		(row, column, value), ties go to the first cell in row order within the first tile holding the maximum. None if the grid has no valid cells.
+	'''
+	best = None
+	for r0, r1, c0, c1 in iter_tiles(arr.shape, tileSize):
+		block = np.asarray(arr[r0:r1, c0:c1])
+		valid = _validMask(block, nodata)
+		if not valid.any():
+			continue
+		idx = np.flatnonzero(valid)
+		r, c = divmod(int(idx[np.argmax(block.ravel()[idx])]), c1 - c0)
+		if best is None or block[r, c] > best[2]:
+			best = (r0 + r, c0 + c, block[r, c])
+	return best
+
+def receiving_point(row, col, code, grid):
+	'''Center of the cell that a cell of a grid flows into, found by mapping its flow direction through the D8 offset table.
+
+	Parameters
+	----------
+	row, col : int
+		Cell of the grid, usually its outlet from :func:`max_cell`.
+	code : int
+		ESRI D8 flow direction of the cell.
+	grid : GridSpec
+		Grid holding the cell.
+
+	Returns
+	-------
+	point : tuple
+		(x, y) map coordinates, which may be outside of the grid.
+	'''
+	k = _D8_INDEX[int(code)] if 0 <= int(code) < 256 else -1
+	if k < 0:
+		raise ValueError('%s is not a D8 flow direction.'%code)
+	x = grid.xmin + (col + D8_COLS[k] + 0.5) * grid.cellsize
+	y = grid.ymax - (row + D8_ROWS[k] + 0.5) * grid.cellsize
+	return x, y
+
+def receiving_cell(row, col, code, grid, downGrid):
+	'''Cell of a downstream grid that a cell of an upstream grid flows into, see :func:`receiving_point`.
+
+	Parameters
+	----------
+	row, col : int
+		Cell of the upstream grid, usually its outlet from :func:`max_cell`.
+	code : int
+		ESRI D8 flow direction of the cell.
+	grid : GridSpec
+		Upstream grid.
+	downGrid : GridSpec
+		Downstream grid, with the same cell size and aligned cell edges.
+
+	Returns
+	-------
+	cell : tuple
+		(row, column) in the downstream grid, None if the cell falls outside of it.
+	'''
+	x, y = receiving_point(row, col, code, grid)
+	r = int(np.floor((downGrid.ymax - y) / downGrid.cellsize))
+	c = int(np.floor((x - downGrid.xmin) / downGrid.cellsize))
+	if r < 0 or r >= downGrid.nrows or c < 0 or c >= downGrid.ncols:
+		return None
+	return r, c
+
+def propagate_paths(fdr, starts, values, tileSize = 1024):
+	'''Add values down the flow paths that start at cells of a flow direction grid.
+
+	All the paths are walked together, one step at a time, following the D8 pointers until they leave the grid, reach a sink (code 0) or run into NoData. Walkers that meet on a cell are merged, so a shared stretch of path is walked once. The grid is only read in the tiles the paths cross, so it can be memory-mapped or any object returning blocks when sliced.
+
+	Parameters
+	----------
+	fdr : ndarray
+		ESRI D8 flow direction grid with NoData as FDR_NODATA.
+	starts : list
+		(row, column) of the cell each path starts at, e.g. the inlets from :func:`receiving_cell`.
+	values : list
+		Value added along each path, e.g. the accumulation of the upstream grid.
+	tileSize : int (optional)
+		Number of rows and columns in the tiles read from the grid, defaults to 1024.
+
+	Returns
+	-------
+	cells : ndarray
+		Sorted flat indices of the cells on any path.
+	totals : ndarray
+		Sum of the values of the paths through each cell.
+	'''
+	nrows, ncols = fdr.shape
+	ntc = (ncols + tileSize - 1) // tileSize
+	tiles = {}
+
+	def codes(idx):
+		rows, cols = np.divmod(idx, ncols)
+		key = (rows // tileSize) * ntc + cols // tileSize
+		out = np.empty(len(idx), dtype=np.uint8)
+		for t in np.unique(key):
+			r0, c0 = (t // ntc) * tileSize, (t % ntc) * tileSize
+			if t not in tiles:
+				tiles[t] = np.asarray(fdr[r0:min(r0 + tileSize, nrows), c0:min(c0 + tileSize, ncols)])
+			sel = key == t
+			out[sel] = tiles[t][rows[sel] - r0, cols[sel] - c0]
+		return out
+
+	starts = np.asarray(starts, dtype=np.int64).reshape(-1, 2)
+	values = np.asarray(values)
+	inside = (starts[:, 0] >= 0) & (starts[:, 0] < nrows) & (starts[:, 1] >= 0) & (starts[:, 1] < ncols)
+	pos = starts[inside, 0] * ncols + starts[inside, 1]
+	vals = values[inside]
+
+	visited = []
+	steps = 0
+	while len(pos):
+		pos, inv = np.unique(pos, return_inverse = True) # merge the walkers that meet
+		merged = np.zeros(len(pos), dtype=values.dtype)
+		np.add.at(merged, inv.ravel(), vals)
+		code = codes(pos)
+		keep = code != FDR_NODATA
+		pos, vals, code = pos[keep], merged[keep], code[keep]
+		visited.append((pos, vals))
+
+		k = _D8_INDEX[code]
+		rows, cols = np.divmod(pos[k >= 0], ncols)
+		vals = vals[k >= 0]
+		k = k[k >= 0]
+		nr = rows + D8_ROWS[k]
+		nc = cols + D8_COLS[k]
+		inside = (nr >= 0) & (nr < nrows) & (nc >= 0) & (nc < ncols)
+		pos = (nr * ncols + nc)[inside]
+		vals = vals[inside]
+
+		steps += 1
+		if steps > nrows * ncols:
+			raise ValueError('The flow directions form a loop.')
+
+	if not visited:
+		return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=values.dtype)
+	cells, inv = np.unique(np.concatenate([v[0] for v in visited]), return_inverse = True)
+	totals = np.zeros(len(cells), dtype=values.dtype)
+	np.add.at(totals, inv.ravel(), np.concatenate([v[1] for v in visited]))
+	return cells, totals
+
+ACCUMULATION_SCALES = {'scaled': 1000., 'log': 1e8} # default scales of the compact accumulation encodings
+
+def encode_accumulation(values, encoding, scale = None):
+	'''Encode accumulation values as uint32 for grids whose true values do not fit, e.g. the global accumulation of a large river.
+
+	Parameters
+	----------
+	values : ndarray
+		Accumulation values, NaN for NoData.
+	encoding : str
+		'scaled' stores floor(value / scale), 'log' stores round(scale * log(1 + value)).
+	scale : float (optional)
+		Scale of the encoding, defaults to ACCUMULATION_SCALES[encoding].
+
+	Returns
+	-------
+	codes : ndarray
+		uint32 codes, with the largest uint32 for NoData (see :func:`fac_nodata`). Codes are clipped below it and keep the order of the values, so a threshold can be applied to the codes after encoding it the same way.
+	'''
+	scale = ACCUMULATION_SCALES[encoding] if scale is None else float(scale)
+	values = np.asarray(values, dtype=np.float64)
+	if encoding == 'scaled':
+		codes = np.floor(values / scale)
+	elif encoding == 'log':
+		codes = np.round(np.log1p(np.maximum(values, 0)) * scale)
+	else:
+		raise ValueError('Unknown accumulation encoding %s.'%encoding)
+	nodata = fac_nodata(np.uint32)
+	out = np.full(values.shape, nodata, dtype=np.uint32)
+	valid = ~np.isnan(codes)
+	out[valid] = np.clip(codes[valid], 0, nodata - 1)
+	return out
+
+def decode_accumulation(codes, encoding, scale = None):
+	'''Decode uint32 codes from :func:`encode_accumulation` to float64 accumulation values, NaN for NoData. Codes are returned as is without an encoding.'''
+	codes = np.asarray(codes)
+	if encoding is None:
+		return codes
+	scale = ACCUMULATION_SCALES[encoding] if scale is None else float(scale)
+	values = codes.astype(np.float64)
+	if encoding == 'scaled':
+		values *= scale
+	elif encoding == 'log':
+		values = np.expm1(values / scale)
+	else:
+		raise ValueError('Unknown accumulation encoding %s.'%encoding)
+	values[codes == fac_nodata(np.uint32)] = np.nan
+	return values
+
+def save_accumulation(path, cells, values, shape, encoding = None, scale = None):
+	'''Save the cells of an accumulation grid whose values were raised, e.g. by :func:`propagate_paths`, with their true 64 bit values.
+
+	Only the raised cells are stored, so the true values of a global accumulation grid cost a few bytes per cell on the paths rather than a second full grid.
+
+	Parameters
+	----------
+	path : str
+		Path of the ``.npz`` file.
+	cells : ndarray
+		Flat indices of the cells.
+	values : ndarray
+		True values of the cells, stored as int64 or float64.
+	shape : tuple
+		Number of rows and columns in the grid.
+	encoding : str (optional)
+		Encoding of the grid the cells belong to, see :func:`encode_accumulation`, None if the grid holds the values as is (clipped to its type).
+	scale : float (optional)
+		Scale of the encoding.
+	'''
+	values = np.asarray(values)
+	values = values.astype(np.float64 if np.issubdtype(values.dtype, np.floating) else np.int64)
+	np.savez(path, cells = np.asarray(cells, dtype=np.int64), values = values, shape = np.asarray(shape, dtype=np.int64), encoding = np.array('' if encoding is None else encoding), scale = np.array(np.nan if scale is None else scale))
+
+def load_accumulation(path):
+	'''Load the cells saved by :func:`save_accumulation`.
+
+	Returns
+	-------
+	accumulation : dict
+		cells, values, shape, encoding and scale.
+	'''
+	with np.load(path) as data:
+		encoding = str(data['encoding']) or None
+		scale = float(data['scale'])
+		return {'cells': data['cells'], 'values': data['values'], 'shape': tuple(int(n) for n in data['shape']), 'encoding': encoding, 'scale': None if np.isnan(scale) else scale}
+
+def accumulation_values(accumulation, cells, gridValues):
+	'''True values of cells of an accumulation grid: their saved values for the raised cells, else the values read from the grid, decoded.
+
+	Parameters
+	----------
+	accumulation : dict
+		Cells from :func:`load_accumulation`.
+	cells : ndarray
+		Flat indices of the cells.
+	gridValues : ndarray
+		Values of the cells read from the grid.
+
+	Returns
+	-------
+	values : ndarray
+		int64 values, or float64 for float grids and encoded grids.
+	'''
+	cells = np.asarray(cells, dtype=np.int64)
+	values = np.asarray(decode_accumulation(np.asarray(gridValues), accumulation['encoding'], accumulation['scale']))
+	wide = np.float64 if np.issubdtype(values.dtype, np.floating) or np.issubdtype(accumulation['values'].dtype, np.floating) else np.int64
+	values = values.astype(wide)
+	saved = accumulation['cells']
+	i = np.minimum(np.searchsorted(saved, cells), max(len(saved) - 1, 0))
+	found = (saved[i] == cells) if len(saved) else np.zeros(len(cells), dtype=bool)
+	values[found] = accumulation['values'][i[found]]
+	return values
+
+def merge_accumulation(accumulation, cells, values):
+	'''Saved cells of an accumulation grid with some cells added or replaced, as (cells, values) sorted by cell.'''
+	allCells = np.concatenate([accumulation['cells'], np.asarray(cells, dtype=np.int64)])
+	allValues = np.concatenate([accumulation['values'], np.asarray(values)])
+	merged, first = np.unique(allCells[::-1], return_index = True) # the new values come last, so first in reverse
+	return merged, allValues[::-1][first]
+
+def stream_links(cells, codes, shape):
+	'''Number the links of a stream network given as sparse cells, like ESRI StreamLink.
+
+	A link starts at a channel head, a stream cell no other stream cell flows into, or at a junction, a stream cell two or more stream cells flow into, and runs down the flow directions to the next junction or to where the stream leaves the grid. Links are numbered from 1 in row order of their first cell.
+
+	Parameters
+	----------
+	cells : ndarray
+		Sorted flat indices of the stream cells.
+	codes : ndarray
+		ESRI D8 flow direction of each stream cell.
+	shape : tuple
+		Number of rows and columns in the grid.
+
+	Returns
+	-------
+	links : ndarray
+		int32 link number of each stream cell.
+	'''
+	cells = np.asarray(cells, dtype=np.int64)
+	n = len(cells)
+	nrows, ncols = shape
+
+	# the stream cell each stream cell flows into, -1 if it flows off the stream
+	k = _D8_INDEX[np.asarray(codes, dtype=np.uint8)]
+	rows, cols = np.divmod(cells, ncols)
+	nr = rows + np.where(k >= 0, D8_ROWS[k], 0)
+	nc = cols + np.where(k >= 0, D8_COLS[k], 0)
+	inside = (k >= 0) & (nr >= 0) & (nr < nrows) & (nc >= 0) & (nc < ncols)
+	recv = np.full(n, -1, dtype=np.int64)
+	if n:
+		pos = np.minimum(np.searchsorted(cells, nr * ncols + nc), n - 1)
+		onStream = inside & (cells[pos] == nr * ncols + nc)
+		recv[onStream] = pos[onStream]
+
+	indeg = np.bincount(recv[recv >= 0], minlength = n)
+	start = indeg != 1
+	links = np.zeros(n, dtype=np.int32)
+	links[start] = np.arange(1, start.sum() + 1)
+
+	# carry each link number down to the next start, every other cell has exactly one stream cell flowing into it
+	frontier = np.flatnonzero(start)
+	while len(frontier):
+		frontier = frontier[recv[frontier] >= 0]
+		nxt = recv[frontier]
+		keep = ~start[nxt]
+		links[nxt[keep]] = links[frontier[keep]]
+		frontier = nxt[keep]
+	return links
+
+def _flood_upstream(fdr, labels, seeds):
+	'''Label the cells upstream of the seed cells of a grid with the label of the seed they drain to, breadth first over the inverted flow directions. Labelled cells are not entered, so a seed stops the flood of the seeds below it.'''
+	shape = fdr.shape
+	fdrf = fdr.reshape(-1)
+	labelsf = labels.reshape(-1)
+	ncells = fdrf.size
+	itype = np.int32 if ncells < 2**31 else np.int64
+
+	# invert the pointers: the donors of each cell are donors[offsets[c]:offsets[c + 1]]
+	idx, recv = _receivers(np.flatnonzero(fdrf != FDR_NODATA), fdrf, shape)
+	order = np.argsort(recv, kind='mergesort')
+	donors = idx[order].astype(itype)
+	offsets = np.zeros(ncells + 1, dtype=np.int64)
+	np.cumsum(np.bincount(recv, minlength = ncells), out = offsets[1:])
+	del idx, recv, order
+
+	frontier = np.asarray(seeds, dtype=np.int64)
+	while frontier.size:
+		counts = offsets[frontier + 1] - offsets[frontier]
+		total = int(counts.sum())
+		if not total:
+			break
+		first = np.repeat(offsets[frontier] - (np.cumsum(counts) - counts), counts)
+		up = donors[first + np.arange(total)]
+		lab = np.repeat(labelsf[frontier], counts)
+		free = labelsf[up] == 0
+		up = up[free]
+		labelsf[up] = lab[free]
+		frontier = up.astype(np.int64)
+	return labels
+
+def catchment_grid(fdr, lnk, out = None, tileSize = 2048):
+	'''Label every cell with the link of the first stream cell downstream of it, like ArcHydro's Catchment Grid Delineation.
+
+	The flow directions are inverted into lists of the cells draining into each cell and the links are flooded upstream, breadth first from all of the link cells at once. Each tile is flooded on its own, then the cells where flow leaves a tile without reaching a link are linked to the tile they flow into, as in :func:`flow_accumulation_tiled`, and their labels are flooded upstream in a second pass over those tiles.
+
+	Parameters
+	----------
+	fdr : ndarray of uint8
+		Flow direction grid, FDR_NODATA cells are NoData, may be memory-mapped.
+	lnk : ndarray
+		Stream link grid, such as the one from :func:`stream_links`, 0 or less off the streams, may be memory-mapped.
+	out : ndarray (optional)
+		int32 array, such as a memory-mapped array, to write the catchments to.
+	tileSize : int (optional)
+		Number of rows and columns flooded together, defaults to 2048.
+
+	Returns
+	-------
+	cat : ndarray
+		int32 catchment grid, 0 for cells that do not drain to a stream and for NoData.
+	'''
+	shape = fdr.shape
+	if out is None:
+		out = np.zeros(shape, dtype=np.int32)
+	tiles = list(iter_tiles(shape, tileSize))
+
+	# flood each tile from its own link cells
+	exits, recv = [], []
+	for tile in tiles:
+		r0, r1, c0, c1 = tile
+		block = np.asarray(fdr[r0:r1, c0:c1])
+		labels = np.maximum(np.asarray(lnk[r0:r1, c0:c1]), 0).astype(np.int32)
+		labels[block == FDR_NODATA] = 0
+		out[r0:r1, c0:c1] = _flood_upstream(block, labels, np.flatnonzero(labels))
+		e, rc = _tile_exits(fdr, tile, shape)
+		exits.append(e)
+		recv.append(rc)
+	exits = np.concatenate(exits)
+	recv = np.concatenate(recv)
+	if not exits.size:
+		return out
+	order = np.argsort(exits)
+	exits, recv = exits[order], recv[order]
+
+	# the label each exit gets from the tile it flows into, or the exit it leaves that tile by
+	rows, cols = np.divmod(recv, shape[1])
+	label = np.asarray(out[rows, cols]).astype(np.int32)
+	down = np.full(exits.size, -1, dtype=np.int64)
+	tileOf = (rows // tileSize) * ((shape[1] + tileSize - 1) // tileSize) + cols // tileSize
+	for t in np.unique(tileOf[label == 0]).tolist():
+		r0, r1, c0, c1 = tiles[t]
+		sel = np.flatnonzero((tileOf == t) & (label == 0))
+		outlet = _tile_outlets(np.asarray(fdr[r0:r1, c0:c1]), recv[sel], tiles[t], shape)
+		pos, hit = _find_sorted(exits, outlet)
+		down[sel[hit]] = pos[hit]
+
+	# follow the exits down to the first one with a label, with pointer doubling
+	erows, ecols = np.divmod(exits, shape[1])
+	own = np.asarray(out[erows, ecols])
+	label[own > 0] = own[own > 0] # a link cell keeps its own link
+	root = np.where((label == 0) & (down >= 0), down, np.arange(exits.size))
+	while True:
+		nxt = root[root]
+		if np.array_equal(nxt, root):
+			break
+		root = nxt
+	label = label[root]
+
+	# flood the tiles again from the exits that only got a label from downstream
+	seed = (own == 0) & (label > 0)
+	tileOf = (erows // tileSize) * ((shape[1] + tileSize - 1) // tileSize) + ecols // tileSize
+	for t in np.unique(tileOf[seed]).tolist():
+		r0, r1, c0, c1 = tiles[t]
+		sel = seed & (tileOf == t)
+		labels = np.asarray(out[r0:r1, c0:c1]).copy()
+		labels[erows[sel] - r0, ecols[sel] - c0] = label[sel]
+		seeds = (erows[sel] - r0) * (c1 - c0) + ecols[sel] - c0
+		out[r0:r1, c0:c1] = _flood_upstream(np.asarray(fdr[r0:r1, c0:c1]), labels, seeds)
+	return out
+
+def catchment_outlets(fac, cat, nodata = None, tileSize = 2048):
+	'''Cell of greatest flow accumulation in each catchment, like ArcHydro's Drainage Point Processing.
+
+	Both grids are read one tile at a time. The largest cell of each catchment in a tile is found with one sort of the tile, grouped by catchment, and merged into a running maximum and its location kept in flat arrays indexed by catchment, so the cost does not depend on the number of catchments.
+
+	Parameters
+	----------
+	fac : ndarray
+		Flow accumulation grid, may be memory-mapped.
+	cat : ndarray
+		Catchment grid, such as the one from :func:`catchment_grid`, 0 or less outside of the catchments, may be memory-mapped.
+	nodata : float (optional)
+		Value marking NoData cells of the flow accumulation grid, NaN cells of float grids are always NoData.
+	tileSize : int (optional)
+		Number of rows and columns read at once, defaults to 2048.
+
+	Returns
+	-------
+	outlets : ndarray
+		Structured array with the catchment id, row, col and value of its largest cell, ordered by catchment. Ties go to the first cell in row order within the first tile holding the maximum.
+	'''
+	ncols = fac.shape[1]
+	best = np.full(0, -np.inf)
+	cell = np.full(0, -1, dtype=np.int64)
+	for r0, r1, c0, c1 in iter_tiles(fac.shape, tileSize):
+		block = np.asarray(fac[r0:r1, c0:c1])
+		ids = np.asarray(cat[r0:r1, c0:c1]).astype(np.int64)
+		idx = np.flatnonzero((ids > 0) & _validMask(block, nodata))
+		if not idx.size:
+			continue
+		ids = ids.ravel()[idx]
+		values = block.ravel()[idx].astype(np.float64)
+
+		# largest cell of each catchment in the tile, the last of its group
+		order = np.lexsort((-idx, values, ids))
+		last = np.flatnonzero(np.diff(ids[order], append = -1) != 0)
+		ids, values, idx = ids[order[last]], values[order[last]], idx[order[last]]
+
+		if ids[-1] >= best.size:
+			grow = int(ids[-1]) + 1 - best.size
+			best = np.concatenate([best, np.full(grow, -np.inf)])
+			cell = np.concatenate([cell, np.full(grow, -1, dtype=np.int64)])
+		better = values > best[ids]
+		ids, idx = ids[better], idx[better]
+		best[ids] = values[better]
+		br, bc = np.divmod(idx, c1 - c0)
+		cell[ids] = (br + r0) * ncols + bc + c0
+
+	ids = np.flatnonzero(cell >= 0)
+	outlets = np.zeros(ids.size, dtype = [('id', np.int32), ('row', np.int32), ('col', np.int32), ('value', np.float64)])
+	outlets['id'] = ids
+	outlets['row'], outlets['col'] = np.divmod(cell[ids], ncols)
+	outlets['value'] = best[ids]
+	return outlets
+
+_CONNECT8 = np.ones((3, 3), dtype=bool)
+
+SINK_FIELDS = [('id', np.int32), ('cells', np.int64), ('row_min', np.int32), ('row_max', np.int32), ('col_min', np.int32), ('col_max', np.int32), ('max_depth', np.float64), ('volume', np.float64), ('spill_row', np.int32), ('spill_col', np.int32)]
+
+def _find_root(parent, x):
+	'''Root of x in a union-find forest, halving the path on the way.'''
+	while parent[x] != x:
+		parent[x] = parent[parent[x]]
+		x = parent[x]
+	return x
+
+def _label_components(inside, shape, labels = None, tileSize = 2048):
+	'''Label the 8-connected components of a grid tile by tile, merging the labels that meet across tile edges with a union-find.
+
+	inside(t) returns the boolean block of the grid for the tile slices t. Returns the labels, numbered from 1, and the bounding box of each component as (row start, row end, column start, column end) rows of an array, ends exclusive.
+	'''
+	if labels is None:
+		labels = np.zeros(shape, dtype=np.int32)
+	tiles = list(iter_tiles(shape, tileSize))
+
+	# label each tile on its own, provisional labels are numbered across tiles
+	nprov = 0
+	for r0, r1, c0, c1 in tiles:
+		t = (slice(r0, r1), slice(c0, c1))
+		block = inside(t)
+		lab, n = ndimage.label(block, structure = _CONNECT8)
+		lab[block] += nprov
+		labels[t] = lab
+		nprov += n
+
+	# merge the labels that meet across tile edges
+	parent = list(range(nprov + 1))
+
+	def union(la, lb):
+		ok = (la > 0) & (lb > 0) & (la != lb)
+		if ok.any():
+			pairs = np.unique(np.column_stack([la[ok], lb[ok]]), axis = 0)
+			for a, b in pairs.tolist():
+				ra, rb = _find_root(parent, a), _find_root(parent, b)
+				if ra != rb:
+					parent[max(ra, rb)] = min(ra, rb)
+
+	nrows, ncols = shape
+	for r in range(tileSize, nrows, tileSize):
+		la, lb = np.asarray(labels[r - 1]), np.asarray(labels[r])
+		union(la, lb)
+		union(la[1:], lb[:-1])
+		union(la[:-1], lb[1:])
+	for c in range(tileSize, ncols, tileSize):
+		la, lb = np.asarray(labels[:, c - 1]), np.asarray(labels[:, c])
+		union(la, lb)
+		union(la[1:], lb[:-1])
+		union(la[:-1], lb[1:])
+
+	roots = np.array([_find_root(parent, x) for x in range(nprov + 1)], dtype=np.int64)
+	del parent
+	uniq = np.unique(roots[1:])
+	lookup = (np.searchsorted(uniq, roots) + 1).astype(np.int32) # provisional label to component
+	lookup[0] = 0
+
+	# number the components and find their bounding boxes
+	big = np.iinfo(np.int64).max
+	boxes = np.zeros((uniq.size + 1, 4), dtype=np.int64)
+	boxes[:, 0] = boxes[:, 2] = big
+	for r0, r1, c0, c1 in tiles:
+		t = (slice(r0, r1), slice(c0, c1))
+		lab = lookup[np.asarray(labels[t])]
+		labels[t] = lab
+		rows, cols = np.nonzero(lab)
+		if not rows.size:
+			continue
+		ids, inv = np.unique(lab[rows, cols], return_inverse = True)
+		inv = inv.reshape(-1) + 1
+		index = np.arange(1, ids.size + 1)
+		boxes[ids, 0] = np.minimum(boxes[ids, 0], ndimage.minimum(rows, inv, index) + r0)
+		boxes[ids, 1] = np.maximum(boxes[ids, 1], ndimage.maximum(rows, inv, index) + r0 + 1)
+		boxes[ids, 2] = np.minimum(boxes[ids, 2], ndimage.minimum(cols, inv, index) + c0)
+		boxes[ids, 3] = np.maximum(boxes[ids, 3], ndimage.maximum(cols, inv, index) + c0 + 1)
+	return labels, boxes[1:]
+
+def label_components(mask, labels = None, tileSize = 2048):
+	'''Label the 8-connected components of a boolean grid, tile by tile.
+
+	Parameters
+	----------
+	mask : ndarray of bool
+		True in the components. May be a memory-mapped array.
+	labels : ndarray of int32 (optional)
+		Array, such as a memory-mapped array, to write the labels to.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+
+	Returns
+	-------
+	labels : ndarray of int32
+		Component of each cell numbered from 1, 0 outside the mask.
+	boxes : ndarray of int64
+		Bounding box of component i + 1 in row i, as (row start, row end, column start, column end) with exclusive ends like a tile.
+	'''
+	return _label_components(lambda t: np.asarray(mask[t]).astype(bool), mask.shape, labels, tileSize)
+
+def sink_table(depth, filled = None, threshold = 1, mask = None, cellArea = 1., labels = None, basins = None, tileSize = 2048):
+	'''Label the sinks of a filled DEM and summarize each one, without vectorizing them.
+
+	Sinks are the 8-connected groups of cells filled deeper than a threshold. Each tile is labelled on its own and the labels that meet across tile edges are merged with a union-find, so the whole grid never has to be in memory. Polygons can then be traced for the sinks that are needed with :func:`sink_polygons`.
+
+	Parameters
+	----------
+	depth : ndarray
+		Fill depth, e.g. from :func:`priority_flood_fill`. May be a memory-mapped array.
+	filled : ndarray (optional)
+		Filled DEM, used to find the spill cell of each sink.
+	threshold : float (optional)
+		Cells filled deeper than this are in a sink, defaults to 1.
+	mask : ndarray of bool (optional)
+		Only cells where mask is True can be in a sink, e.g. the local division.
+	cellArea : float (optional)
+		Area of a cell, the volume of a sink is the sum of its depths times the cell area. Defaults to 1.
+	labels : ndarray of int32 (optional)
+		Array, such as a memory-mapped array, to write the sink id of each cell to.
+	basins : ndarray of int32 (optional)
+		Array, such as a memory-mapped array, to hold the labels of the filled depressions while the spill cells are found.
+	tileSize : int (optional)
+		Number of rows and columns processed together, defaults to 2048.
+
+	Returns
+	-------
+	table : ndarray
+		Structured array with one row per sink and the fields in :data:`SINK_FIELDS`: id, number of cells, bounding rows and columns (inclusive), maximum depth, volume, and the row and column of the spill cell. The spill cell is where water leaves the sink once it is full: the cell at the fill level, next to the filled depression holding the sink, that drains to the lowest neighbor. It is -1 without a filled DEM.
+	labels : ndarray of int32
+		Sink id of each cell, 0 outside the sinks.
+	'''
+	shape = depth.shape
+	tiles = list(iter_tiles(shape, tileSize))
+
+	def inside(t):
+		inSink = np.asarray(depth[t]) > threshold # NaN is never in a sink
+		if mask is not None:
+			inSink &= np.asarray(mask[t])
+		return inSink
+
+	labels, boxes = _label_components(inside, shape, labels, tileSize)
+	nsinks = len(boxes)
+	ncols = shape[1]
+
+	table = np.zeros(nsinks + 1, dtype=SINK_FIELDS) # row 0 is a placeholder for the cells outside the sinks
+	table['id'] = np.arange(nsinks + 1)
+	table['row_min'][1:], table['col_min'][1:] = boxes[:, 0], boxes[:, 2]
+	table['row_max'][1:], table['col_max'][1:] = boxes[:, 1] - 1, boxes[:, 3] - 1
+	table['max_depth'] = -np.inf
+	table['spill_row'] = table['spill_col'] = -1
+
+	# gather the statistics of each sink
+	for r0, r1, c0, c1 in tiles:
+		t = (slice(r0, r1), slice(c0, c1))
+		lab = np.asarray(labels[t])
+		rows, cols = np.nonzero(lab)
+		if not rows.size:
+			continue
+		ids, inv = np.unique(lab[rows, cols], return_inverse = True)
+		inv = inv.reshape(-1)
+		d = np.asarray(depth[t])[rows, cols].astype(np.float64)
+		table['cells'][ids] += np.bincount(inv, minlength = ids.size)
+		table['volume'][ids] += np.bincount(inv, weights = d, minlength = ids.size) * cellArea
+		table['max_depth'][ids] = np.maximum(table['max_depth'][ids], ndimage.maximum(d, inv + 1, np.arange(1, ids.size + 1)))
+
+	# spill cells, where water leaves the filled depression holding each sink
+	if filled is not None and nsinks:
+		_sink_spills(table, labels, depth, filled, basins, tileSize)
+
+	return table[1:], labels
+
+def _pooled(filled, tile):
+	'''Cells of a tile of a filled DEM without a lower neighbor, cells on the edge of the data drain off it and are never pooled.'''
+	r0, r1, c0, c1 = tile
+	nr = r1 - r0
+	nc = c1 - c0
+	zw = _pad_tile(filled, tile, np.nan).astype(np.float64)
+	zc = zw[1:nr + 1, 1:nc + 1]
+	pooled = ~np.isnan(zc)
+	lowest = np.full((nr, nc), np.inf)
+	for k in range(8):
+		nz = zw[_shifted(k, nr, nc)]
+		pooled &= ~np.isnan(nz) & (nz >= zc)
+		lowest = np.fmin(lowest, np.where(np.isnan(nz), -np.inf, nz))
+	return pooled, zc, lowest
+
+def _sink_spills(table, labels, depth, filled, basins, tileSize):
+	'''Find the spill cell of each sink, writing it to the spill_row and spill_col fields of the table.
+
+	The filled depression holding a sink is the 8-connected group of cells of the filled DEM without a lower neighbor that holds its deepest cell, all at the fill level. Water leaves it through the cells at that level next to it that do have a lower neighbor, and the one with the lowest neighbor is taken, ties going to the first cell.
+	'''
+	shape = labels.shape
+	ncols = shape[1]
+	nsinks = len(table) - 1
+	tiles = list(iter_tiles(shape, tileSize))
+	basins, boxes = _label_components(lambda t: _pooled(filled, (t[0].start, t[0].stop, t[1].start, t[1].stop))[0], shape, basins, tileSize)
+
+	# the depression holding the deepest cell of each sink
+	deepest = np.full(nsinks + 1, -np.inf)
+	basin = np.zeros(nsinks + 1, dtype=np.int64)
+	for r0, r1, c0, c1 in tiles:
+		t = (slice(r0, r1), slice(c0, c1))
+		lab = np.asarray(labels[t])
+		bas = np.asarray(basins[t])
+		rows, cols = np.nonzero((lab > 0) & (bas > 0))
+		if not rows.size:
+			continue
+		lab, bas = lab[rows, cols], bas[rows, cols]
+		d = np.asarray(depth[t])[rows, cols].astype(np.float64)
+		order = np.lexsort((-d, lab))
+		first = np.r_[True, lab[order][1:] != lab[order][:-1]]
+		lab, bas, d = lab[order][first], bas[order][first], d[order][first]
+		deeper = d > deepest[lab]
+		deepest[lab[deeper]] = d[deeper]
+		basin[lab[deeper]] = bas[deeper]
+
+	# the exit of each depression, the cell next to it at its level with the lowest neighbor
+	nbasins = len(boxes)
+	bestLow = np.full(nbasins + 1, np.inf)
+	bestI = np.full(nbasins + 1, np.iinfo(np.int64).max, dtype=np.int64)
+	for tile in tiles:
+		r0, r1, c0, c1 = tile
+		nr = r1 - r0
+		nc = c1 - c0
+		basw = _pad_tile(basins, tile, 0)
+		if not (basw > 0).any():
+			continue
+		pooled, zc, lowest = _pooled(filled, tile)
+		zw = _pad_tile(filled, tile, np.nan).astype(np.float64)
+		drains = ~pooled & ~np.isnan(zc)
+		cand = []
+		for k in range(8):
+			sl = _shifted(k, nr, nc)
+			hit = drains & (basw[sl] > 0) & (zw[sl] == zc)
+			rows, cols = np.nonzero(hit)
+			cand.append((basw[sl][hit], rows, cols))
+		bas = np.concatenate([c[0] for c in cand])
+		if not bas.size:
+			continue
+		rr = np.concatenate([c[1] for c in cand])
+		cc = np.concatenate([c[2] for c in cand])
+		low = lowest[rr, cc]
+		ci = (rr + r0).astype(np.int64) * ncols + cc + c0
+		order = np.lexsort((ci, low, bas))
+		bas, low, ci = bas[order], low[order], ci[order]
+		first = np.r_[True, bas[1:] != bas[:-1]]
+		bas, low, ci = bas[first], low[first], ci[first]
+		better = (low < bestLow[bas]) | ((low == bestLow[bas]) & (ci < bestI[bas]))
+		bas = bas[better]
+		bestLow[bas], bestI[bas] = low[better], ci[better]
+
+	spill = bestI[basin]
+	found = (basin > 0) & (spill < np.iinfo(np.int64).max)
+	table['spill_row'][found] = spill[found] // ncols
+	table['spill_col'][found] = spill[found] % ncols
+
+def _trace_rings(inside):
+	'''Trace the boundaries of the True cells of a padded grid into closed rings of (row, column) vertices.
+
+	Outer rings run clockwise and holes counterclockwise when drawn with row 0 at the top, as in ESRI polygons. Cells touching only at a corner are joined into one ring, matching the 8-connected sink labels.
+	'''
+	h, w = inside.shape
+	up = np.zeros_like(inside)
+	up[1:] = inside[:-1]
+	down = np.zeros_like(inside)
+	down[:-1] = inside[1:]
+	left = np.zeros_like(inside)
+	left[:, 1:] = inside[:, :-1]
+	right = np.zeros_like(inside)
+	right[:, :-1] = inside[:, 1:]
+
+	# unit edges with the inside on the right, directions 0 east, 1 south, 2 west, 3 north
+	W = w + 1
+	starts, ends, dirs = [], [], []
+	for edgeMask, dr0, dc0, dr1, dc1, k in [(inside & ~up, 0, 0, 0, 1, 0), (inside & ~right, 0, 1, 1, 1, 1), (inside & ~down, 1, 1, 1, 0, 2), (inside & ~left, 1, 0, 0, 0, 3)]:
+		r, c = np.nonzero(edgeMask)
+		starts.append((r + dr0) * W + c + dc0)
+		ends.append((r + dr1) * W + c + dc1)
+		dirs.append(np.full(r.size, k))
+	starts = np.concatenate(starts).tolist()
+	ends = np.concatenate(ends).tolist()
+	dirs = np.concatenate(dirs).tolist()
+
+	outgoing = {}
+	for e, s in enumerate(starts):
+		outgoing.setdefault(s, []).append(e)
+
+	used = [False] * len(starts)
+	rings = []
+	for first in range(len(starts)):
+		if used[first]:
+			continue
+		ring = []
+		e = first
+		while not used[e]:
+			used[e] = True
+			if not ring or dirs[e] != prevDir: # keep only the corners
+				ring.append(starts[e])
+			prevDir = dirs[e]
+			options = [o for o in outgoing[ends[e]] if not used[o]]
+			if not options:
+				break
+			if len(options) > 1: # two cells meeting at a corner, turn left to stay with the cell across the corner
+				turn = [o for o in options if dirs[o] == (dirs[e] + 3) % 4]
+				options = turn or options
+			e = options[0]
+		if dirs[first] == prevDir and len(ring) > 1: # the first vertex is mid-edge
+			ring = ring[1:]
+		ring.append(ring[0])
+		rings.append(np.array([divmod(v, W) for v in ring], dtype=np.float64))
+	return rings
+
+def sink_polygons(labels, table, ids = None, grid = None):
+	'''Trace the outlines of sinks labelled by :func:`sink_table`.
+
+	Only the sinks asked for are traced, each within its own bounding box, so a few sinks of interest can be vectorized without touching the rest of the grid.
+
+	Parameters
+	----------
+	labels : ndarray of int32
+		Sink ids returned by :func:`sink_table`.
+	table : ndarray
+		Sink table returned by :func:`sink_table`.
+	ids : iterable (optional)
+		Ids of the sinks to trace, defaults to every sink in the table.
+	grid : GridSpec (optional)
+		Grid of the labels, to return map coordinates rather than (row, column) cell corners.
+
+	Returns
+	-------
+	features : list
+		(rings, id) pairs, as taken by :func:`burn_polygons`. Each ring is a closed (n, 2) array of x, y map coordinates, or of row, column corners without a grid.
+	'''
+	rowOf = dict((sid, i) for i, sid in enumerate(table['id'].tolist()))
+	if ids is None:
+		ids = table['id'].tolist()
+	features = []
+	for sid in ids:
+		row = table[rowOf[sid]]
+		r0, r1, c0, c1 = int(row['row_min']), int(row['row_max']) + 1, int(row['col_min']), int(row['col_max']) + 1
+		inside = np.zeros((r1 - r0 + 2, c1 - c0 + 2), dtype=bool) # padded so every ring closes inside the window
+		inside[1:-1, 1:-1] = np.asarray(labels[r0:r1, c0:c1]) == sid
+		rings = []
+		for ring in _trace_rings(inside):
+			rr, cc = ring[:, 0] + r0 - 1, ring[:, 1] + c0 - 1
+			if grid is None:
+				rings.append(np.column_stack([rr, cc]))
+			else:
+				rings.append(np.column_stack([grid.xmin + cc * grid.cellsize, grid.ymax - rr * grid.cellsize]))
+		features.append((rings, sid))
+	return features
+
+class GridSpec(namedtuple('GridSpec', ['xmin', 'ymax', 'cellsize', 'nrows', 'ncols'])):
+	'''Origin (upper left corner), cell size and shape of a grid that features are burned into.'''
+	__slots__ = ()
+
+	@classmethod
+	def snapped(cls, xmin, ymin, xmax, ymax, cellsize, snapX = 0., snapY = 0.):
+		'''Smallest grid covering an extent, with cell edges aligned to a snap origin.'''
+		x0 = snapX + np.floor((xmin - snapX) / cellsize) * cellsize
+		y1 = snapY + np.ceil((ymax - snapY) / cellsize) * cellsize
+		ncols = int(np.ceil((xmax - x0) / cellsize - 1e-9))
+		nrows = int(np.ceil((y1 - ymin) / cellsize - 1e-9))
+		return cls(float(x0), float(y1), float(cellsize), max(nrows, 1), max(ncols, 1))
+
+	@property
+	def shape(self):
+		return (self.nrows, self.ncols)
+
+	@property
+	def ymin(self):
+		return self.ymax - self.nrows * self.cellsize
+
+def _gridCoords(coords, grid):
+	'''Map coordinates to continuous (row, column) grid coordinates.'''
+	coords = np.asarray(coords, dtype=np.float64).reshape(-1, 2)
+	return (grid.ymax - coords[:, 1]) / grid.cellsize, (coords[:, 0] - grid.xmin) / grid.cellsize
+
+def burn_polygons(features, grid, dtype = np.int32, out = None):
+	'''Burn polygons into a grid with a scanline fill.
+
+	A cell is inside a polygon when its center is, as with Spatial Analyst's PolygonToRaster using the cell center rule. Rings are combined with the even-odd rule, so interior rings make holes.
+
+	Parameters
+	----------
+	features : iterable
+		(rings, value) pairs, where rings is a list of (n, 2) arrays of x, y map coordinates.
+	grid : GridSpec
+		Grid to burn into.
+	dtype : data-type (optional)
+		Type of the output grid, defaults to int32.
+	out : ndarray (optional)
+		Grid to burn into, defaults to a new grid of zeros.
+
+	Returns
+	-------
+	out : ndarray
+		Burned grid, 0 outside every feature. Where features overlap the last one wins.
+	'''
+	if out is None:
+		out = np.zeros(grid.shape, dtype=dtype)
+	for rings, value in features:
+		edges = []
+		for ring in rings:
+			r, c = _gridCoords(ring, grid)
+			if r.size < 3:
+				continue
+			edges.append(np.column_stack([r, c, np.roll(r, -1), np.roll(c, -1)]))
+		if not edges:
+			continue
+		r0, c0, r1, c1 = np.concatenate(edges).T
+		lo = np.minimum(r0, r1)
+		hi = np.maximum(r0, r1)
+
+		# rows whose center line (row + 0.5) crosses each edge, half-open so shared vertices count once
+		first = np.maximum(np.ceil(lo - 0.5), 0).astype(np.int64)
+		last = np.minimum(np.ceil(hi - 0.5) - 1, grid.nrows - 1).astype(np.int64)
+		n = np.maximum(last - first + 1, 0)
+		if not n.sum():
+			continue
+		e = np.repeat(np.arange(n.size), n)
+		rows = first[e] + np.arange(e.size) - np.repeat(np.cumsum(n) - n, n)
+		t = (rows + 0.5 - r0[e]) / (r1[e] - r0[e])
+		x = c0[e] + t * (c1[e] - c0[e])
+
+		# pair up the crossings along each row and fill the cells whose centers fall between them
+		order = np.lexsort((x, rows))
+		rows, x = rows[order], x[order]
+		start = np.clip(np.ceil(x[0::2] - 0.5), 0, grid.ncols).astype(np.int64)
+		stop = np.clip(np.ceil(x[1::2] - 0.5), 0, grid.ncols).astype(np.int64)
+		rows = rows[0::2]
+		keep = stop > start
+		rows, start, stop = rows[keep], start[keep], stop[keep]
+		if not rows.size:
+			continue
+		rlo, rhi = rows.min(), rows.max() + 1
+		clo, chi = start.min(), stop.max()
+		diff = np.zeros((rhi - rlo, chi - clo + 1), dtype=np.int32)
+		np.add.at(diff, (rows - rlo, start - clo), 1)
+		np.add.at(diff, (rows - rlo, stop - clo), -1)
+		inside = np.cumsum(diff, axis = 1)[:, :-1] > 0
+		out[rlo:rhi, clo:chi][inside] = value
+	return out
+
+def burn_lines(features, grid, dtype = np.int32, out = None):
+	'''Burn lines into a grid, marking every cell each segment passes through (a supercover line).
+
+	Parameters
+	----------
+	features : iterable
+		(paths, value) pairs, where paths is a list of (n, 2) arrays of x, y map coordinates.
+	grid : GridSpec
+		Grid to burn into.
+	dtype : data-type (optional)
+		Type of the output grid, defaults to int32.
+	out : ndarray (optional)
+		Grid to burn into, defaults to a new grid of zeros.
+
+	Returns
+	-------
+	out : ndarray
+		Burned grid, 0 away from every feature. Where features overlap the last one wins.
+	'''
+	if out is None:
+		out = np.zeros(grid.shape, dtype=dtype)
+	for paths, value in features:
+		segs = []
+		for path in paths:
+			r, c = _gridCoords(path, grid)
+			if r.size == 1:
+				r, c = np.repeat(r, 2), np.repeat(c, 2)
+			segs.append(np.column_stack([r[:-1], c[:-1], r[1:], c[1:]]))
+		if not segs:
+			continue
+		r0, c0, r1, c1 = np.concatenate(segs).T
+		dr, dc = r1 - r0, c1 - c0
+
+		# parameters along each segment where it crosses a row or column line, plus both ends
+		ts = [np.zeros(r0.size), np.ones(r0.size)]
+		segIdx = [np.arange(r0.size), np.arange(r0.size)]
+		for a0, a1, d in ((r0, r1, dr), (c0, c1, dc)):
+			lo = np.floor(np.minimum(a0, a1)) + 1
+			n = np.maximum(np.ceil(np.maximum(a0, a1)) - lo, 0).astype(np.int64)
+			e = np.repeat(np.arange(r0.size), n)
+			lines = lo[e] + np.arange(e.size) - np.repeat(np.cumsum(n) - n, n)
+			ts.append((lines - a0[e]) / d[e])
+			segIdx.append(e)
+		t = np.concatenate(ts)
+		s = np.concatenate(segIdx)
+		order = np.lexsort((t, s))
+		t, s = t[order], s[order]
+
+		# the cell between consecutive crossings is the one holding their midpoint
+		same = s[1:] == s[:-1]
+		tm = ((t[1:] + t[:-1]) / 2.)[same]
+		sm = s[1:][same]
+		rows = np.floor(r0[sm] + tm * dr[sm]).astype(np.int64)
+		cols = np.floor(c0[sm] + tm * dc[sm]).astype(np.int64)
+		ok = (rows >= 0) & (rows < grid.nrows) & (cols >= 0) & (cols < grid.ncols)
+		out[rows[ok], cols[ok]] = value
+	return out
+
+def burn_points(features, grid, dtype = np.int32, out = None):
+	'''Burn points into the cells that contain them.
+
+	Parameters
+	----------
+	features : iterable
+		(points, value) pairs, where points is an (n, 2) array of x, y map coordinates.
+	grid : GridSpec
+		Grid to burn into.
+	dtype : data-type (optional)
+		Type of the output grid, defaults to int32.
+	out : ndarray (optional)
+		Grid to burn into, defaults to a new grid of zeros.
+
+	Returns
+	-------
+	out : ndarray
+		Burned grid, 0 away from every feature. Where features share a cell the last one wins.
+	'''
+	if out is None:
+		out = np.zeros(grid.shape, dtype=dtype)
+	for points, value in features:
+		r, c = _gridCoords(points, grid)
+		rows = np.floor(r).astype(np.int64)
+		cols = np.floor(c).astype(np.int64)
+		ok = (rows >= 0) & (rows < grid.nrows) & (cols >= 0) & (cols < grid.ncols)
+		out[rows[ok], cols[ok]] = value
+	return out
+
+class SparseCells(namedtuple('SparseCells', ['index', 'ids', 'shape'])):
+	'''A few cells of a grid, such as drain plugs, as sorted flat (row-major) cell indices and the id of each cell.
+
+	Stages apply them as point updates, so a handful of cells never costs a pass over a full grid.
+	'''
+	__slots__ = ()
+
+	@classmethod
+	def from_points(cls, features, grid):
+		'''Cells containing points, taking (points, value) pairs like :func:`burn_points`. Where points share a cell the last one wins.'''
+		index, ids = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int32)]
+		for points, value in features:
+			r, c = _gridCoords(points, grid)
+			rows = np.floor(r).astype(np.int64)
+			cols = np.floor(c).astype(np.int64)
+			ok = (rows >= 0) & (rows < grid.nrows) & (cols >= 0) & (cols < grid.ncols)
+			index.append(rows[ok] * grid.ncols + cols[ok])
+			ids.append(np.full(ok.sum(), value, dtype=np.int32))
+		index, ids = np.concatenate(index), np.concatenate(ids)
+		index, last = np.unique(index[::-1], return_index = True) # first of the reversed cells is the last burned
+		return cls(index, ids[::-1][last], grid.shape)
+
+	@classmethod
+	def from_mask(cls, mask, ids = None):
+		'''Cells where a boolean grid is True, with ids taken from an id grid if given, otherwise 1.'''
+		index = np.flatnonzero(mask)
+		cellIds = np.ones(index.size, dtype=np.int32) if ids is None else np.asarray(ids).reshape(-1)[index].astype(np.int32)
+		return cls(index.astype(np.int64), cellIds, tuple(mask.shape))
+
+	@property
+	def size(self):
+		return self.index.size
+
+	def window(self, r0, r1, c0, c1):
+		'''Rows and columns, relative to the window, and ids of the cells in a window of the grid.'''
+		ncols = self.shape[1]
+		lo, hi = np.searchsorted(self.index, [r0 * ncols, r1 * ncols])
+		rows, cols = np.divmod(self.index[lo:hi], ncols)
+		ok = (cols >= c0) & (cols < c1)
+		return rows[ok] - r0, cols[ok] - c0, self.ids[lo:hi][ok]
+
+	def contains(self, idx):
+		'''Whether each flat cell index is one of the cells.'''
+		return _find_sorted(self.index, idx)[1]
+
+def _plugCells(plugs, r0, r1, c0, c1):
+	'''Rows and columns, relative to the window, of the drain plugs in a window of the grid, from a boolean grid or :class:`SparseCells`.'''
+	if isinstance(plugs, SparseCells):
+		return plugs.window(r0, r1, c0, c1)[:2]
+	return np.nonzero(np.asarray(plugs[r0:r1, c0:c1]))
+
+class RasterizeCache(object):
+	'''On-disk cache of burned grids.
+
+	Grids are stored as ``.npy`` files named by a hash of the feature fingerprint, the kind of burn and the grid spec, so a grid is only burned again when the features or the grid change.
+
+	Parameters
+	----------
+	folder : str
+		Folder holding the cached grids, created if needed.
+	'''
+
+	def __init__(self, folder):
+		self.folder = folder
+		if not os.path.isdir(folder):
+			os.makedirs(folder)
+
+	def key(self, fingerprint, kind, grid):
+		'''Cache key of a burned grid.'''
+		spec = '%s|%s|%r|%r|%r|%d|%d'%(fingerprint, kind, grid.xmin, grid.ymax, grid.cellsize, grid.nrows, grid.ncols)
+		return hashlib.sha1(spec.encode('utf-8')).hexdigest()
+
+	def get(self, key):
+		'''Cached grid for a key, None if it has not been burned.'''
+		path = os.path.join(self.folder, '%s.npy'%key)
+		if not os.path.exists(path):
+			return None
+		try:
+			return np.load(path)
+		except (IOError, ValueError): # truncated by an interrupted run
+			return None
+
+	def put(self, key, arr):
+		'''Store a burned grid, writing to a temporary file first so an interrupted run never leaves a partial grid.'''
+		path = os.path.join(self.folder, '%s.npy'%key)
+		tmp = os.path.join(self.folder, '%s.tmp.npy'%key)
+		np.save(tmp, arr)
+		if os.path.exists(path):
+			os.remove(path)
+		os.rename(tmp, path)
@@ -5,6 +5,417 @@ import sys
 import os
 from arcpy.sa import *
 import time
+import json
+import hashlib
+import hydro_arrays
+import checkpoints
+import profiling
+
+FLOAT_NODATA = -3.4028235e38 # NoData value used when writing float arrays to rasters
+INT_NODATA = -2147483648 # NoData value used when reading or writing 32 bit integer rasters
+
+def _rasterToArray(rast, template, nodata = None):
+	'''Read a raster into a NumPy array aligned with the extent of a template raster.
+
+	Parameters
+	----------
+	rast : str or Raster Object
+		Raster to read.
+	template : Raster Object
+		Raster defining the lower left corner and number of rows and columns to read.
+	nodata : float (optional)
+		Value to give NoData cells in the array, defaults to the NoData value of the raster.
+
+	Returns
+	-------
+	arr : ndarray
+		Raster values.
+	'''
+	lowerLeft = arcpy.Point(template.extent.XMin, template.extent.YMin)
+	if nodata is None:
+		return arcpy.RasterToNumPyArray(rast, lowerLeft, template.width, template.height)
+	return arcpy.RasterToNumPyArray(rast, lowerLeft, template.width, template.height, nodata)
+
+def _rasterToFloatArray(rast, template):
+	'''Read a raster into a float32 NumPy array with NoData cells set to NaN, aligned with the extent of a template raster.'''
+	rast = Raster(rast)
+	arr = _rasterToArray(rast, template).astype(np.float32)
+	if rast.noDataValue is not None:
+		arr[arr == np.float32(rast.noDataValue)] = np.nan
+	return arr
+
+def _arrayToRaster(arr, template, nodata = None, window = None):
+	'''Convert a NumPy array aligned with a template raster back to a raster.
+
+	Parameters
+	----------
+	arr : ndarray
+		Array to convert, NaN is treated as NoData for float arrays.
+	template : Raster Object
+		Raster defining the lower left corner and cell size of the array.
+	nodata : float (optional)
+		Value in the array to be written as NoData.
+	window : tuple (optional)
+		First and last rows and columns (r0, r1, c0, c1) of the array to write, as returned by :func:`_extentWindow`, defaults to the whole array.
+
+	Returns
+	-------
+	rast : Raster Object
+		Output raster.
+	'''
+	r0, r1, c0, c1 = (0, arr.shape[0], 0, arr.shape[1]) if window is None else window
+	arr = arr[r0:r1, c0:c1]
+	if np.issubdtype(arr.dtype, np.floating):
+		arr = np.where(np.isnan(arr), arr.dtype.type(FLOAT_NODATA), arr)
+		nodata = FLOAT_NODATA
+	lowerLeft = arcpy.Point(template.extent.XMin + c0 * template.meanCellWidth, template.extent.YMax - r1 * template.meanCellHeight)
+	if nodata is None:
+		return arcpy.NumPyArrayToRaster(arr, lowerLeft, template.meanCellWidth, template.meanCellHeight)
+	return arcpy.NumPyArrayToRaster(arr, lowerLeft, template.meanCellWidth, template.meanCellHeight, nodata)
+
+def _extentWindow(template, extent):
+	'''Rows and columns (r0, r1, c0, c1) of a template raster covering an extent, such as the extent of a feature class, widened to whole cells and clipped to the template.'''
+	cw, ch = template.meanCellWidth, template.meanCellHeight
+	tol = 1e-6 # of a cell, so coordinates on a cell edge do not add a cell
+	c0 = max(0, int(np.floor((extent.XMin - template.extent.XMin) / cw + tol)))
+	c1 = min(template.width, int(np.ceil((extent.XMax - template.extent.XMin) / cw - tol)))
+	r0 = max(0, int(np.floor((template.extent.YMax - extent.YMax) / ch + tol)))
+	r1 = min(template.height, int(np.ceil((template.extent.YMax - extent.YMin) / ch - tol)))
+	return r0, max(r0, r1), c0, max(c0, c1)
+
+def _arrayFolder(scratchWorkspace, name):
+	'''Folder for NumPy files in the scratch workspace, next to it if the scratch workspace is a geodatabase.'''
+	folder = os.path.dirname(scratchWorkspace) if scratchWorkspace.lower().endswith('.gdb') else scratchWorkspace
+	folder = os.path.join(folder, name)
+	if not os.path.isdir(folder):
+		os.makedirs(folder)
+	return folder
+
+def _gridToRaster(arr, grid, nodata = None):
+	'''Convert a NumPy array on a :class:`hydro_arrays.GridSpec` to a raster.'''
+	lowerLeft = arcpy.Point(grid.xmin, grid.ymin)
+	if nodata is None:
+		return arcpy.NumPyArrayToRaster(arr, lowerLeft, grid.cellsize, grid.cellsize)
+	return arcpy.NumPyArrayToRaster(arr, lowerLeft, grid.cellsize, grid.cellsize, nodata)
+
+def _geometryParts(geom, cellsize):
+	'''Coordinates of each ring, path or point of a geometry as (n, 2) arrays, curves are densified to a tenth of a cell.'''
+	if geom.type in ('point', 'multipoint'):
+		pnts = [geom.firstPoint] if geom.type == 'point' else list(geom)
+		return [np.array([(p.X, p.Y) for p in pnts if p is not None], dtype=np.float64).reshape(-1, 2)]
+	if geom.hasCurves:
+		geom = geom.densify('DISTANCE', cellsize / 2., cellsize / 10.)
+	parts = []
+	for part in geom:
+		pts = []
+		for pnt in part:
+			if pnt is None: # start of an interior ring
+				if pts:
+					parts.append(np.array(pts, dtype=np.float64))
+				pts = []
+				continue
+			pts.append((pnt.X, pnt.Y))
+		if pts:
+			parts.append(np.array(pts, dtype=np.float64))
+	return parts
+
+def _featureFingerprint(fc, valueField, spatialReference):
+	'''Hash of the geometries and burn values of a feature class, in the output spatial reference. Only the geometries are hashed if valueField is None.'''
+	digest = hashlib.sha1()
+	digest.update(spatialReference.exportToString().encode('utf-8'))
+	fields = ['SHAPE@WKB'] if valueField is None else ['SHAPE@WKB', valueField]
+	with arcpy.da.SearchCursor(fc, fields, spatial_reference = spatialReference) as cursor:
+		for row in cursor:
+			if row[0]:
+				digest.update(bytes(row[0]))
+			if valueField is not None:
+				digest.update(str(row[1]).encode('utf-8'))
+	return digest.hexdigest()
+
+def _burnFeatures(fc, valueField, outPth, grid, cache = None):
+	'''Rasterize a feature class onto a grid with the burners in :mod:`hydro_arrays`.
+
+	Polygons are scanline filled on cell centers, lines are burned as supercover lines and points into the cell holding them. The burned grid is looked up in, or added to, the cache using a fingerprint of the features and the grid spec, so unchanged features are only burned once.
+
+	Parameters
+	----------
+	fc : str
+		Feature class or layer to rasterize.
+	valueField : str
+		Field holding the value burned for each feature, e.g. 'OID@', or None to burn 1 for every feature.
+	outPth : str
+		Path of the output raster, NoData away from the features.
+	grid : hydro_arrays.GridSpec
+		Grid to burn into.
+	cache : hydro_arrays.RasterizeCache (optional)
+		Cache of burned grids.
+
+	Returns
+	-------
+	rast : Raster Object
+		Rasterized features.
+	'''
+	dsc = arcpy.Describe(fc)
+	sr = arcpy.env.outputCoordinateSystem or dsc.spatialReference
+	kind = {'Polygon': 'polygon', 'Polyline': 'line', 'Point': 'point', 'Multipoint': 'point'}[dsc.shapeType]
+
+	arr = None
+	if cache is not None:
+		key = cache.key(_featureFingerprint(fc, valueField, sr), kind, grid)
+		arr = cache.get(key)
+		if arr is not None:
+			arcpy.AddMessage('		Using cached grid for %s'%fc)
+
+	if arr is None:
+		burn = {'polygon': hydro_arrays.burn_polygons, 'line': hydro_arrays.burn_lines, 'point': hydro_arrays.burn_points}[kind]
+		fields = ['SHAPE@', 'OID@' if valueField is None else valueField]
+		with arcpy.da.SearchCursor(fc, fields, spatial_reference = sr) as cursor:
+			features = ((_geometryParts(geom, grid.cellsize), 1 if valueField is None else value) for geom, value in cursor if geom is not None)
+			if kind == 'point':
+				features = ((np.concatenate(parts), value) for parts, value in features)
+			arr = burn(features, grid)
+		if cache is not None:
+			cache.put(key, arr)
+
+	rast = _gridToRaster(arr, grid, 0)
+	rast.save(outPth)
+	return Raster(outPth)
+
+def _featureToRaster(fc, valueField, outPth, cellsz, grid = None, cache = None):
+	'''Rasterize a feature class with FeatureToRaster, or with :func:`_burnFeatures` if a grid is given.
+
+	With valueField None every feature is burned as 1, without adding a field to the features: FeatureToRaster rasterizes the object IDs to a scratch raster that is then set to 1 wherever it has data.
+	'''
+	if grid is None and valueField is None:
+		oidPth = arcpy.CreateScratchName('oid', '', 'RasterDataset', arcpy.env.scratchWorkspace)
+		arcpy.FeatureToRaster_conversion(fc, arcpy.Describe(fc).OIDFieldName, oidPth, cell_size = cellsz)
+		Con(IsNull(oidPth) == 0, 1).save(outPth)
+		arcpy.Delete_management(oidPth)
+	elif grid is None:
+		arcpy.FeatureToRaster_conversion(fc, valueField, outPth, cell_size = cellsz)
+	else:
+		_burnFeatures(fc, 'OID@' if valueField == 'OBJECTID' else valueField, outPth, grid, cache) # the cursor token works for any object ID field name
+
+def _templateGrid(template):
+	'''Grid spec of a raster, for the arrays read with it as the template.'''
+	return hydro_arrays.GridSpec(template.extent.XMin, template.extent.YMax, template.meanCellWidth, template.height, template.width)
+
+def _rasterMaxCell(rast, tileSize = 2048):
+	'''Row, column and value of the largest cell of a raster, read one block at a time with :func:`hydro_arrays.max_cell`.'''
+	rast = Raster(rast)
+	best = None
+	for r0, r1, c0, c1 in hydro_arrays.iter_tiles((rast.height, rast.width), tileSize):
+		lowerLeft = arcpy.Point(rast.extent.XMin + c0 * rast.meanCellWidth, rast.extent.YMax - r1 * rast.meanCellHeight)
+		cell = hydro_arrays.max_cell(arcpy.RasterToNumPyArray(rast, lowerLeft, c1 - c0, r1 - r0), rast.noDataValue)
+		if cell is not None and (best is None or cell[2] > best[2]):
+			best = (r0 + cell[0], c0 + cell[1], cell[2])
+	assert best is not None, "Raster %s has no data"%(rast)
+	return best
+
+def _rasterCell(rast, x, y):
+	'''Value of the cell of a raster holding a point, e.g. a cell center.'''
+	rast = Raster(rast)
+	col = int(np.floor((x - rast.extent.XMin) / rast.meanCellWidth))
+	row = int(np.floor((rast.extent.YMax - y) / rast.meanCellHeight))
+	lowerLeft = arcpy.Point(rast.extent.XMin + col * rast.meanCellWidth, rast.extent.YMax - (row + 1) * rast.meanCellHeight) # snapped to the cell grid of the raster
+	return arcpy.RasterToNumPyArray(rast, lowerLeft, 1, 1)[0, 0]
+
+def _cellRaster(row, col, template):
+	'''Raster of one cell of value 1 at a row and column of a template raster.'''
+	lowerLeft = arcpy.Point(template.extent.XMin + col * template.meanCellWidth, template.extent.YMax - (row + 1) * template.meanCellHeight)
+	return arcpy.NumPyArrayToRaster(np.ones((1, 1), dtype=np.uint8), lowerLeft, template.meanCellWidth, template.meanCellHeight)
+
+class _RasterBlocks(object):
+	'''Read-only view of a raster that reads only the blocks it is sliced with, for array functions that walk a grid such as :func:`hydro_arrays.propagate_paths`.'''
+
+	def __init__(self, rast, nodata):
+		self.rast = Raster(rast)
+		self.nodata = nodata
+		self.shape = (self.rast.height, self.rast.width)
+
+	def __getitem__(self, key):
+		rows, cols = key
+		lowerLeft = arcpy.Point(self.rast.extent.XMin + cols.start * self.rast.meanCellWidth, self.rast.extent.YMax - rows.stop * self.rast.meanCellHeight)
+		return arcpy.RasterToNumPyArray(self.rast, lowerLeft, cols.stop - cols.start, rows.stop - rows.start, self.nodata)
+
+def _accumulationPth(rastPth):
+	'''Path of the file holding the true values of the raised cells of an accumulation raster (see :func:`hydro_arrays.save_accumulation`), next to the raster or to its geodatabase.'''
+	folder = os.path.dirname(rastPth)
+	if folder.lower().endswith('.gdb'):
+		folder = os.path.dirname(folder)
+	return os.path.join(folder, '%s_accumulation.npz'%os.path.basename(rastPth))
+
+def _inflowsPth(rastPth):
+	'''Path of the file recording the inflows of a fac_global raster, next to the raster or to its geodatabase.'''
+	return _accumulationPth(rastPth)[:-len('_accumulation.npz')] + '_inflows.json'
+
+def _setAccumulation(block, noDataValue, br, bc, true, encoding = None, scale = None):
+	'''Set cells of a block read from an accumulation raster to their true values, encoded or clipped to the type of the block, returning the number of values clipped.'''
+	if encoding is not None:
+		block[br, bc] = hydro_arrays.encode_accumulation(true, encoding, scale)
+		return 0
+	clipped = 0
+	if np.issubdtype(block.dtype, np.integer):
+		top = np.iinfo(block.dtype).max
+		if noDataValue is not None and block.dtype.type(noDataValue) == top:
+			top -= 1
+		clipped = int((true > top).sum())
+		true = np.minimum(true, top)
+	block[br, bc] = true.astype(block.dtype)
+	return clipped
+
+def _addToCells(rast, outPth, cells, values, encoding = None, scale = None, tileSize = 1024):
+	'''Copy an accumulation raster and add values to some of its cells, in 64 bits.
+
+	The true values of the raised cells are saved next to the output with :func:`hydro_arrays.save_accumulation`. Without an encoding only the blocks holding those cells are rewritten and values too large for the raster's type are clipped to its largest value below NoData. With one, every block is rewritten as uint32 codes. NoData cells are left as NoData.
+
+	Parameters
+	----------
+	rast : Raster Object
+		Raster to copy.
+	outPth : str
+		Path of the output raster.
+	cells : ndarray
+		Flat indices of the cells to add to.
+	values : ndarray
+		Values added to the cells.
+	encoding : str (optional)
+		Compact encoding of the output, 'scaled' or 'log' (see :func:`hydro_arrays.encode_accumulation`), defaults to None.
+	scale : float (optional)
+		Scale of the encoding.
+	tileSize : int (optional)
+		Number of rows and columns in each block, defaults to 1024.
+
+	Returns
+	-------
+	rast : Raster Object
+		Output raster.
+	'''
+	if encoding is None:
+		arcpy.CopyRaster_management(rast, outPth)
+	rows, cols = np.divmod(cells, rast.width)
+	blocks = []
+	raised = [] # cells holding data and their true values
+	clipped = 0
+	for i, (r0, r1, c0, c1) in enumerate(hydro_arrays.iter_tiles((rast.height, rast.width), tileSize)):
+		sel = (rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1)
+		if not sel.any() and encoding is None:
+			continue
+		lowerLeft = arcpy.Point(rast.extent.XMin + c0 * rast.meanCellWidth, rast.extent.YMax - r1 * rast.meanCellHeight)
+		block = arcpy.RasterToNumPyArray(rast, lowerLeft, c1 - c0, r1 - r0)
+		current = block[rows[sel] - r0, cols[sel] - c0]
+		valid = current == current # False for NaN
+		if rast.noDataValue is not None:
+			valid &= current != block.dtype.type(rast.noDataValue)
+		br, bc = rows[sel][valid] - r0, cols[sel][valid] - c0
+		wide = np.float64 if np.issubdtype(block.dtype, np.floating) else np.int64
+		true = block[br, bc].astype(wide) + values[sel][valid].astype(wide)
+		raised.append((cells[sel][valid], true))
+
+		if encoding is None:
+			nodata = rast.noDataValue
+			clipped += _setAccumulation(block, nodata, br, bc, true)
+		else:
+			full = block.astype(np.float64)
+			if rast.noDataValue is not None:
+				full[block == block.dtype.type(rast.noDataValue)] = np.nan
+			full[br, bc] = true
+			block = hydro_arrays.encode_accumulation(full, encoding, scale)
+			nodata = hydro_arrays.fac_nodata(np.uint32)
+
+		blockPth = outPth + '_blk%s'%i
+		if nodata is None:
+			arcpy.NumPyArrayToRaster(block, lowerLeft, rast.meanCellWidth, rast.meanCellHeight).save(blockPth)
+		else:
+			arcpy.NumPyArrayToRaster(block, lowerLeft, rast.meanCellWidth, rast.meanCellHeight, nodata).save(blockPth)
+		blocks.append(blockPth)
+
+	if encoding is None:
+		if blocks:
+			arcpy.Mosaic_management(blocks, outPth, "LAST")
+	else:
+		arcpy.MosaicToNewRaster_management(blocks, os.path.dirname(outPth), os.path.basename(outPth), None, '32_BIT_UNSIGNED', rast.meanCellWidth, 1)
+	for fl in blocks:
+		arcpy.Delete_management(fl)
+
+	if clipped:
+		arcpy.AddMessage('	%s cells are too large for the type of %s and were clipped, their true values are in %s.'%(clipped, outPth, _accumulationPth(outPth)))
+	raisedCells = np.concatenate([c for c, v in raised]) if raised else np.zeros(0, dtype=np.int64)
+	raisedValues = np.concatenate([v for c, v in raised]) if raised else np.zeros(0, dtype=np.int64)
+	order = np.argsort(raisedCells)
+	hydro_arrays.save_accumulation(_accumulationPth(outPth), raisedCells[order], raisedValues[order], (rast.height, rast.width), encoding, scale)
+
+	return Raster(outPth)
+
+def _updateCells(rastPth, cells, deltas, tileSize = 1024):
+	'''Add changes to some cells of an accumulation raster written by :func:`_addToCells`, in place, rewriting only the blocks holding those cells and updating the saved true values.'''
+	rast = Raster(rastPth)
+	accumulation = hydro_arrays.load_accumulation(_accumulationPth(rastPth))
+	rows, cols = np.divmod(cells, rast.width)
+	blocks = []
+	raised = []
+	clipped = 0
+	for i, (r0, r1, c0, c1) in enumerate(hydro_arrays.iter_tiles((rast.height, rast.width), tileSize)):
+		sel = (rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1)
+		if not sel.any():
+			continue
+		lowerLeft = arcpy.Point(rast.extent.XMin + c0 * rast.meanCellWidth, rast.extent.YMax - r1 * rast.meanCellHeight)
+		block = arcpy.RasterToNumPyArray(rast, lowerLeft, c1 - c0, r1 - r0)
+		current = block[rows[sel] - r0, cols[sel] - c0]
+		valid = current == current # False for NaN
+		if rast.noDataValue is not None:
+			valid &= current != block.dtype.type(rast.noDataValue)
+		br, bc = rows[sel][valid] - r0, cols[sel][valid] - c0
+		true = hydro_arrays.accumulation_values(accumulation, cells[sel][valid], current[valid])
+		true = true + deltas[sel][valid].astype(true.dtype)
+		raised.append((cells[sel][valid], true))
+		clipped += _setAccumulation(block, rast.noDataValue, br, bc, true, accumulation['encoding'], accumulation['scale'])
+
+		blockPth = rastPth + '_blk%s'%i
+		if rast.noDataValue is None:
+			arcpy.NumPyArrayToRaster(block, lowerLeft, rast.meanCellWidth, rast.meanCellHeight).save(blockPth)
+		else:
+			arcpy.NumPyArrayToRaster(block, lowerLeft, rast.meanCellWidth, rast.meanCellHeight, rast.noDataValue).save(blockPth)
+		blocks.append(blockPth)
+
+	del rast
+	if blocks:
+		arcpy.Mosaic_management(blocks, rastPth, "LAST")
+	for fl in blocks:
+		arcpy.Delete_management(fl)
+
+	if clipped:
+		arcpy.AddMessage('	%s cells are too large for the type of %s and were clipped, their true values are in %s.'%(clipped, rastPth, _accumulationPth(rastPth)))
+	if raised:
+		merged, values = hydro_arrays.merge_accumulation(accumulation, np.concatenate([c for c, v in raised]), np.concatenate([v for c, v in raised]))
+		hydro_arrays.save_accumulation(_accumulationPth(rastPth), merged, values, accumulation['shape'], accumulation['encoding'], accumulation['scale'])
+
+def _inletCells(ptin, incrField, incrval, template):
+	'''Read inlet points as the (row, column) of the cells of a template raster holding them and the value of each, incrval without a field or where the field is null. Points outside of the raster are reported and dropped.'''
+	grid = _templateGrid(template)
+	sr = arcpy.env.outputCoordinateSystem or arcpy.Describe(ptin).spatialReference
+	starts = []
+	values = []
+	fields = ['SHAPE@XY'] if incrField is None else ['SHAPE@XY', incrField]
+	with arcpy.da.SearchCursor(ptin, fields, spatial_reference = sr) as cursor:
+		for feat in cursor:
+			x, y = feat[0]
+			value = feat[1] if incrField is not None else None
+			row = int(np.floor((grid.ymax - y) / grid.cellsize))
+			col = int(np.floor((x - grid.xmin) / grid.cellsize))
+			if row < 0 or row >= grid.nrows or col < 0 or col >= grid.ncols:
+				arcpy.AddMessage('\tInlet at %s, %s is outside of %s, skipping it.'%(x, y, template))
+				continue
+			starts.append((row, col))
+			values.append(incrval if value is None else value)
+	return starts, values
+
+def _drainPlugCells(drainplug, template):
+	'''Read drain plug points into :class:`hydro_arrays.SparseCells` on the grid of a template raster, with each plug's object ID as its id.'''
+	sr = arcpy.env.outputCoordinateSystem or arcpy.Describe(drainplug).spatialReference
+	with arcpy.da.SearchCursor(drainplug, ['SHAPE@', 'OID@'], spatial_reference = sr) as cursor:
+		features = [(np.concatenate(_geometryParts(geom, template.meanCellWidth)), oid) for geom, oid in cursor if geom is not None]
+	return hydro_arrays.SparseCells.from_points(features, _templateGrid(template))
 
 def SnapExtent(lExtent, lRaster):
 	'''Returns a given extent snapped to the passed raster.
@@ -91,14 +502,9 @@ def bathymetricGradient(workspace, snapGrid, hucPoly, hydrographyArea, hydrograp
 	# Setup local variables and temporary layer files
 	arcpy.AddMessage("Setting up variables...")
 
-	#temporary features
-	nhd_flow_feat = "nhd_flow"
+	#temporary layers, made straight from the inputs
 	nhd_flow_Layer = "nhd_flow_Layer"
-
-	nhd_area_feat = "nhd_area"
 	nhd_area_Layer = "nhd_area_Layer"
-
-	nhd_wb_feat = "nhd_wb"
 	nhd_wb_Layer = "nhd_wb_Layer"
 
 	#Output rastsers
@@ -108,29 +514,16 @@ def bathymetricGradient(workspace, snapGrid, hucPoly, hydrographyArea, hydrograp
 	outraster1 = "hydro_flowlines"
 	outraster2 = "hydro_areas"
 
-	#convert to temporary shapefiles
-	arcpy.FeatureClassToFeatureClass_conversion(hydrographyArea, arcpy.env.workspace, nhd_area_feat)
-	arcpy.AddField_management(nhd_area_feat,"dummy","SHORT",None,None,None,None,"NULLABLE","NON_REQUIRED",None)
-	arcpy.CalculateField_management(nhd_area_feat,"dummy","1", "PYTHON")
-
-	arcpy.FeatureClassToFeatureClass_conversion(hydrographyWaterbody, arcpy.env.workspace, nhd_wb_feat)
-	arcpy.AddField_management(nhd_wb_feat,"dummy","SHORT",None,None,None,None,"NULLABLE","NON_REQUIRED",None)
-	arcpy.CalculateField_management(nhd_wb_feat,"dummy","1", "PYTHON")
-
-	arcpy.FeatureClassToFeatureClass_conversion(hydrographyFlowline, arcpy.env.workspace, nhd_flow_feat)
-	arcpy.AddField_management(nhd_flow_feat,"dummy","SHORT",None,None,None,None,"NULLABLE","NON_REQUIRED",None)
-	arcpy.CalculateField_management(nhd_flow_feat,"dummy","1", "PYTHON")
-
 	try:
 		#hydrographyArea Processing
 		arcpy.AddMessage("Creating temporary selection layers...")
-		arcpy.MakeFeatureLayer_management(nhd_area_feat, nhd_area_Layer, "FType = 460", "", "")
+		arcpy.MakeFeatureLayer_management(hydrographyArea, nhd_area_Layer, "FType = 460", "", "")
 		
 		#hydrographyWaterbody Processing
-		arcpy.MakeFeatureLayer_management(nhd_wb_feat, nhd_wb_Layer, "FType = 390 OR FType = 361", "", "")
+		arcpy.MakeFeatureLayer_management(hydrographyWaterbody, nhd_wb_Layer, "FType = 390 OR FType = 361", "", "")
 		
 		#hydrographyFlowline Processing
-		arcpy.MakeFeatureLayer_management(nhd_flow_feat, nhd_flow_Layer, "", "", "")
+		arcpy.MakeFeatureLayer_management(hydrographyFlowline, nhd_flow_Layer, "", "", "")
 		arcpy.SelectLayerByLocation_management(nhd_flow_Layer, "WITHIN", nhd_wb_Layer, "", "NEW_SELECTION")
 		arcpy.SelectLayerByLocation_management(nhd_flow_Layer, "WITHIN", nhd_area_Layer, "", "ADD_TO_SELECTION")
 	except:
@@ -151,7 +544,7 @@ def bathymetricGradient(workspace, snapGrid, hucPoly, hydrographyArea, hydrograp
 	# Process: Feature to Raster1 - NHD Area...
 	try:
 		arcpy.SelectLayerByLocation_management(nhd_area_Layer, "INTERSECT", nhd_flow_Layer, "0", "NEW_SELECTION")
-		arcpy.FeatureToRaster_conversion(nhd_area_Layer, "dummy", areatempraster, cellsize)      
+		_featureToRaster(nhd_area_Layer, None, areatempraster, cellsize)
 	except:
 		arcpy.CreateRasterDataset_management(arcpy.env.workspace,"nhdarea_tmp","10","8_BIT_UNSIGNED",snapGrid)
 		arcpy.AddMessage(arcpy.GetMessages())
@@ -159,14 +552,14 @@ def bathymetricGradient(workspace, snapGrid, hucPoly, hydrographyArea, hydrograp
 	# Process: Feature to Raster2 - NHD Waterbody...
 	try:
 		arcpy.SelectLayerByLocation_management(nhd_wb_Layer, "INTERSECT", nhd_flow_Layer, "0", "NEW_SELECTION")
-		arcpy.FeatureToRaster_conversion(nhd_wb_Layer, "dummy", wbtempraster, cellsize)
+		_featureToRaster(nhd_wb_Layer, None, wbtempraster, cellsize)
 	except:
 		arcpy.CreateRasterDataset_management(arcpy.env.workspace,"nhdwb_tmp","10","8_BIT_UNSIGNED",snapGrid)
 		arcpy.AddMessage(arcpy.GetMessages())
 
 	# Process: Feature to Raster3 - NHD Flowline.  This is the first output
 	try:
-		arcpy.FeatureToRaster_conversion(nhd_flow_Layer, "dummy", outraster1, cellsize)
+		_featureToRaster(nhd_flow_Layer, None, os.path.join(arcpy.env.workspace, outraster1), cellsize)
 	except:
 		arcpy.AddMessage(arcpy.GetMessages())
 
@@ -178,7 +571,7 @@ def bathymetricGradient(workspace, snapGrid, hucPoly, hydrographyArea, hydrograp
 
 	#Delete temp files and rasters
 	arcpy.AddMessage("Cleaning up...")
-	for fl in [areatempraster,wbtempraster,nhd_wb_feat,nhd_flow_feat,nhd_area_feat]:
+	for fl in [areatempraster,wbtempraster,nhd_wb_Layer,nhd_flow_Layer,nhd_area_Layer]:
 		if arcpy.Exists(fl): arcpy.Delete_management(fl)
 
 	arcpy.AddMessage("Done!")
@@ -244,7 +637,7 @@ def coastaldem(Input_Workspace, grdNamePth, InFeatureClass, OutRaster, seaLevel,
 
 	return None
 
-def hydrodem(outdir, huc8cov, origdemPth, dendrite, snap_grid, bowl_polys, bowl_lines, inwall, drainplug, buffdist, inwallbuffdist, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, cellsz, scratchWorkspace, version = None):
+def hydrodem(outdir, huc8cov, origdemPth, dendrite, snap_grid, bowl_polys, bowl_lines, inwall, drainplug, buffdist, inwallbuffdist, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, cellsz, scratchWorkspace, version = None, engine = 'arcpy', tiled = False, tileSize = 2048, tileWorkers = 1, resume = False, profile = False, sinkPolygons = True):
 	'''Hydro-enforce a DEM using hydrography data sets.
 
 	This function is used by the National StreamStats Team as the optimal approach for preparing a state's physiographic datasets for watershed delineations. It takes as input, a digital elevation model (DEM), and enforces this data to recognize the supplied hydrography as correct. Supplied watershed boundaries can also be recognized as correct if available for a given state/region. This function assumes that the DEM has first been projected to a state's projection of choice. This function prepares data to be used in the ESRI ArcHydro data model (the GIS database environment for National StreamStats).
@@ -291,6 +684,20 @@ def hydrodem(outdir, huc8cov, origdemPth, dendrite, snap_grid, bowl_polys, bowl_
 		Path to scratch workspace.
 	version : str (optional)
 		Package version number.
+	engine : str (optional)
+		'arcpy' to run every stage with Spatial Analyst (default) or 'numpy' to run the stages that have an array implementation in :mod:`hydro_arrays`. The numpy engine also burns the features itself and caches the burned grids in a rasterize_cache folder in the scratch workspace, so features that have not changed are not rasterized again.
+	tiled : bool (optional)
+		Run the whole pipeline tile by tile on memory-mapped arrays stored in a hydrodem_arrays folder in the scratch workspace, so the largest local folders fit in memory. Uses the array engines whatever the engine, defaults to False. Every stage holds a few tiles per worker, plus tables of a few bytes per watershed or flat that reaches a tile edge: the spill graph of the fill (about 20 bytes per pair of watersheds meeting at the tile edges) and the flat labels of the flow direction.
+	tileSize : int (optional)
+		Number of rows and columns in each tile of the tiled mode, defaults to 2048. Memory use grows with the square of the tile size.
+	tileWorkers : int (optional)
+		Number of workers the tiled mode runs at once, worker processes filling tiles and threads computing the bowling distance around each waterbody, defaults to 1. Each worker holds one tile, so memory use grows with the number of workers.
+	resume : bool (optional)
+		Checkpoint every stage in a hydrodem_manifest.json file next to the outputs and keep the intermediate grids, so a rerun skips the stages whose inputs and parameters have not changed and resumes at the first one that has. Defaults to False.
+	profile : bool (optional)
+		Append the wall time, CPU time, peak memory of the stage, cells processed and bytes read and written of every stage to a hydrodem_profile.jsonl file next to the outputs (see :class:`profiling.StageProfiler`). Defaults to False.
+	sinkPolygons : bool (optional)
+		Trace the sink polygons (fsinkc), defaults to True. With the numpy engine or in tiled mode the sinks are also summarized in an fsink_table table (id, area, maximum depth, volume, bounding box and spill cell), which is all that is written when this is False.
 
 	Returns (saved to outDIR)
 	-------
@@ -302,6 +709,8 @@ def hydrodem(outdir, huc8cov, origdemPth, dendrite, snap_grid, bowl_polys, bowl_
 		HydroDEM FAC raster grid saved to outDir.
 	sink_path : feature class
 		Sink feature class saved to outDir.
+	sink_table : table
+		Sink table (fsink_table) saved to outDir, numpy engine and tiled mode only.
 	'''
 	strtTime = time.time()
 	if version:
@@ -365,181 +774,663 @@ def hydrodem(outdir, huc8cov, origdemPth, dendrite, snap_grid, bowl_polys, bowl_
 
 	tmpLocations = [] # make a container for temp locations that will be deleted at the end
 
+	outFolder = os.path.dirname(outdir) if outdir.lower().endswith('.gdb') else outdir # folder for the manifest and profile
+	profiler = profiling.StageProfiler(os.path.join(outFolder, 'hydrodem_profile.jsonl') if profile else None, {'workspace': outdir, 'engine': engine, 'tiled': bool(tiled)})
+
+	with profiler: # records the stage in progress, with the error, if a stage fails
+		# stage checkpoints, each key chains the inputs and parameters of its stage onto the key of the stage before
+		manifest = checkpoints.StageManifest(os.path.join(outFolder, 'hydrodem_manifest.json') if resume else None, arcpy.Exists)
+		fp = _datasetFingerprint if resume else lambda pth: None # fingerprints read the datasets, only compute them when resuming
+		native = engine == 'numpy' or tiled
+		keys = {}
+		keys['inputs'] = manifest.key('inputs', fp(huc8cov), fp(dendrite), fp(drainplug), fp(inwall), fp(snap_grid), buffdist, inwallbuffdist, cellsz, native)
+		keys['agree'] = manifest.key(keys['inputs'], 'agree', fp(origdemPth), agreebuf, agreesmooth, agreesharp, engine, tiled, tileSize)
+		keys['enforce'] = manifest.key(keys['agree'], 'enforce', fp(bowl_polys), fp(bowl_lines), outwallht, inwallht, bowldepth)
+		for prev, stage in [('enforce', 'fill'), ('fill', 'fdr'), ('fdr', 'fac')]:
+			keys[stage] = manifest.key(keys[prev], stage)
+		keys['sinks'] = manifest.key(keys['fac'], 'sinks', sinkPolygons)
+
+		hucbuff = os.path.join(arcpy.env.workspace,'hucbuff') # some temp location
+		outGrid = os.path.join(arcpy.env.workspace,'hucbuffRast')
+		dendriteGridpth = os.path.join(arcpy.env.workspace,'tmpDendriteRast')
+		ridgeNLpth = os.path.join(arcpy.env.workspace,'ridgeRast')
+		dpg_path = os.path.join(arcpy.env.workspace,'sinklnk')
+		tmpGrd_name = os.path.join(arcpy.env.workspace,'tmpGrd')
+		tmpLocations.extend([hucbuff, outGrid, dendriteGridpth, ridgeNLpth, tmpGrd_name])
+
+		if manifest.done('inputs', keys['inputs']):
+			arcpy.AddMessage('	Reusing the buffered local divisions and rasterized features')
+			rasterized = manifest.stages['inputs']['outputs']
+		else:
+			rasterized = _hydrodemInputs(huc8cov, dendrite, inwall, drainplug, buffdist, inwallbuffdist, cellsz, dsc, native, scratchWorkspace, dp_bypass, iw_bypass, tmpLocations, profiler)
+			manifest.record('inputs', keys['inputs'], rasterized)
+
+		arcpy.env.extent = hucbuff # set the extent to the buffered HUC
+		arcpy.env.mask = outGrid # set mask (L169 in hydroDEM_work_mod.aml)
+
+		dendriteGrid = Raster(dendriteGridpth)
+		origdem = Raster(origdemPth)
+		ridgeNL = Raster(ridgeNLpth) # load ridgeNL 
+		dpg = Raster(dpg_path) if dpg_path in rasterized else None
+		plugFc = None # drain plugs for the array engines, applied cell by cell rather than as a grid
+		if native and not dp_bypass and int(arcpy.GetCount_management(drainplug).getOutput(0)) > 0:
+			plugFc = drainplug
+		tmpGrd = Raster(tmpGrd_name) if tmpGrd_name in rasterized else None
+
+		if tiled:
+			fsinkgPth = os.path.join(arcpy.env.workspace,'fsinkg')
+			tmpLocations.append(fsinkgPth)
+			if manifest.done('fac', keys['fac']):
+				arcpy.AddMessage('	Reusing hydrodem, fdr and fac')
+				fsinkg = Raster(fsinkgPth)
+			else:
+				store = hydro_arrays.ArrayStore(_arrayFolder(scratchWorkspace, 'hydrodem_arrays'))
+				try:
+					fsinkg = _hydrodemTiled(Raster(outGrid), arcpy.Describe(huc8cov).extent, origdem, dendriteGrid, ridgeNL, bowl_polys, bowl_lines, tmpGrd, plugFc, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, store, tileSize, tileWorkers, profiler)
+				finally:
+					store.cleanup()
+				manifest.record('fac', keys['fac'], [os.path.join(arcpy.env.workspace, name) for name in ['hydrodem', 'fdr', 'fac', 'fsinkg']])
+		else:
+			fsinkg = _hydrodemRasters(huc8cov, origdem, dendriteGrid, ridgeNL, bowl_polys, bowl_lines, tmpGrd, dpg, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, engine, manifest, keys, profiler, plugFc)
+
+		fsinkc_name = 'fsinkc'
+		if manifest.done('sinks', keys['sinks']):
+			arcpy.AddMessage('	Reusing sink features')
+		elif native:
+			# label the sinks with a union-find and trace polygons from the labels, no full-extent vectorization
+			profiler.start('sink table')
+			store = hydro_arrays.ArrayStore(_arrayFolder(scratchWorkspace, 'hydrodem_arrays') if tiled else None)
+			try:
+				outputs = _sinkFeatures(fsinkg, os.path.join(arcpy.env.workspace,"hydrodem"), origdem, Raster(outGrid), os.path.join(arcpy.env.workspace, 'fsink_table'), os.path.join(arcpy.env.workspace, fsinkc_name) if sinkPolygons else None, store, tileSize)
+			finally:
+				store.cleanup()
+			manifest.record('sinks', keys['sinks'], outputs)
+		elif sinkPolygons:
+			profiler.start('sink polygons')
+			arcpy.RasterToPolygon_conversion(fsinkg, fsinkc_name, 'NO_SIMPLIFY') # (L273 in hydroDEM_work_mod.aml), outputs fsinkc
+			manifest.record('sinks', keys['sinks'], [os.path.join(arcpy.env.workspace, fsinkc_name)])
+		del fsinkg
+
+		arcpy.AddMessage('	Sink Creation Complete')
+
+		# clean the environment of temp files, keeping the checkpointed ones when resuming
+		profiler.start('cleanup')
+		keep = set(out for entry in manifest.stages.values() for out in entry['outputs']) if manifest.enabled else set()
+		for fl in tmpLocations: # delete tmp files
+			if fl not in keep and arcpy.Exists(fl):
+				try:
+					arcpy.Delete_management(fl)
+				except:
+					arcpy.AddMessage("Failed to Delete: %s"%fl)
+
+	totalTime = time.time() - strtTime
+	arcpy.AddMessage('HydroDEM Complete, %s minutes.'%(totalTime/60.))
+	rss = profiler.process_peak_rss()
+	if rss is not None:
+		arcpy.AddMessage('Peak memory use (RSS), %s MB.'%(rss/1048576.))
+
+	return None
+
+def _rasterFingerprint(rast, tileSize = 2048):
+	'''Hash of the extent, cell size, NoData value and cell values of a raster, read one block at a time.'''
+	rast = Raster(rast)
+	digest = hashlib.sha1()
+	digest.update(str([str(rast.extent), rast.meanCellWidth, rast.meanCellHeight, rast.noDataValue]).encode('utf-8'))
+	for r0, r1, c0, c1 in hydro_arrays.iter_tiles((rast.height, rast.width), tileSize):
+		lowerLeft = arcpy.Point(rast.extent.XMin + c0 * rast.meanCellWidth, rast.extent.YMax - r1 * rast.meanCellHeight)
+		digest.update(np.ascontiguousarray(arcpy.RasterToNumPyArray(rast, lowerLeft, c1 - c0, r1 - r0)).tobytes())
+	return digest.hexdigest()
+
+def _datasetFingerprint(pth):
+	'''Fingerprint of a dataset for the stage checkpoints: the geometries and object IDs of a feature class, or the extent, cell size and cell values of a raster.
+
+	Rasters are hashed on their own values rather than on file times, which would change with every other dataset written to the same geodatabase.
+	'''
+	if pth is None:
+		return None
+	dsc = arcpy.Describe(pth)
+	if hasattr(dsc, 'shapeType'):
+		return _featureFingerprint(pth, 'OID@', arcpy.env.outputCoordinateSystem or dsc.spatialReference)
+	return _rasterFingerprint(pth)
+
+def _hydrodemInputs(huc8cov, dendrite, inwall, drainplug, buffdist, inwallbuffdist, cellsz, snapDsc, native, scratchWorkspace, dp_bypass, iw_bypass, tmpLocations, profiler):
+	'''Buffer the local divisions and rasterize the hydrodem features into the workspace, returning the paths of the grids written.'''
+	written = []
+
 	# buffer the huc8cov
 	hucbuff = os.path.join(arcpy.env.workspace,'hucbuff') # some temp location
-	tmpLocations.append(hucbuff)
 	arcpy.AddMessage('	Buffering Local Divisons')
+	profiler.start('buffer local divisions')
 	arcpy.Buffer_analysis(huc8cov, hucbuff, buffdist) # do we need to buffer if this is done in the setup tool, maybe just pass hucbuff to the next step from the parameters...
-	arcpy.AddField_management(hucbuff,"dummy","SHORT",None,None,None,None,"NULLABLE","NON_REQUIRED",None)
-	arcpy.CalculateField_management(hucbuff,"dummy","1", "PYTHON")
+	written.append(hucbuff)
 
 	arcpy.env.extent = hucbuff # set the extent to the buffered HUC
 
+	# the array engines burn the features themselves, on the buffered extent snapped to the snap grid, caching the grids between runs
+	grid = None
+	cache = None
+	cells = None
+	if native:
+		ext = arcpy.Describe(hucbuff).extent
+		grid = hydro_arrays.GridSpec.snapped(ext.XMin, ext.YMin, ext.XMax, ext.YMax, float(cellsz), snapDsc.extent.XMin, snapDsc.extent.YMin)
+		cache = hydro_arrays.RasterizeCache(_arrayFolder(scratchWorkspace, 'rasterize_cache'))
+		cells = grid.nrows * grid.ncols
+
 	# rasterize the buffered local division
 	arcpy.AddMessage('	Rasterizing %s'%hucbuff)
 	outGrid = os.path.join(arcpy.env.workspace,'hucbuffRast')
-	tmpLocations.append(outGrid)
-	arcpy.PolygonToRaster_conversion(hucbuff,"dummy",outGrid,cellsize = cellsz)
+	profiler.start('rasterize hucbuff', cells)
+	_featureToRaster(hucbuff,None,outGrid,cellsz,grid,cache)
+	written.append(outGrid)
 
 	# rasterize the dendrite
 	arcpy.AddMessage('	Rasterizing %s'%dendrite)
 	dendriteGridpth = os.path.join(arcpy.env.workspace,'tmpDendriteRast')
-	tmpLocations.append(dendriteGridpth)
-
-	# may need to add a field to dendrite to rasterize it...
-	arcpy.AddField_management(dendrite,"dummy","SHORT",None,None,None,None,"NULLABLE","NON_REQUIRED",None)
-	arcpy.CalculateField_management(dendrite,"dummy","1", "PYTHON")
-	arcpy.FeatureToRaster_conversion(dendrite,"dummy",dendriteGridpth, cell_size = cellsz)
-	dendriteGrid = Raster(dendriteGridpth)
-	
-	origdem = Raster(origdemPth)
+	profiler.start('rasterize dendrite', cells)
+	_featureToRaster(dendrite,None,dendriteGridpth,cellsz,grid,cache) # burned as 1, the dendrite is read as is
+	written.append(dendriteGridpth)
 
 	arcpy.env.mask = outGrid # set mask (L169 in hydroDEM_work_mod.aml)
 
-	elevgrid = agree(origdem, dendriteGrid, int(agreebuf), int(agreesmooth), int(agreesharp)) # run agree function
-	
-	# burning streams and adding walls
-	arcpy.AddMessage('	Starting Walling') # (L182 in hydroDEM_work_mod.aml)
-
 	ridgeNLpth = os.path.join(arcpy.env.workspace,'ridgeRast')
-	tmpLocations.append(ridgeNLpth)
-	# may need to add a field to huc8cov to rasterize it...
-	arcpy.AddField_management(huc8cov,"dummy","SHORT",None,None,None,None,"NULLABLE","NON_REQUIRED",None)
-	arcpy.CalculateField_management(huc8cov,"dummy","1", "PYTHON")
-	arcpy.FeatureToRaster_conversion(huc8cov,"dummy",ridgeNLpth,cell_size = cellsz) # rasterize the local divisions feature
-	#ridgeEXP = 'some temp location'
-	ridgeNL = Raster(ridgeNLpth) # load ridgeNL 
-	ridgeEXP = Expand(ridgeNL,2,[1]) # the last parameter is the zone to be expanded, this might need to be added to the dummy field above... 
-
-	ridgeW = SetNull((IsNull(ridgeNL) == 0) & (IsNull(ridgeEXP) == 0), ridgeEXP)
-	demRidge8 = elevgrid + Con((IsNull(ridgeW) == 0) & (IsNull(dendriteGrid)), outwallht, 0)
-
-	arcpy.AddMessage('	Walling Complete')
+	profiler.start('rasterize huc8cov', cells)
+	_featureToRaster(huc8cov,None,ridgeNLpth,cellsz,grid,cache) # rasterize the local divisions feature as 1, the zone expanded below
+	written.append(ridgeNLpth)
 
 	if not dp_bypass: # (if bypass is false, as in do not bypass) dp_bypass is defined after the main code in the original AML
-		if int(arcpy.GetCount_management(drainplug).getOutput(0)) > 0:
+		if native: # the array engines read the plugs as cells, see _drainPlugCells
+			arcpy.AddMessage('	Drain plugs will be applied cell by cell')
+		elif int(arcpy.GetCount_management(drainplug).getOutput(0)) > 0:
 			dpg_path = os.path.join(arcpy.env.workspace,'sinklnk')
-			#tmpLocations.append(dpg_path)
-			#arcpy.AddField_management(drainplug,"dummy","SHORT",None,None,None,None,"NULLABLE","NON_REQUIRED",None)
-			#arcpy.CalculateField_management(drainplug,"dummy","1", "PYTHON")
-			arcpy.FeatureToRaster_conversion(drainplug,"OBJECTID",dpg_path,cell_size = cellsz) # (L195 in hydroDEM_work_mod.aml)
-			dpg = Raster(dpg_path) # load the raster object
-		else:
-			tmp = CreateConstantRaster(0) # if the feature class is empty, make a dummy raster
-			dpg = SetNull(tmp,tmp,"VALUE = 0") # set all zeros to null.
+			profiler.start('rasterize drain plugs', cells)
+			_featureToRaster(drainplug,"OBJECTID",dpg_path,cellsz,grid,cache) # (L195 in hydroDEM_work_mod.aml)
+			written.append(dpg_path)
 	else: # if the drain pugs are bypassed
 		arcpy.AddMessage("	Bypassing Drain Plugs")
-		tmp = CreateConstantRaster(0) # if the feature class is empty, make a dummy raster
-		dpg = SetNull(tmp,tmp,"VALUE = 0") # set all zeros to null.
-
-	if not bowl_bypass: # (if bypass is false, as in do not bypass) bowl_bypass is defined after the main code in the original AML
-		arcpy.AddMessage('	Starting Bowling')
-		blp_name = os.path.join(arcpy.env.workspace,'blp')
-		tmpLocations.append(blp_name)
-
-		bowlLines = Raster(bowl_lines)
-
-		#arcpy.MosaicToNewRaster_management([bowlLines,dpg],arcpy.env.workspace,blp_name, None, "32_BIT_SIGNED", None, 1, "FIRST") # probably need some more options
-		#blp = Raster(blp_name)
-		#eucd = SetNull(IsNull(bowl_polys), EucDistance(blp)) # (L210 in hydroDEM_work_mod.aml)
-		
-		eucd = SetNull(IsNull(bowl_polys), EucDistance(bowlLines)) # (L210 in hydroDEM_work_mod.aml)
-		demRidge8wb = demRidge8 - Con(IsNull(eucd) == 0, (bowldepth / (eucd+1)), 0)
-		#demRidge8wb.save(os.path.join(arcpy.env.workspace,'demRidge8wb'))
-		arcpy.AddMessage('	Bowling complete')
-
-	else: # if bypass is true, skip 
-		demRidge8wb = demRidge8
-		arcpy.AddMessage('	Bowling Skipped')
 
 	if not iw_bypass:
-		arcpy.AddMessage('	Starting Inwalling')
 		iwb_name = os.path.join(arcpy.env.workspace,'tmp_inwall_buff')
 		tmpLocations.append(iwb_name)
 		if arcpy.Exists(iwb_name):
 			arcpy.AddMessage("%s exists, please delete or rename before proceeding."%(iwb_name))
+		profiler.start('buffer inwalls')
 		arcpy.Buffer_analysis(inwall,iwb_name,inwallbuffdist) #(L223 in hydroDEM_work_mod.aml)
 		
 		tmpGrd_name = os.path.join(arcpy.env.workspace,'tmpGrd')
-		tmpLocations.append(tmpGrd_name)
 
-		arcpy.AddField_management(iwb_name,"dummy","SHORT",None,None,None,None,"NULLABLE","NON_REQUIRED",None)
-		arcpy.CalculateField_management(iwb_name,"dummy","1", "PYTHON")
+		profiler.start('rasterize inwalls', cells)
+		_featureToRaster(iwb_name,None,tmpGrd_name,cellsz,grid,cache)
+		written.append(tmpGrd_name)
+	profiler.stop()
 
-		arcpy.FeatureToRaster_conversion(iwb_name,"dummy",tmpGrd_name, cell_size = cellsz)
-		tmpGrd = Raster(tmpGrd_name)
+	return written
 
-		# Only inwalls where there are not streams and there are inwalls.
-		dem_enforced = demRidge8wb + Con((IsNull(tmpGrd) == 0) & (IsNull(dendriteGrid)), inwallht, 0) #(L226 in hydroDEM_work_mod.aml) 
-		arcpy.AddMessage('	Inwalling Complete')
+def _hydrodemRasters(huc8cov, origdem, dendriteGrid, ridgeNL, bowl_polys, bowl_lines, tmpGrd, dpg, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, engine, manifest, keys, profiler, drainplug = None):
+	'''Run the hydrodem stages on whole rasters, saving hydrodem, fdr and fac to the workspace and returning the sink grid.
+
+	Stages recorded in the manifest with a matching key are skipped and their saved outputs reused. The numpy engine takes the drain plugs as a feature class (drainplug) and applies them cell by cell, the arcpy engine takes them as a grid (dpg).
+	'''
+	cells = ridgeNL.width * ridgeNL.height
+	elevPth = os.path.join(arcpy.env.workspace,'elevgrid')
+	if manifest.done('agree', keys['agree']):
+		arcpy.AddMessage('	Reusing the AGREE grid')
+		elevgrid = Raster(elevPth)
 	else:
-		#if arcpy.Exists(dem_enforced):
-		#	del dem_enforced
-		dem_enforced = demRidge8wb
-		arcpy.AddMessage('	Inwalling Skipped')
+		profiler.start('agree', cells)
+		elevgrid = agree(origdem, dendriteGrid, int(agreebuf), int(agreesmooth), int(agreesharp), engine = engine) # run agree function
+		if manifest.enabled: # only kept for resuming
+			profiler.start('save elevgrid', cells)
+			elevgrid.save(elevPth)
+			manifest.record('agree', keys['agree'], [elevPth])
+	
+	#ridgeEXP = 'some temp location'
+	profiler.start('expand local divisions', cells)
+	ridgeEXP = Expand(ridgeNL,2,[1]) # the last parameter is the zone to be expanded, the local divisions are burned as 1 
+
+	dp_bypass = dpg is None and drainplug is None
+	plugs = None
+	if engine == 'numpy' and drainplug is not None:
+		plugs = _drainPlugCells(drainplug, ridgeEXP)
+	enforced = None
+	enforcedPth = os.path.join(arcpy.env.workspace,'dem_enforced')
+	enforceDone = manifest.done('enforce', keys['enforce'])
+	if enforceDone:
+		arcpy.AddMessage('	Reusing the enforced DEM')
+		dem_enforced = Raster(enforcedPth)
+	elif engine == 'numpy':
+		# burning streams and adding walls
+		arcpy.AddMessage('	Starting Walling') # (L182 in hydroDEM_work_mod.aml)
+
+		# walls, bowls, inner walls and drain plugs burned in one pass over the arrays, no intermediate rasters
+		profiler.start('walling, bowling, inwalling and drain plugs', cells)
+		cellsize = ridgeEXP.meanCellWidth
+		ridge = _rasterToArray(ridgeEXP, ridgeEXP, 0) != 0
+		bowldist = None
+		if bowl_polys is not None and bowl_lines is not None:
+			arcpy.AddMessage('	Computing Bowling Distance')
+			bowldist = hydro_arrays.region_distance(_rasterToArray(bowl_lines, ridgeEXP, 0) != 0, _rasterToArray(bowl_polys, ridgeEXP, 0) != 0) * cellsize # only around the waterbodies
+		else:
+			arcpy.AddMessage('	Bowling Skipped')
+		inwallMask = None
+		if tmpGrd is not None:
+			inwallMask = _rasterToArray(tmpGrd, ridgeEXP, 0) != 0
+		else:
+			arcpy.AddMessage('	Inwalling Skipped')
+		enforced = hydro_arrays.enforce(_rasterToFloatArray(elevgrid, ridgeEXP), _rasterToArray(dendriteGrid, ridgeEXP, 0) != 0, ridge, _rasterToArray(ridgeNL, ridgeEXP, 0) != 0, outwallht, bowldist, bowldepth, inwallMask, inwallht, plugs, mask = ridge)
+		del ridge, bowldist, inwallMask
+		dem_enforced = _arrayToRaster(enforced, ridgeEXP)
+		arcpy.AddMessage('	Walling, Bowling, Inwalling and Drain Plugs Complete')
+	else:
+		# burning streams and adding walls
+		arcpy.AddMessage('	Starting Walling') # (L182 in hydroDEM_work_mod.aml)
+		profiler.start('walling', cells)
 
-	if not dp_bypass:
-		detmp = Con(IsNull(dpg),dem_enforced)
-		del dem_enforced
-		dem_enforced = detmp #(L242 in hydroDEM_work_mod.aml)
+		ridgeW = SetNull((IsNull(ridgeNL) == 0) & (IsNull(ridgeEXP) == 0), ridgeEXP)
+		demRidge8 = elevgrid + Con((IsNull(ridgeW) == 0) & (IsNull(dendriteGrid)), outwallht, 0)
+
+		arcpy.AddMessage('	Walling Complete')
+
+		if bowl_polys is not None and bowl_lines is not None:
+			arcpy.AddMessage('	Starting Bowling')
+			profiler.start('bowling', cells)
+
+			bowlLines = Raster(bowl_lines)
+
+			#arcpy.MosaicToNewRaster_management([bowlLines,dpg],arcpy.env.workspace,blp_name, None, "32_BIT_SIGNED", None, 1, "FIRST") # probably need some more options
+			#blp = Raster(blp_name)
+			#eucd = SetNull(IsNull(bowl_polys), EucDistance(blp)) # (L210 in hydroDEM_work_mod.aml)
+		
+			eucd = SetNull(IsNull(bowl_polys), EucDistance(bowlLines)) # (L210 in hydroDEM_work_mod.aml)
+			demRidge8wb = demRidge8 - Con(IsNull(eucd) == 0, (bowldepth / (eucd+1)), 0)
+			#demRidge8wb.save(os.path.join(arcpy.env.workspace,'demRidge8wb'))
+			arcpy.AddMessage('	Bowling complete')
+
+		else: # if bypass is true, skip 
+			demRidge8wb = demRidge8
+			arcpy.AddMessage('	Bowling Skipped')
+
+		if tmpGrd is not None:
+			arcpy.AddMessage('	Starting Inwalling')
+			profiler.start('inwalling', cells)
+			# Only inwalls where there are not streams and there are inwalls.
+			dem_enforced = demRidge8wb + Con((IsNull(tmpGrd) == 0) & (IsNull(dendriteGrid)), inwallht, 0) #(L226 in hydroDEM_work_mod.aml) 
+			arcpy.AddMessage('	Inwalling Complete')
+		else:
+			#if arcpy.Exists(dem_enforced):
+			#	del dem_enforced
+			dem_enforced = demRidge8wb
+			arcpy.AddMessage('	Inwalling Skipped')
+
+		if not dp_bypass:
+			profiler.start('drain plugs', cells)
+			detmp = Con(IsNull(dpg),dem_enforced)
+			del dem_enforced
+			dem_enforced = detmp #(L242 in hydroDEM_work_mod.aml)
 
 	arcpy.env.extent = ridgeEXP
 	arcpy.env.mask = ridgeEXP # mask to HUC
 	arcpy.cellSize = origdem
 
-	dem_enforced.save(os.path.join(arcpy.env.workspace,'dem_enforced'))
-
-	arcpy.AddMessage("	Starting Fill")
-	filldem = Fill(dem_enforced,None)
-	fdirg2 = FlowDirection(filldem, 'FORCE') # this works...
-	arcpy.AddMessage("	Fill Complete")
+	if not enforceDone:
+		profiler.start('save dem_enforced', cells)
+		dem_enforced.save(enforcedPth)
+		manifest.record('enforce', keys['enforce'], [enforcedPth])
+
+	filldemPth = os.path.join(arcpy.env.workspace,"hydrodem")
+	depthPth = os.path.join(arcpy.env.workspace,"filldepth")
+	filled = None
+	if manifest.done('fill', keys['fill']):
+		arcpy.AddMessage('	Reusing the filled DEM')
+		filldem = Raster(filldemPth)
+		if engine == 'numpy':
+			filldepth = Raster(depthPth)
+	else:
+		arcpy.AddMessage("	Starting Fill")
+		profiler.start('fill', cells)
+		if engine == 'numpy':
+			# priority-flood over the walled extent, reporting the fill depth against the original DEM for the sink features
+			if enforced is None: # resumed from a saved enforced DEM
+				enforced = _rasterToFloatArray(dem_enforced, ridgeEXP)
+			filled, depth = hydro_arrays.priority_flood_fill(enforced, reference = _rasterToFloatArray(origdem, ridgeEXP)) # already masked to ridgeEXP
+			del enforced
+			filldem = _arrayToRaster(filled, ridgeEXP)
+			filldepth = _arrayToRaster(depth, ridgeEXP)
+			del depth
+		else:
+			filldem = Fill(dem_enforced,None)
+		arcpy.AddMessage("	Fill Complete")
+		profiler.start('save hydrodem', cells)
+		filldem.save(filldemPth)
+		outputs = [filldemPth]
+		if engine == 'numpy' and manifest.enabled:
+			filldepth.save(depthPth)
+			outputs.append(depthPth)
+		manifest.record('fill', keys['fill'], outputs)
+
+	fdrPth = os.path.join(arcpy.env.workspace,"fdr")
+	fdrDone = manifest.done('fdr', keys['fdr'])
+	if not fdrDone:
+		profiler.start('flow direction', cells)
+	if not fdrDone and engine != 'numpy':
+		fdirg2 = FlowDirection(filldem, 'FORCE') # this works...
 
 	# set the mask and extent for the FAC and FDR grids, which should be clipped to the huc bounding polygon.
 	arcpy.env.extent = huc8cov
 	arcpy.env.mask = huc8cov
+	hucWindow = _extentWindow(ridgeEXP, arcpy.Describe(huc8cov).extent) # the same extent for the array engines
 
-	if not dp_bypass:
-		fdirg = Int(Con(IsNull(dpg) == 0, 0, fdirg2)) # (L256 in hydroDEM_work_mod.aml), insert a zero where drain plugs were.
+	fdr = None
+	if fdrDone:
+		arcpy.AddMessage('	Reusing the flow direction grid')
+		fdirg = Raster(fdrPth)
 	else:
-		fdirg = Int(fdirg2)
-		
+		if engine == 'numpy':
+			# steepest descent with resolved flats, drain plug zeros stamped in the same pass, stored as 8 bit
+			if filled is None: # resumed from a saved filled DEM
+				filled = _rasterToFloatArray(filldem, ridgeEXP)
+			fdr = hydro_arrays.flow_direction(filled, plugs = plugs)
+			fdr[_rasterToArray(ridgeNL, ridgeEXP, 0) == 0] = hydro_arrays.FDR_NODATA # clip to the local division
+			fdirg = _arrayToRaster(fdr, ridgeEXP, hydro_arrays.FDR_NODATA, hucWindow) # on the huc8cov extent, as Spatial Analyst writes it
+		elif not dp_bypass:
+			fdirg = Int(Con(IsNull(dpg) == 0, 0, fdirg2)) # (L256 in hydroDEM_work_mod.aml), insert a zero where drain plugs were.
+		else:
+			fdirg = Int(fdirg2)
+		profiler.start('save fdr', cells)
+		fdirg.save(fdrPth)
+		manifest.record('fdr', keys['fdr'], [fdrPth])
+	filled = None
+
 	# might need to save the fdirg, delete it from the python workspace, and reload it...
-	arcpy.AddMessage('	Starting Flow Accumulation')
-	faccg = FlowAccumulation(fdirg, None, "INTEGER")
-	arcpy.AddMessage('	Flow Accumulation Complete')
+	facPth = os.path.join(arcpy.env.workspace,"fac")
+	if manifest.done('fac', keys['fac']):
+		arcpy.AddMessage('	Reusing the flow accumulation grid')
+	else:
+		arcpy.AddMessage('	Starting Flow Accumulation')
+		profiler.start('flow accumulation', cells)
+		if engine == 'numpy':
+			if fdr is None: # resumed from a saved flow direction grid
+				fdr = _rasterToArray(fdirg, ridgeEXP, hydro_arrays.FDR_NODATA).astype(np.uint8)
+			fac = hydro_arrays.flow_accumulation(fdr)
+			faccg = _arrayToRaster(fac, ridgeEXP, hydro_arrays.fac_nodata(fac.dtype), hucWindow)
+			del fac
+		else:
+			faccg = FlowAccumulation(fdirg, None, "INTEGER")
+		arcpy.AddMessage('	Flow Accumulation Complete')
+		profiler.start('save fac', cells)
+		faccg.save(facPth)
+		del faccg
+		manifest.record('fac', keys['fac'], [facPth])
+	del fdr, fdirg
 
 	arcpy.AddMessage('	Creating Sink Features')
-	fsinkg = Con((filldem - origdem) > 1, 1)
-	
-	fsinkc_name = 'fsinkc'
-	arcpy.RasterToPolygon_conversion(fsinkg, fsinkc_name, 'NO_SIMPLIFY') # (L273 in hydroDEM_work_mod.aml), outputs fsinkc
-	del fsinkg
+	profiler.start('sink grid', cells)
+	if engine == 'numpy':
+		fsinkg = Con(filldepth > 1, 1) # the fill depth already holds filldem - origdem
+		del filldepth
+	else:
+		fsinkg = Con((filldem - origdem) > 1, 1)
+	del filldem
+	profiler.stop()
 
-	arcpy.AddMessage('	Sink Creation Complete')
+	return fsinkg
 
-	# save the grids to the workspace
-	filldem.save(os.path.join(arcpy.env.workspace,"hydrodem"))
-	del filldem
+def _rasterToStore(rast, template, arr, tileSize = 2048):
+	'''Read a raster into an array aligned with the extent of a template raster, one tile at a time.
 
-	fdirg.save(os.path.join(arcpy.env.workspace,"fdr"))
-	del fdirg
-	faccg.save(os.path.join(arcpy.env.workspace,"fac"))
-	del faccg
+	Parameters
+	----------
+	rast : str or Raster Object
+		Raster to read.
+	template : Raster Object
+		Raster defining the lower left corner and number of rows and columns to read.
+	arr : ndarray
+		Array, usually memory-mapped, to read into. Float arrays get NaN for NoData, boolean arrays are True where the raster is non-zero.
+	tileSize : int (optional)
+		Number of rows and columns read at once, defaults to 2048.
 
-	# clean the environment of temp files
-	for fl in tmpLocations: # delete tmp files
-		if arcpy.Exists(fl):
-			try:
-				arcpy.Delete_management(fl)
-			except:
-				arcpy.AddMessage("Failed to Delete: %s"%fl)
+	Returns
+	-------
+	arr : ndarray
+		The filled array.
+	'''
+	rast = Raster(rast)
+	floatArr = np.issubdtype(arr.dtype, np.floating)
+	for r0, r1, c0, c1 in hydro_arrays.iter_tiles(arr.shape, tileSize):
+		lowerLeft = arcpy.Point(template.extent.XMin + c0 * template.meanCellWidth, template.extent.YMax - r1 * template.meanCellHeight)
+		if floatArr:
+			block = arcpy.RasterToNumPyArray(rast, lowerLeft, c1 - c0, r1 - r0).astype(arr.dtype)
+			if rast.noDataValue is not None:
+				block[block == arr.dtype.type(rast.noDataValue)] = np.nan
+		else:
+			block = arcpy.RasterToNumPyArray(rast, lowerLeft, c1 - c0, r1 - r0, 0) != 0
+		arr[r0:r1, c0:c1] = block
+	return arr
 
-	totalTime = time.time() - strtTime
-	arcpy.AddMessage('HydroDEM Complete, %s minutes.'%(totalTime/60.))
+_PIXEL_TYPES = {'float32': '32_BIT_FLOAT', 'uint8': '8_BIT_UNSIGNED', 'uint32': '32_BIT_UNSIGNED', 'int32': '32_BIT_SIGNED'}
 
-	return None
+def _storeToRaster(arr, template, outPth, tmpFolder, nodata = None, tileSize = 2048, window = None):
+	'''Write an array aligned with a template raster to a raster, one tile at a time.
+
+	Each tile is written to a temporary raster in tmpFolder and the tiles are mosaicked into the output.
+
+	Parameters
+	----------
+	arr : ndarray
+		Array to write, usually memory-mapped, NaN is treated as NoData for float arrays.
+	template : Raster Object
+		Raster defining the lower left corner and cell size of the array.
+	outPth : str
+		Path of the output raster.
+	tmpFolder : str
+		Folder for the tile rasters.
+	nodata : float (optional)
+		Value in the array to be written as NoData.
+	tileSize : int (optional)
+		Number of rows and columns written at once, defaults to 2048.
+	window : tuple (optional)
+		First and last rows and columns (r0, r1, c0, c1) of the array to write, as returned by :func:`_extentWindow`, defaults to the whole array.
+
+	Returns
+	-------
+	rast : Raster Object
+		Output raster.
+	'''
+	w0, w1, v0, v1 = (0, arr.shape[0], 0, arr.shape[1]) if window is None else window
+	floatArr = np.issubdtype(arr.dtype, np.floating)
+	tiles = []
+	for i, (r0, r1, c0, c1) in enumerate(hydro_arrays.iter_tiles((w1 - w0, v1 - v0), tileSize)):
+		r0, r1, c0, c1 = r0 + w0, r1 + w0, c0 + v0, c1 + v0
+		block = np.asarray(arr[r0:r1, c0:c1])
+		if floatArr:
+			block = np.where(np.isnan(block), block.dtype.type(FLOAT_NODATA), block)
+			nodata = FLOAT_NODATA
+		lowerLeft = arcpy.Point(template.extent.XMin + c0 * template.meanCellWidth, template.extent.YMax - r1 * template.meanCellHeight)
+		if nodata is None:
+			rast = arcpy.NumPyArrayToRaster(block, lowerLeft, template.meanCellWidth, template.meanCellHeight)
+		else:
+			rast = arcpy.NumPyArrayToRaster(block, lowerLeft, template.meanCellWidth, template.meanCellHeight, nodata)
+		tilePth = os.path.join(tmpFolder, 'tile%s.tif'%i)
+		rast.save(tilePth)
+		del rast
+		tiles.append(tilePth)
+
+	arcpy.MosaicToNewRaster_management(tiles, os.path.dirname(outPth), os.path.basename(outPth), None, _PIXEL_TYPES[arr.dtype.name], template.meanCellWidth, 1)
+
+	for fl in tiles:
+		arcpy.Delete_management(fl)
+
+	return Raster(outPth)
+
+def _sinkFeatures(fsinkg, filldem, origdem, template, tablePth, polygonPth, store, tileSize = 2048):
+	'''Summarize the sinks in a table and trace their polygons with :func:`hydro_arrays.sink_table` and :func:`hydro_arrays.sink_polygons`.
+
+	Parameters
+	----------
+	fsinkg : Raster Object
+		Sink grid, 1 in the sinks.
+	filldem : str or Raster Object
+		Filled DEM.
+	origdem : str or Raster Object
+		Original DEM, the fill depth is the filled DEM minus the original DEM.
+	template : Raster Object
+		Raster defining the extent and cell size of the arrays.
+	tablePth : str
+		Path of the output sink table.
+	polygonPth : str
+		Path of the output sink polygons, None to only write the table.
+	store : hydro_arrays.ArrayStore
+		Store to create the arrays in.
+	tileSize : int (optional)
+		Number of rows and columns processed at once, defaults to 2048.
+
+	Returns
+	-------
+	outputs : list
+		Paths of the datasets written.
+	'''
+	shape = (template.height, template.width)
+	cellsize = template.meanCellWidth
+	grid = _templateGrid(template)
+
+	mask = _rasterToStore(fsinkg, template, store.create('sinkMask', shape, bool), tileSize)
+	filled = _rasterToStore(filldem, template, store.create('sinkFilled', shape, np.float32), tileSize)
+	depth = _rasterToStore(origdem, template, store.create('sinkDepth', shape, np.float32), tileSize)
+	for r0, r1, c0, c1 in hydro_arrays.iter_tiles(shape, tileSize):
+		t = (slice(r0, r1), slice(c0, c1))
+		depth[t] = filled[t] - depth[t]
+	table, labels = hydro_arrays.sink_table(depth, filled, 1, mask, cellsize * cellsize, store.create('sinkLabels', shape, np.int32), store.create('sinkBasins', shape, np.int32), tileSize)
+	del mask, depth, filled
+	arcpy.AddMessage('	%s sinks found'%(len(table)))
+
+	# table in map coordinates, cell centers for the spill cells
+	out = np.zeros(len(table), dtype = [('sink_id', np.int32), ('cells', np.int32), ('area', np.float64), ('max_depth', np.float64), ('volume', np.float64), ('xmin', np.float64), ('ymin', np.float64), ('xmax', np.float64), ('ymax', np.float64), ('spill_x', np.float64), ('spill_y', np.float64)])
+	out['sink_id'] = table['id']
+	out['cells'] = table['cells']
+	out['area'] = table['cells'] * cellsize * cellsize
+	out['max_depth'] = table['max_depth']
+	out['volume'] = table['volume']
+	out['xmin'] = grid.xmin + table['col_min'] * cellsize
+	out['xmax'] = grid.xmin + (table['col_max'] + 1) * cellsize
+	out['ymax'] = grid.ymax - table['row_min'] * cellsize
+	out['ymin'] = grid.ymax - (table['row_max'] + 1) * cellsize
+	spill = table['spill_row'] >= 0
+	out['spill_x'] = np.where(spill, grid.xmin + (table['spill_col'] + 0.5) * cellsize, np.nan)
+	out['spill_y'] = np.where(spill, grid.ymax - (table['spill_row'] + 0.5) * cellsize, np.nan)
+	if arcpy.Exists(tablePth):
+		arcpy.Delete_management(tablePth)
+	arcpy.da.NumPyArrayToTable(out, tablePth)
+	outputs = [tablePth]
+
+	# polygons only when asked for, traced sink by sink within each bounding box
+	if polygonPth is not None:
+		if arcpy.Exists(polygonPth):
+			arcpy.Delete_management(polygonPth)
+		sr = arcpy.Describe(template).spatialReference
+		arcpy.CreateFeatureclass_management(os.path.dirname(polygonPth), os.path.basename(polygonPth), 'POLYGON', spatial_reference = sr)
+		arcpy.AddField_management(polygonPth, 'gridcode', 'LONG')
+		arcpy.AddField_management(polygonPth, 'sink_id', 'LONG')
+		with arcpy.da.InsertCursor(polygonPth, ['SHAPE@', 'gridcode', 'sink_id']) as cursor:
+			for rings, sid in hydro_arrays.sink_polygons(labels, table, grid = grid):
+				parts = arcpy.Array([arcpy.Array([arcpy.Point(x, y) for x, y in ring]) for ring in rings])
+				cursor.insertRow([arcpy.Polygon(parts, sr), 1, sid])
+		outputs.append(polygonPth)
+	del labels
+	return outputs
+
+def _hydrodemTiled(template, hucExtent, origdem, dendriteGrid, ridgeNL, bowl_polys, bowl_lines, tmpGrd, drainplug, inwallht, outwallht, agreebuf, agreesmooth, agreesharp, bowldepth, store, tileSize, tileWorkers, profiler):
+	'''Run the hydrodem stages tile by tile on memory-mapped arrays, saving hydrodem, fdr and fac to the workspace and returning the sink grid.
+
+	The fdr, fac and sink grids are written on the huc8cov extent (hucExtent) like the Spatial Analyst stages, the filled DEM on the extent of the template. Every grid is read into, and every intermediate is created in, the array store, so no stage holds more than a few tiles in memory, besides the tables of watersheds and flats that reach the tile edges. Per-cell stages loop over the tiles, AGREE and Expand use tiles padded with a halo, the bowling distance uses windows around each waterbody, the flats of the flow direction pass their distances across the tile edges (:func:`hydro_arrays.flow_direction`), and the fill and flow accumulation solve a graph of the tile edges (:func:`hydro_arrays.priority_flood_fill_tiled`, :func:`hydro_arrays.flow_accumulation_tiled`). Drain plugs are read from the drainplug feature class as cells rather than as a grid.
+	'''
+	shape = (template.height, template.width)
+	cellsize = template.meanCellWidth
+	tiles = list(hydro_arrays.iter_tiles(shape, tileSize))
+	cells = shape[0] * shape[1]
+
+	def read(name, rast, dtype):
+		return _rasterToStore(rast, template, store.create(name, shape, dtype), tileSize)
+
+	arcpy.AddMessage('	Reading grids into tiled arrays')
+	profiler.start('read grids', cells)
+	dem = read('origdem', origdem, np.float32)
+	stream = read('stream', dendriteGrid, bool)
+	huc = read('huc', ridgeNL, bool)
+	mask = read('mask', template, bool)
+	for r0, r1, c0, c1 in tiles: # honor the mask on the buffered local division
+		d = dem[r0:r1, c0:c1]
+		d[~mask[r0:r1, c0:c1]] = np.nan
+	del mask
+
+	arcpy.AddMessage('	Starting AGREE')
+	profiler.start('agree', cells)
+	elev = hydro_arrays.agree(dem, stream, int(agreebuf), int(agreesmooth), int(agreesharp), cellsize, out = store.create('elevgrid', shape, np.float32), tileSize = tileSize)
+	arcpy.AddMessage('	AGREE Complete')
+
+	arcpy.AddMessage('	Starting Walling, Bowling, Inwalling and Drain Plugs')
+	profiler.start('walling, bowling, inwalling and drain plugs', cells)
+	ridge = hydro_arrays.expand(huc, 2, out = store.create('ridge', shape, bool), tileSize = tileSize)
+	eucd = None
+	if bowl_polys is not None and bowl_lines is not None:
+		polys = read('bowlPolys', bowl_polys, bool)
+		lines = read('bowlLines', bowl_lines, bool)
+		eucd = hydro_arrays.region_distance(lines, polys, out = store.create('eucd', shape, np.float32), labels = store.create('bowlLabels', shape, np.int32), tileSize = tileSize, workers = tileWorkers) # only around the waterbodies
+		for r0, r1, c0, c1 in tiles: # to map units
+			eucd[r0:r1, c0:c1] *= cellsize
+		del polys, lines
+	else:
+		arcpy.AddMessage('	Bowling Skipped')
+	inw = None
+	if tmpGrd is not None:
+		inw = read('inwall', tmpGrd, bool)
+	else:
+		arcpy.AddMessage('	Inwalling Skipped')
+	plugs = None
+	if drainplug is not None: # a few cells, applied cell by cell
+		plugs = _drainPlugCells(drainplug, template)
+
+	# one pass over the tiles, enforcing the AGREE grid in place
+	hydro_arrays.enforce(elev, stream, ridge, huc, outwallht, eucd, bowldepth, inw, inwallht, plugs, mask = ridge, out = elev, tileSize = tileSize)
+	del stream, ridge, eucd, inw
+	arcpy.AddMessage('	Enforcement Complete')
+
+	arcpy.AddMessage("	Starting Fill")
+	profiler.start('fill', cells)
+	filled, depth = hydro_arrays.priority_flood_fill_tiled(elev, reference = dem, out = store.create('filled', shape, np.float32), depth = store.create('depth', shape, np.float32), labels = store.create('labels', shape, np.int32), tileSize = tileSize, workers = tileWorkers)
+	del elev, dem
+	arcpy.AddMessage("	Fill Complete")
+
+	profiler.start('flow direction', cells)
+	fdr = hydro_arrays.flow_direction(filled, plugs = plugs, out = store.create('fdr', shape, np.uint8), labels = store.create('flatLabels', shape, np.int32), distances = store.create('flatDistances', (2,) + shape, np.int32), tileSize = tileSize)
+	for r0, r1, c0, c1 in tiles: # clip to the local division
+		f = fdr[r0:r1, c0:c1]
+		f[~huc[r0:r1, c0:c1]] = hydro_arrays.FDR_NODATA
 
-def agree(origdem, dendrite, agreebuf, agreesmooth, agreesharp):
+	arcpy.AddMessage('	Starting Flow Accumulation')
+	profiler.start('flow accumulation', cells)
+	fac = hydro_arrays.flow_accumulation_tiled(fdr, out = store.create('fac', shape, np.uint32), tileSize = tileSize)
+	arcpy.AddMessage('	Flow Accumulation Complete')
+
+	arcpy.AddMessage('	Creating Sink Features')
+	profiler.start('sink grid', cells)
+	sink = store.create('sink', shape, np.uint8)
+	for r0, r1, c0, c1 in tiles:
+		t = (slice(r0, r1), slice(c0, c1))
+		sink[t] = (depth[t] > 1) & huc[t]
+
+	# save the grids to the workspace, fdr, fac and the sink grid on the huc8cov extent as Spatial Analyst writes them
+	hucWindow = _extentWindow(template, hucExtent)
+	profiler.start('save hydrodem', cells)
+	_storeToRaster(filled, template, os.path.join(arcpy.env.workspace,"hydrodem"), store.folder, tileSize = tileSize)
+	profiler.start('save fdr', cells)
+	_storeToRaster(fdr, template, os.path.join(arcpy.env.workspace,"fdr"), store.folder, hydro_arrays.FDR_NODATA, tileSize, hucWindow)
+	profiler.start('save fac', cells)
+	_storeToRaster(fac, template, os.path.join(arcpy.env.workspace,"fac"), store.folder, hydro_arrays.fac_nodata(fac.dtype), tileSize, hucWindow)
+	profiler.start('save sink grid', cells)
+	fsinkg = _storeToRaster(sink, template, os.path.join(arcpy.env.workspace,"fsinkg"), store.folder, 0, tileSize, hucWindow)
+	profiler.stop()
+	return fsinkg
+
+def agree(origdem, dendrite, agreebuf, agreesmooth, agreesharp, engine = 'arcpy'):
 	'''Function to adjust a DEM to match a vector.
 	
 	Parameters
@@ -554,6 +1445,8 @@ def agree(origdem, dendrite, agreebuf, agreesmooth, agreesharp):
 		Smoothing distance (same units as the vertical map units).
 	agreesharp : float
 		Distance for sharp feature (same units as the vertical map units).
+	engine : str (optional)
+		'arcpy' to use Spatial Analyst (default) or 'numpy' to use :func:`hydro_arrays.agree`, which computes the distance and allocation grids in memory, tile by tile, on the extent of the dendrite raster.
 
 	Returns
 	-------
@@ -575,6 +1468,18 @@ def agree(origdem, dendrite, agreebuf, agreesmooth, agreesharp):
 	arcpy.env.cellSize = cellsize # (L131 AGREE.aml)
 	arcpy.env.snapRaster = origdem
 
+	if engine == 'numpy':
+		arcpy.AddMessage('		Reading grids into arrays...')
+		dem = _rasterToArray(origdem, dendrite, INT_NODATA)
+		stream = _rasterToArray(dendrite, dendrite, 0) != 0
+		if arcpy.env.mask: # honor the mask the same way Spatial Analyst does
+			dem[_rasterToArray(arcpy.env.mask, dendrite, 0) == 0] = INT_NODATA
+
+		arcpy.AddMessage('		Computing modified elevation grid...')
+		elevgrid = hydro_arrays.agree(dem, stream, agreebuf, agreesmooth, agreesharp, cellsize, nodata = INT_NODATA)
+		arcpy.AddMessage('	AGREE Complete')
+		return _arrayToRaster(elevgrid, dendrite)
+
 	#arcpy.AddMessage('	Rasterizing the Dendrite.')
 	#tmpLocations = []
 	#dendriteGridPth = os.path.join(arcpy.env.workspace,'tmpDendrite') # might need to add a field for rasterization
@@ -619,10 +1524,10 @@ def agree(origdem, dendrite, agreebuf, agreesmooth, agreesharp):
 
 	return elevgrid 
 
-def adjust_accum(facPth, fdrPth, upstreamFACpths,upstreamFDRpths, workspace, version = None):
+def adjust_accum(facPth, fdrPth, upstreamFACpths,upstreamFDRpths, workspace, version = None, engine = 'arcpy', tileSize = 1024, encoding = None, scale = None):
 	'''Adjust a downstream flow accumulation (FAC) raster based on upstream flow accumulation rasters.
 
-	This function adjusts the FAC of a downstream HUC to include flow accumulations from upstream HUCs. Run this from the downstream HUC workspace. The function will leave the original FAC grids intact and will create a grid named "fac_global" in the same directory as the original FAC raster. To get true accumulation values in HUCs downstream of other non-headwater HUCs, proceed from upstream HUCs to downstream HUCs in order, and specify the fac_global grid for any upstream HUC that has one. (It is not essential that the fac_global contain true global fac values, and in some cases it is not possible since the values get too large to be stored in a raster file. In practice, as long as the receiving cells have accumulation values larger than the stream definition threshold (150,000 cells for 10-m grids), then the ESRI ArcHydro data model will still function.
+	This function adjusts the FAC of a downstream HUC to include flow accumulations from upstream HUCs. Run this from the downstream HUC workspace. The function will leave the original FAC grids intact and will create a grid named "fac_global" in the same directory as the original FAC raster. To get true accumulation values in HUCs downstream of other non-headwater HUCs, proceed from upstream HUCs to downstream HUCs in order, and specify the fac_global grid for any upstream HUC that has one, or use :func:`batch.adjust_accum_batch` to do this for every local folder. (It is not essential that the fac_global contain true global fac values, and in some cases it is not possible since the values get too large to be stored in a raster file. In practice, as long as the receiving cells have accumulation values larger than the stream definition threshold (150,000 cells for 10-m grids), then the ESRI ArcHydro data model will still function.
 
 	Parameters
 	----------
@@ -638,6 +1543,14 @@ def adjust_accum(facPth, fdrPth, upstreamFACpths,upstreamFDRpths, workspace, ver
 		local geodatabase to work in.
 	version : str (optional)
 		Stream Stats datapreptool version number.
+	engine : str (optional)
+		'arcpy' to trace the path from each inlet with CostPath (default) or 'numpy' to follow the downstream flow directions from all the inlets at once with :func:`hydro_arrays.propagate_paths`, reading and rewriting only the blocks the paths cross.
+	tileSize : int (optional)
+		Number of rows and columns in the blocks read and written by the numpy engine, defaults to 1024.
+	encoding : str (optional)
+		Compact encoding of fac_global for the numpy engine, 'scaled' or 'log' uint32 codes (see :func:`hydro_arrays.encode_accumulation`), defaults to None to keep the type of the FAC, clipping values too large for it. Either way the numpy engine adds in 64 bits and saves the true values of the cells it raised in fac_global_accumulation.npz next to the geodatabase, and those values are read back when fac_global is used upstream of another HUC.
+	scale : float (optional)
+		Scale of the encoding, see :data:`hydro_arrays.ACCUMULATION_SCALES` for the defaults.
 	
 	Returns
 	-------
@@ -666,75 +1579,36 @@ def adjust_accum(facPth, fdrPth, upstreamFACpths,upstreamFDRpths, workspace, ver
 	for fl in upstreamFDRpths:
 		assert arcpy.Exists(fl), "Raster %s does not exist"%(fl)
 
-	# load the upstream rasters into a structure
-	upstreamFACs = []
-	upstreamFDRs = []
-	for fac,fdr in zip(upstreamFACpths,upstreamFDRpths):
-		upstreamFACs.append(Raster(fac))
-		upstreamFDRs.append(Raster(fdr))
-
 	downstream = Raster(facPth) # load the downstream raster
 	downstreamFDR = Raster(fdrPth)
 
-	# get raster cell dimensions
-	dsc = arcpy.Describe(downstream)
-	dx = dsc.children[0].MeanCellWidth
-	dy = dsc.children[0].MeanCellHeight
+	downGrid = _templateGrid(downstream)
 
 	arcpy.AddMessage("Processing upstream rasters...")
+	arcpy.env.overwriteOutput = True
+	inlets = []
+	inflows = [] # inlet of each upstream grid, kept so a change upstream can be propagated alone
+	for facUp,fdrUp in zip(upstreamFACpths,upstreamFDRpths): # iterate through the rasters
+		cell, facMax = _upstreamInlet(facUp, fdrUp, downGrid)
+		if cell is None:
+			arcpy.AddMessage('	The outlet of %s does not flow into %s, skipping it.'%(facUp, facPth))
+			continue
+		inlets.append((cell, facMax))
+		inflows.append({'fac': facUp, 'fdr': fdrUp, 'row': cell[0], 'col': cell[1], 'value': facMax})
+
+	if engine == 'numpy':
+		# walk the downstream flow directions from every inlet in one pass and add to the cells on the paths
+		arcpy.AddMessage("Following the flow paths from %s inlets."%(len(inlets)))
+		cells, totals = hydro_arrays.propagate_paths(_RasterBlocks(downstreamFDR, hydro_arrays.FDR_NODATA), [cell for cell, facMax in inlets], [facMax for cell, facMax in inlets], tileSize)
+		arcpy.AddMessage("Correcting downstream FAC.")
+		_addToCells(downstream, os.path.join(workspace, "fac_global"), cells, totals, encoding, scale, tileSize)
+		with open(_inflowsPth(os.path.join(workspace, "fac_global")), 'w') as fl:
+			json.dump({'fac': facPth, 'fdr': fdrPth, 'inflows': inflows}, fl, indent = 1)
+		return None
+
 	costPaths = []
-	for fac,fdr in zip(upstreamFACs,upstreamFDRs): # iterate through the rasters
-		arcpy.env.extent = fac
-		arcpy.env.cellSize = fac
-		arcpy.env.overwriteOutput = True
-
-		loc = Con(fac == fac.maximum,fdr) # make a locator raster of the outlet of the outlet
-		#flowDir = int(loc.maximum) # get the flow direction of the selected cell
-
-		# now get the location of the cell...
-		arcpy.RasterToPoint_conversion(loc,"pt") # conver to feature class
-		with arcpy.da.SearchCursor("pt",["grid_code","SHAPE@X","SHAPE@Y"]) as cursor: # read the data
-			with arcpy.da.UpdateCursor("pt",["SHAPE@X","SHAPE@Y"]) as updateCursor: # update the data
-				for row, uprow in zip(cursor,updateCursor):
-					# extract coordinates
-					flowDir = row[0]
-					x = row[1]
-					y = row[2]
-
-					# figure out the correction
-					if flowDir == 1: # east
-						xCoor = dx
-						yCoor = 0
-					elif flowDir == 2: # southeast
-						xCoor = dx
-						yCoor = dy*-1
-					elif flowDir == 4: # south
-						xCoor = 0
-						yCoor = dy * -1
-					elif flowDir == 8: # southwest
-						xCoor = dx
-						yCoor = dy * -1
-					elif flowDir == 16: # west
-						xCoor = dx * -1
-						yCoor = 0
-					elif flowDir == 32: # northwest
-						xCoor = dx * -1
-						yCoor = dy
-					elif flowDir == 64: # north
-						xCoor = 0
-						yCoor = dy
-					elif flowDir == 128: # northeast
-						xCoor = dx
-						yCoor = dy
-
-					# update their position
-					x += xCoor
-					y += yCoor
-
-					# insert back into feature class
-					uprow[0] = x
-					uprow[1] = y
-					updateCursor.updateRow(uprow)
+	for cell, facMax in inlets:
+		pt = _cellRaster(cell[0], cell[1], downstream) # single cell source raster at the receiving cell
 
 		# now trace the least cost downstream from the point
 		arcpy.env.extent = downstream
@@ -743,14 +1617,12 @@ def adjust_accum(facPth, fdrPth, upstreamFACpths,upstreamFDRpths, workspace, ver
 		ones = Con(IsNull(downstream) == 0,1) # make a constant raster
 
 		#ones.save("constant")
-		costPth = CostPath("pt",ones,downstreamFDR,path_type = "EACH_CELL") # trace path and append to list
+		costPth = CostPath(pt,ones,downstreamFDR,path_type = "EACH_CELL") # trace path and append to list
 
-		tmp = Con(IsNull(costPth)==0,fac.maximum,0)
+		tmp = Con(IsNull(costPth)==0,facMax,0)
 		#tmp.save("costPath")
 		costPaths.append(tmp) # attribute the cost path with the fac max value, all the cost paths will be added together later.
 
-		if arcpy.Exists("pt"): arcpy.Delete_management("pt") # clean up
-
 	# now that all cost paths have been generatate, sum them with the downstream FAC gid to get the final FAC grid.
 	arcpy.AddMessage("Correcting downstream FAC.")
 	arcpy.env.extent = downstream
@@ -760,11 +1632,126 @@ def adjust_accum(facPth, fdrPth, upstreamFACpths,upstreamFDRpths, workspace, ver
 		downstream += pth
 
 	downstream.save("fac_global")
+	for fl in [_accumulationPth(os.path.join(workspace, "fac_global")), _inflowsPth(os.path.join(workspace, "fac_global"))]: # files left by the numpy engine no longer apply
+		if os.path.exists(fl):
+			os.remove(fl)
+
+def _outletCell(facPth):
+	'''Row, column and true accumulation of the largest cell of an accumulation raster, such as the outlet of fac or fac_global, and the raster.
+
+	The raster is read one block at a time. A fac_global written by the numpy engine may hold encoded or clipped values, so the true values saved next to it (:func:`_accumulationPth`) are used.
+	'''
+	fac = Raster(facPth)
+	row, col, facMax = _rasterMaxCell(fac)
+	facMax = facMax.item()
+	if os.path.exists(_accumulationPth(facPth)):
+		accumulation = hydro_arrays.load_accumulation(_accumulationPth(facPth))
+		facMax = hydro_arrays.accumulation_values(accumulation, [row * fac.width + col], [facMax])[0].item()
+		saved = accumulation['values']
+		if len(saved) and saved.max() > facMax: # clipped in the raster, so not its largest cell
+			i = int(np.argmax(saved))
+			row, col = divmod(int(accumulation['cells'][i]), fac.width)
+			facMax = saved[i].item()
+	return fac, row, col, facMax
+
+def _upstreamInlet(facUpPth, fdrUpPth, downGrid):
+	'''Find the outlet of an upstream flow accumulation grid, reading it one block at a time, and the cell of a downstream grid it flows into.
+
+	Returns the cell, None if the outlet does not flow into the downstream grid, and the true accumulation at the outlet, read from the saved values of a fac_global written by the numpy engine.
+	'''
+	fac, row, col, facMax = _outletCell(facUpPth)
+	flowDir = _rasterCell(fdrUpPth, fac.extent.XMin + (col + 0.5) * fac.meanCellWidth, fac.extent.YMax - (row + 0.5) * fac.meanCellHeight)
+	try:
+		cell = hydro_arrays.receiving_cell(row, col, flowDir, _templateGrid(fac), downGrid)
+	except ValueError: # a sink or NoData, the outlet drains nowhere
+		cell = None
+	return cell, facMax
+
+def update_accum(facGlobalPth, upstreamFACpth, tileSize = 1024, version = None):
+	'''Update a fac_global raster after one of the grids upstream of it changed, propagating only the change.
+
+	:func:`adjust_accum` with the numpy engine records the inlet and value of each upstream grid. The changed grid's outlet is found again and the difference to the recorded inflow is walked down the flow directions from the inlet, so only the cells on that path are read and rewritten. If the inlet moved, the old value is removed along the old path and the new one added along the new path.
+
+	Parameters
+	----------
+	facGlobalPth : str
+		Path to the fac_global raster written by :func:`adjust_accum` with the numpy engine.
+	upstreamFACpth : str
+		Path to the upstream flow accumulation grid that changed, as it was passed to :func:`adjust_accum`.
+	tileSize : int (optional)
+		Number of rows and columns in the blocks read and written, defaults to 1024.
+	version : str (optional)
+		Stream Stats datapreptool version number.
+
+	Returns
+	-------
+	delta : float
+		Change of the inflow, which is also the change of the accumulation at the outlet of fac_global.
+	'''
+	if version:
+		arcpy.AddMessage('StreamStats Data Preparation Tools version: %s'%(version))
+
+	assert os.path.exists(_inflowsPth(facGlobalPth)), "%s was not written by adjust_accum with the numpy engine"%(facGlobalPth)
+	with open(_inflowsPth(facGlobalPth)) as fl:
+		record = json.load(fl)
+
+	def samePath(a, b):
+		return os.path.normcase(os.path.abspath(a)) == os.path.normcase(os.path.abspath(b))
+
+	entries = [entry for entry in record['inflows'] if samePath(entry['fac'], upstreamFACpth)]
+	assert entries, "%s does not flow into %s"%(upstreamFACpth, facGlobalPth)
+	entry = entries[0]
+
+	cell, facMax = _upstreamInlet(upstreamFACpth, entry['fdr'], _templateGrid(Raster(facGlobalPth)))
+	oldCell = (entry['row'], entry['col'])
+	starts = [oldCell] + ([cell] if cell is not None else [])
+	values = [-entry['value']] + ([facMax] if cell is not None else [])
+	delta = (facMax if cell is not None else 0) - entry['value']
+	arcpy.AddMessage('Inflow from %s changed by %s.'%(upstreamFACpth, delta))
+
+	if delta != 0 or (cell is not None and tuple(cell) != oldCell):
+		cells, totals = hydro_arrays.propagate_paths(_RasterBlocks(record['fdr'], hydro_arrays.FDR_NODATA), starts, values, tileSize)
+		changed = totals != 0
+		_updateCells(facGlobalPth, cells[changed], totals[changed], tileSize)
+
+	if cell is None:
+		record['inflows'].remove(entry)
+	else:
+		entry.update({'row': cell[0], 'col': cell[1], 'value': facMax})
+	with open(_inflowsPth(facGlobalPth), 'w') as fl:
+		json.dump(record, fl, indent = 1)
+
+	return delta
+
+def find_outlet(facPth, fdrPth):
+	'''Find the outlet of a flow accumulation grid, its largest cell, and the point it drains to.
+
+	Parameters
+	----------
+	facPth : str
+		Path to the flow accumulation grid, fac or fac_global.
+	fdrPth : str
+		Path to the flow direction grid.
+
+	Returns
+	-------
+	outlet : dict
+		fac, the true accumulation at the outlet (decoded for a fac_global written with an encoding), x and y, the center of the cell the outlet flows into (None if the outlet is a sink), and extent, the [xmin, ymin, xmax, ymax] of the grid.
+	'''
+	fac, row, col, facMax = _outletCell(facPth)
+	flowDir = _rasterCell(fdrPth, fac.extent.XMin + (col + 0.5) * fac.meanCellWidth, fac.extent.YMax - (row + 0.5) * fac.meanCellHeight)
+	try:
+		x, y = hydro_arrays.receiving_point(row, col, flowDir, _templateGrid(fac))
+	except ValueError: # a sink or NoData, the outlet drains nowhere
+		x, y = None, None
+	return {'fac': facMax, 'x': x, 'y': y, 'extent': [fac.extent.XMin, fac.extent.YMin, fac.extent.XMax, fac.extent.YMax]}
 
-def adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval, version=None):
+def adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval, version=None, incrField=None, tileSize=1024, engine='arcpy'):
 	'''Simple flow accumulation grid adjustment.
 
 	Adds a value to the flow accumulation grid given an input point using a least-cost-path to cascade down through the flow direction grid.
+
+	The numpy engine streams the adjustment instead: the paths from all the points are walked down fdrin together with :func:`hydro_arrays.propagate_paths` and facout is written once as a copy of facin with only the blocks the paths cross rewritten, without the costPath and corr rasters. NoData cells of facin stay NoData and the true values of the raised cells are kept in 64 bits as in :func:`adjust_accum`. Without incrField, every cell on any of the paths is raised by incrval once, as by the costPath raster, however many paths cross it. With incrField, every point in ptin is an inlet with its own value and the values of overlapping paths are summed.
 	
 	Parameters
 	----------
@@ -779,9 +1766,15 @@ def adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval, version=None
 	facout : str (raster)
 		Output name of adjusted FAC grid.
 	incrval : int
-		Value to adjust the downstream FAC grid by.
+		Value to adjust the downstream FAC grid by, used for points with no value in incrField.
 	version : str
 		Stream Stats version number.
+	incrField : str (optional)
+		Field of ptin holding the value to add downstream of each point, uses the numpy engine, defaults to None to add incrval downstream of every point.
+	tileSize : int (optional)
+		Number of rows and columns in the blocks read and written by the numpy engine, defaults to 1024.
+	engine : str (optional)
+		'arcpy' to trace the paths with CostPath and correct the grid with map algebra (default) or 'numpy' to stream the adjustment block by block.
 
 	Returns
 	-------
@@ -804,6 +1797,19 @@ def adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval, version=None
 	arcpy.env.extent = fdrin
 	arcpy.env.overwriteOutput = True
 
+	if incrField is not None or engine == 'numpy':
+		FAC = Raster(facin)
+		assert (FAC.height, FAC.width) == (Raster(fdrin).height, Raster(fdrin).width), "%s and %s do not have the same number of rows and columns."%(facin, fdrin)
+		starts, values = _inletCells(ptin, incrField, incrval, FAC)
+		arcpy.AddMessage("\tFollowing the flow paths from %s inlets."%(len(starts)))
+		cells, totals = hydro_arrays.propagate_paths(_RasterBlocks(fdrin, hydro_arrays.FDR_NODATA), starts, values, tileSize)
+		if incrField is None: # as Con(costPth, incrval), once on each cell of the paths
+			totals = np.full_like(totals, incrval)
+		arcpy.AddMessage("\tApplying corretion.")
+		_addToCells(FAC, os.path.join(arcpy.env.workspace, facout), cells, totals, tileSize = tileSize)
+		arcpy.AddMessage("\tDone!")
+		return None
+
 	if sys.version_info[0] >= 3:
 		arcpy.AddMessage("\tComputing least-cost-path.")
 		costPth = CostPath(ptin,filin,fdrin,path_type = "EACH_CELL", force_flow_direction_convention = "FLOW_DIRECTION", destination_field = "OBJECTID") # compute least cost path downstream from inlet point.
@@ -826,7 +1832,89 @@ def adjust_accum_simple(ptin, fdrin, facin, filin, facout, incrval, version=None
 	arcpy.AddMessage("\tDone!")
 	return None
 
-def postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = None, version = None):
+def _streamGrids(fac, fdrPth, thresh1, thresh2, store, tileSize = 2048):
+	'''Define the str and str<thresh2> grids and number the stream links with arrays.
+
+	The flow accumulation grid is read once, one tile at a time, and only the flow directions of the str cells are read, from the tiles holding them, to number the links with :func:`hydro_arrays.stream_links`.
+
+	Parameters
+	----------
+	fac : Raster Object
+		Flow accumulation grid.
+	fdrPth : str
+		Path to the flow direction grid.
+	thresh1 : int
+		Threshold of the str grid, in raster cells.
+	thresh2 : int
+		Threshold of the str<thresh2> grid, in raster cells.
+	store : hydro_arrays.ArrayStore
+		Store creating the output arrays.
+	tileSize : int (optional)
+		Number of rows and columns read at once, defaults to 2048.
+
+	Returns
+	-------
+	grids : tuple
+		(str, str<thresh2>, lnk) arrays, 0 off the streams.
+	cells : ndarray
+		Sorted flat indices of the str cells.
+	links : ndarray
+		Link number of each str cell.
+	'''
+	shape = (fac.height, fac.width)
+	stream = store.create('str', shape, np.uint8)
+	stream2 = store.create('str2', shape, np.uint8)
+	cells = []
+	for r0, r1, c0, c1 in hydro_arrays.iter_tiles(shape, tileSize):
+		lowerLeft = arcpy.Point(fac.extent.XMin + c0 * fac.meanCellWidth, fac.extent.YMax - r1 * fac.meanCellHeight)
+		block = arcpy.RasterToNumPyArray(fac, lowerLeft, c1 - c0, r1 - r0)
+		valid = np.ones(block.shape, dtype=bool) if fac.noDataValue is None else block != block.dtype.type(fac.noDataValue)
+		tile = valid & (block > thresh1)
+		stream[r0:r1, c0:c1] = tile
+		stream2[r0:r1, c0:c1] = valid & (block > thresh2)
+		br, bc = np.nonzero(tile)
+		cells.append((br + r0) * shape[1] + bc + c0)
+	cells = np.sort(np.concatenate(cells))
+
+	# flow directions of the stream cells only, tile by tile
+	fdr = _RasterBlocks(fdrPth, hydro_arrays.FDR_NODATA)
+	rows, cols = np.divmod(cells, shape[1])
+	codes = np.full(len(cells), hydro_arrays.FDR_NODATA, dtype=np.uint8)
+	for r0, r1, c0, c1 in hydro_arrays.iter_tiles(shape, tileSize):
+		sel = np.nonzero((rows >= r0) & (rows < r1) & (cols >= c0) & (cols < c1))[0]
+		if len(sel):
+			codes[sel] = fdr[r0:r1, c0:c1][rows[sel] - r0, cols[sel] - c0]
+	links = hydro_arrays.stream_links(cells, codes, shape)
+
+	lnk = store.create('lnk', shape, np.int32, 0)
+	lnk.reshape(-1)[cells] = links
+	return (stream, stream2, lnk), cells, links
+
+def _catchmentGrid(fac, fdrPth, lnkPth, catPth, tmpFolder, tileSize = 2048):
+	'''Delineate the cat grid from the flow direction and link grids with :func:`hydro_arrays.catchment_grid`, reading both grids a block at a time.'''
+	store = hydro_arrays.ArrayStore(tmpFolder)
+	try:
+		cat = store.create('cat', (fac.height, fac.width), np.int32)
+		hydro_arrays.catchment_grid(_RasterBlocks(fdrPth, hydro_arrays.FDR_NODATA), _RasterBlocks(lnkPth, 0), out = cat, tileSize = tileSize)
+		_storeToRaster(cat, fac, catPth, tmpFolder, 0, tileSize)
+		del cat
+	finally:
+		store.cleanup()
+
+def _drainagePoints(fac, catPth, dpPth, tileSize = 2048):
+	'''Write a point at the cell of greatest flow accumulation in each catchment, found with :func:`hydro_arrays.catchment_outlets`, in one bulk insert.'''
+	outlets = hydro_arrays.catchment_outlets(_RasterBlocks(fac, fac.noDataValue), _RasterBlocks(catPth, 0), fac.noDataValue, tileSize)
+	points = np.zeros(len(outlets), dtype = [('x', np.float64), ('y', np.float64), ('GridID', np.int32), ('fac', np.float64)])
+	points['x'] = fac.extent.XMin + (outlets['col'] + 0.5) * fac.meanCellWidth # cell centers
+	points['y'] = fac.extent.YMax - (outlets['row'] + 0.5) * fac.meanCellHeight
+	points['GridID'] = outlets['id']
+	points['fac'] = outlets['value']
+	if arcpy.Exists(dpPth):
+		arcpy.Delete_management(dpPth)
+	arcpy.da.NumPyArrayToFeatureClass(points, dpPth, ('x', 'y'), arcpy.Describe(fac).spatialReference)
+	return len(points)
+
+def postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = None, version = None, engine = 'arcpy', tileSize = 2048):
 	'''Generate stream reaches, adjoint catchments, and drainage points
 
 	Parameters
@@ -845,6 +1933,10 @@ def postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = None, v
 		Path to the snklnk grid, optional.
 	version : str (optional)
 		StreamStats DataPrepTools version to be printed.
+	engine : str (optional)
+		'arcpy' to define the streams and links with Spatial Analyst and the catchments and drainage points with ArcHydro (default) or 'numpy' to do all three with arrays, see :func:`hydro_arrays.stream_links`, :func:`hydro_arrays.catchment_grid` and :func:`hydro_arrays.catchment_outlets`. The numpy engine also runs in Python 3, where the steps needing ArcHydro are skipped.
+	tileSize : int (optional)
+		Number of rows and columns read and written at once by the numpy engine, defaults to 2048.
 
 	Returns
 	-------
@@ -869,17 +1961,20 @@ def postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = None, v
 		
 	Notes
 	-----
-	This tool requires ESRI ArcHydro to be installed and currently only works with Python 2.
+	This tool requires ESRI ArcHydro to be installed and currently only works with Python 2. With the numpy engine the str, str<thresh2>, lnk and cat grids and the drainagePoint features are also made in Python 3, without ArcHydro, in which case a sink link grid is not merged into the lnk grid.
 	'''
 
 	if version:
 		arcpy.AddMessage('StreamStats Data Preparation Tools version: %s'%(version))
 
 	pyVer = int(sys.version[:1])
+	archydro = pyVer == 2
 
-	if pyVer == 3: # for python 3
+	if pyVer == 3 and engine != 'numpy': # for python 3
 		arcpy.AddMessage("This tool only runs in Python 2....")
 		sys.exit(0)
+	elif pyVer == 3:
+		arcpy.AddMessage("ArcHydro is not available in Python 3, only the raster steps will be run....")
 		#from archydro.streamdefinition import StreamDefinition
 		#from archydro.streamsegmentation import StreamSegmentation
 		#from archydro.drainagelineprocessing import DrainageLineProcessing
@@ -909,32 +2004,59 @@ def postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = None, v
 	finalSpace = os.path.split(workspace)[0]
 
 	fac = Raster(facPth)
-	# generate the str900 grid
 	str900Pth = os.path.join(finalSpace,'str'+str(thresh2))
-	str900 = Con(fac > thresh2,1,None)
-	str900.save(str900Pth)
-	arcpy.AddMessage("	str%s created."%(str(thresh2)))
-
-	# generate the str grid
 	streamPth = os.path.join(finalSpace,'str')
-	stream = Con(fac > thresh1,1,None)
-	stream.save(streamPth)
-	arcpy.AddMessage("	str raster created.")
-
-	# generate the stream link grid
 	if sinksPth != None:
 		lnkPth = os.path.join(finalSpace,'strlnk')
 	else:
 		lnkPth = os.path.join(finalSpace, 'lnk')
-	
-	lnk = StreamLink(stream,fdrPth)
-	lnk.save(lnkPth)
-	arcpy.AddMessage("	lnk raster created.")
 
-	del lnk
-	del stream
+	if engine == 'numpy':
+		# one pass over fac, links numbered from the sparse stream cells
+		tmpFolder = _arrayFolder(workspace, 'posthydrodem_arrays')
+		store = hydro_arrays.ArrayStore(tmpFolder)
+		try:
+			(stream, str900, lnk), cells, links = _streamGrids(fac, fdrPth, thresh1, thresh2, store, tileSize)
+			_storeToRaster(str900, fac, str900Pth, tmpFolder, 0, tileSize)
+			arcpy.AddMessage("	str%s created."%(str(thresh2)))
+			_storeToRaster(stream, fac, streamPth, tmpFolder, 0, tileSize)
+			arcpy.AddMessage("	str raster created.")
+			_storeToRaster(lnk, fac, lnkPth, tmpFolder, 0, tileSize)
+			arcpy.AddMessage("	lnk raster created, %s links."%(len(np.unique(links))))
+			del stream, str900, lnk
+		finally:
+			store.cleanup()
+	else:
+		# generate the str900 grid
+		str900 = Con(fac > thresh2,1,None)
+		str900.save(str900Pth)
+		arcpy.AddMessage("	str%s created."%(str(thresh2)))
+
+		# generate the str grid
+		stream = Con(fac > thresh1,1,None)
+		stream.save(streamPth)
+		arcpy.AddMessage("	str raster created.")
+
+		# generate the stream link grid
+		lnk = StreamLink(stream,fdrPth)
+		lnk.save(lnkPth)
+		arcpy.AddMessage("	lnk raster created.")
+
+		del lnk
+		del stream
+
+	catPth = os.path.join(finalSpace,'cat')
+	if not archydro:
+		_catchmentGrid(fac, fdrPth, lnkPth, catPth, _arrayFolder(workspace, 'posthydrodem_arrays'), tileSize)
+		arcpy.AddMessage("	Cat raster created.")
+		arcpy.CreateFeatureDataset_management(workspace,'Layers',arcpy.Describe(facPth).spatialReference)
+		npts = _drainagePoints(fac, catPth, os.path.join(workspace,'Layers','drainagePoint'), tileSize)
+		arcpy.AddMessage("	DrainagePoint features created, %s points."%(npts))
+		arcpy.AddMessage("	Skipping the ArcHydro feature classes.")
+		rasters = ['hydrodem','fac','fdr', 'hydrodemfac_global']
+		moveRasters(workspace,finalSpace,rasters)
+		return
 
-	
 	sr = arcpy.Describe(facPth).spatialReference
 	arcpy.CreateFeatureDataset_management(workspace,'Layers',sr) # create featureDataset
 
@@ -950,8 +2072,10 @@ def postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = None, v
 			lnkPth = newlnkPth
 			arcpy.AddMessage("	snklnk merged with lnk raster.")
 
-	catPth = os.path.join(finalSpace,'cat')
-	CatchmentGridDelineation(fdrPth,lnkPth,catPth)
+	if engine == 'numpy':
+		_catchmentGrid(fac, fdrPth, lnkPth, catPth, _arrayFolder(workspace, 'posthydrodem_arrays'), tileSize)
+	else:
+		CatchmentGridDelineation(fdrPth,lnkPth,catPth)
 	arcpy.AddMessage("	Cat raster created.")
 
 	catchmentPth = os.path.join(workspace,'catchment_tmp')
@@ -966,7 +2090,10 @@ def postHydroDEM(workspace, facPth, fdrPth, thresh1, thresh2, sinksPth = None, v
 	arcpy.AddMessage("	AdjointCatchment features created.")
 
 	dpPth = os.path.join(workspace,'drainagePoint_tmp')
-	DrainagePointProcessing(facPth,catPth, catchmentPth,dpPth)
+	if engine == 'numpy':
+		_drainagePoints(fac, catPth, dpPth, tileSize)
+	else:
+		DrainagePointProcessing(facPth,catPth, catchmentPth,dpPth)
 	arcpy.Copy_management(dpPth, os.path.join(workspace,'Layers','drainagePoint'))
 	arcpy.AddMessage("	DrainagePoint features created.")
 
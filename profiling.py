@@ -0,0 +1,200 @@
+'''Per-stage profiling for long running workflows.
+
+A :class:`StageProfiler` measures each named stage of a workflow and appends one JSON record per stage to a JSON-lines file, so the cost of every stage can be compared across runs, e.g. across all the local folders of a state. Each record holds the wall time, CPU time, resident memory, number of cells processed and bytes read and written by the process during the stage.
+
+This module does not require ESRI ArcPy.
+'''
+import json
+import os
+import sys
+import time
+
+from hydro_arrays import peak_rss
+
+def io_counters():
+	'''Bytes read and written by this process so far, None if the platform does not report them.
+
+	Returns
+	-------
+	counters : tuple
+		(bytes read, bytes written), or None.
+	'''
+	if sys.platform.startswith('linux'):
+		try:
+			counters = {}
+			with open('/proc/self/io') as fl:
+				for line in fl:
+					name, value = line.split(':')
+					counters[name] = int(value)
+			return counters['rchar'], counters['wchar'] # includes reads served from the page cache
+		except (IOError, OSError, KeyError, ValueError):
+			return None
+	if sys.platform == 'win32':
+		try:
+			import ctypes
+
+			class IO_COUNTERS(ctypes.Structure):
+				_fields_ = [(name, ctypes.c_ulonglong) for name in ['ReadOperationCount', 'WriteOperationCount', 'OtherOperationCount', 'ReadTransferCount', 'WriteTransferCount', 'OtherTransferCount']]
+
+			counters = IO_COUNTERS()
+			process = ctypes.windll.kernel32.GetCurrentProcess()
+			if not ctypes.windll.kernel32.GetProcessIoCounters(process, ctypes.byref(counters)):
+				return None
+			return int(counters.ReadTransferCount), int(counters.WriteTransferCount)
+		except (AttributeError, OSError):
+			return None
+	return None
+
+def _procStatus(field):
+	'''Size of a memory field of /proc/self/status in bytes, e.g. VmRSS or VmHWM, None if it cannot be read.'''
+	try:
+		with open('/proc/self/status') as fl:
+			for line in fl:
+				if line.startswith(field + ':'):
+					return int(line.split()[1]) * 1024 # reported in kB
+	except (IOError, OSError, ValueError):
+		pass
+	return None
+
+def current_rss():
+	'''Resident set size of this process in bytes, None if the platform does not report it.'''
+	if sys.platform.startswith('linux'):
+		return _procStatus('VmRSS')
+	if sys.platform == 'win32':
+		try:
+			import ctypes
+			from ctypes import wintypes
+
+			class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+				_fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD), ('PeakWorkingSetSize', ctypes.c_size_t), ('WorkingSetSize', ctypes.c_size_t), ('QuotaPeakPagedPoolUsage', ctypes.c_size_t), ('QuotaPagedPoolUsage', ctypes.c_size_t), ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t), ('QuotaNonPagedPoolUsage', ctypes.c_size_t), ('PagefileUsage', ctypes.c_size_t), ('PeakPagefileUsage', ctypes.c_size_t)]
+
+			counters = PROCESS_MEMORY_COUNTERS()
+			counters.cb = ctypes.sizeof(counters)
+			process = ctypes.windll.kernel32.GetCurrentProcess()
+			if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+				return None
+			return int(counters.WorkingSetSize)
+		except (AttributeError, OSError):
+			return None
+	return None
+
+def reset_peak_rss():
+	'''Reset the peak resident set size of this process, so the next :func:`stage_peak_rss` covers only what follows. Only Linux supports this, returns whether it was reset.'''
+	if not sys.platform.startswith('linux'):
+		return False
+	try:
+		with open('/proc/self/clear_refs', 'w') as fl:
+			fl.write('5') # resets VmHWM to the current RSS
+		return True
+	except (IOError, OSError):
+		return False
+
+def stage_peak_rss():
+	'''Peak resident set size in bytes since the last :func:`reset_peak_rss`, None if it cannot be read.'''
+	return _procStatus('VmHWM')
+
+def _cpuTime():
+	'''User plus system CPU time of this process in seconds.'''
+	t = os.times()
+	return t[0] + t[1]
+
+class StageProfiler(object):
+	'''Measure the stages of a workflow and append a record per stage to a JSON-lines file.
+
+	Stages are run one after the other: :meth:`start` begins a stage, ending the one before it, and :meth:`stop` ends the current stage. Used as a context manager, the stage in progress is ended on leaving the block, and recorded with the error if the block raised.
+
+		profiler = StageProfiler('profile.jsonl', run = {'workspace': ws})
+		with profiler:
+			profiler.start('agree', cells = nrows * ncols)
+			...
+			profiler.start('fill')
+			...
+
+	On Linux the peak resident memory is reset at the start of every stage, so peak_rss_bytes is the peak of that stage alone. Elsewhere it is None and only the resident memory at the start and end of the stage and their difference are recorded.
+
+	Parameters
+	----------
+	path : str
+		Path to the JSON-lines file to append to, None to disable profiling.
+	run : dict (optional)
+		Fields added to every record, e.g. the workspace being processed.
+	'''
+
+	def __init__(self, path, run = None):
+		self.path = path
+		self.run = dict(run or {})
+		self.run.setdefault('run_id', '%s-%s'%(time.strftime('%Y%m%dT%H%M%S'), os.getpid()))
+		self.current = None
+		self.peak = None # largest stage peak, resetting the peak also resets the process peak
+
+	@property
+	def enabled(self):
+		return self.path is not None
+
+	def start(self, stage, cells = None):
+		'''Begin a stage, ending the current one.
+
+		Parameters
+		----------
+		stage : str
+			Name of the stage.
+		cells : int (optional)
+			Number of grid cells the stage processes.
+		'''
+		if not self.enabled:
+			return
+		self.stop()
+		self.current = {'stage': stage, 'cells': cells, 'wall': time.time(), 'cpu': _cpuTime(), 'io': io_counters(), 'peak': reset_peak_rss(), 'rss': current_rss()}
+
+	def cells(self, cells):
+		'''Set the number of cells processed by the current stage, once it is known.'''
+		if self.current is not None:
+			self.current['cells'] = cells
+
+	def stop(self, error = None):
+		'''End the current stage and append its record.
+
+		Parameters
+		----------
+		error : str (optional)
+			Error that ended the stage, None if it completed.
+		'''
+		if self.current is None:
+			return
+		cur = self.current
+		self.current = None
+		io = io_counters()
+		rss = current_rss()
+		stagePeak = stage_peak_rss() if cur['peak'] else None
+		if stagePeak is not None:
+			self.peak = max(self.peak or 0, stagePeak)
+		record = dict(self.run)
+		record.update({
+			'stage': cur['stage'],
+			'start': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(cur['wall'])),
+			'wall_seconds': round(time.time() - cur['wall'], 3),
+			'cpu_seconds': round(_cpuTime() - cur['cpu'], 3),
+			'peak_rss_bytes': stagePeak,
+			'rss_start_bytes': cur['rss'],
+			'rss_end_bytes': rss,
+			'rss_delta_bytes': rss - cur['rss'] if rss is not None and cur['rss'] is not None else None,
+			'process_peak_rss_bytes': self.process_peak_rss(),
+			'error': error,
+			'cells': cur['cells'],
+			'bytes_read': io[0] - cur['io'][0] if io and cur['io'] else None,
+			'bytes_written': io[1] - cur['io'][1] if io and cur['io'] else None,
+		})
+		with open(self.path, 'a') as fl:
+			fl.write(json.dumps(record, sort_keys = True) + '\n')
+
+	def process_peak_rss(self):
+		'''Peak resident set size of the process so far in bytes, including the stages already recorded, None if it cannot be determined.'''
+		peaks = [rss for rss in [self.peak, peak_rss()] if rss is not None]
+		return max(peaks) if peaks else None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, excType, exc, tb):
+		self.stop(None if excType is None else ('%s: %s'%(excType.__name__, exc)).strip())
+		return False
@@ -0,0 +1,15 @@
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # the modules are not installed, import them from the repository
+
+try:
+	import arcpy
+except ImportError: # a stand-in so the modules import without ArcGIS, the tests stub the arcpy calls they reach
+	arcpy = types.ModuleType('arcpy')
+	arcpy.sa = types.ModuleType('arcpy.sa')
+	arcpy.CheckOutExtension = lambda extension: None
+	arcpy.AddMessage = lambda msg: None
+	sys.modules['arcpy'] = arcpy
+	sys.modules['arcpy.sa'] = arcpy.sa
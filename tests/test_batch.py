@@ -0,0 +1,84 @@
+'''Tests of the drainage ordering in :mod:`batch`, with the per-folder tools stubbed out.'''
+import csv
+import os
+import sys
+import types
+
+import pytest
+
+try:
+	import arcpy
+except ImportError: # batch only needs arcpy for messages once the folder tools are stubbed
+	sys.modules['arcpy'] = types.ModuleType('arcpy')
+	sys.modules['arcpy'].AddMessage = lambda msg: None
+
+import batch
+
+# outlet of each local folder and the folder its outlet drains into
+OUTLETS = {
+	'a': {'fac': 10, 'x': 1., 'y': 1., 'extent': [0., 0., 10., 10.]},
+	'b': {'fac': 20, 'x': 2., 'y': 2., 'extent': [10., 0., 20., 10.]},
+	'c': {'fac': 30, 'x': None, 'y': None, 'extent': [20., 0., 30., 10.]},
+}
+DRAINS = {'a': 'b', 'b': 'c'}
+FAILING = set()
+
+def _fakeRunFolder(task):
+	moduleName, funcName, folder, args, kwargs, logName, attempt = task
+	name = os.path.basename(folder)
+	if funcName == 'find_outlet' and name in FAILING:
+		return {'folder': folder, 'status': 'failed', 'attempt': attempt, 'seconds': 0., 'error': 'RuntimeError: no fac', 'value': None}
+	value = dict(OUTLETS[name], name = name) if funcName == 'find_outlet' else None
+	return {'folder': folder, 'status': 'ok', 'attempt': attempt, 'seconds': 0., 'error': '', 'value': value}
+
+def _fakeDrainsInto(outlet, extent, fdrPth):
+	return DRAINS.get(outlet['name']) == os.path.basename(os.path.dirname(os.path.dirname(fdrPth)))
+
+@pytest.fixture
+def workspace(tmp_path, monkeypatch):
+	monkeypatch.setattr(batch, '_runFolder', _fakeRunFolder)
+	monkeypatch.setattr(batch, '_drainsInto', _fakeDrainsInto)
+	monkeypatch.setattr(batch, '_gridExtent', lambda pth: OUTLETS[os.path.basename(os.path.dirname(os.path.dirname(pth)))]['extent'])
+	FAILING.clear()
+	return str(tmp_path)
+
+def _run(workspace):
+	manifest = batch.adjust_accum_batch(workspace, folders = ['a', 'b', 'c'], workers = 1, retries = 0)
+	return dict((entry['folder'], entry) for entry in manifest.values())
+
+def test_adjusts_in_drainage_order(workspace):
+	manifest = _run(workspace)
+	assert manifest['a']['status'] == 'headwater'
+	assert manifest['b']['upstream'] == ['a'] and manifest['b']['status'] == 'ok'
+	assert manifest['c']['upstream'] == ['b'] and manifest['c']['status'] == 'ok'
+	assert manifest['c']['global_fac'] == 60
+
+def test_failed_outlet_skips_the_folders_it_may_drain_into(workspace):
+	FAILING.add('a')
+	manifest = _run(workspace)
+	assert manifest['a']['status'] == 'failed'
+	assert manifest['b']['unresolved_upstream'] == ['a']
+	assert manifest['b']['status'] == 'skipped'
+	assert manifest['c']['status'] == 'skipped' # below a skipped folder
+	assert manifest['c']['global_fac'] is None
+
+def test_failed_outlet_without_extent_skips_every_folder(workspace, monkeypatch):
+	monkeypatch.setattr(batch, '_gridExtent', lambda pth: None)
+	FAILING.add('c')
+	manifest = _run(workspace)
+	assert manifest['a']['unresolved_upstream'] == ['c'] and manifest['a']['status'] == 'skipped'
+	assert manifest['b']['status'] == 'skipped'
+
+def test_dependency_levels_rejects_loops():
+	with pytest.raises(ValueError):
+		batch.dependency_levels({'a': 'b', 'b': 'a'})
+
+def test_summary_keeps_error_text(tmp_path):
+	pth = str(tmp_path / 'summary.csv')
+	error = 'ExecuteError: ERROR 000732: "dem", not found,\nFailed to execute (Fill).'
+	batch.write_summary([{'folder': '/ws/a', 'status': 'failed', 'attempt': 2, 'seconds': 3.25, 'error': error}, {'folder': '/ws/b', 'status': 'ok', 'attempt': 1, 'seconds': 1., 'error': ''}], pth)
+	with open(pth, newline = '') as fl:
+		rows = list(csv.reader(fl))
+	assert rows[0] == ['folder', 'status', 'attempt', 'seconds', 'error']
+	assert rows[1] == ['a', 'failed', '2', '3.2', error]
+	assert rows[2] == ['b', 'ok', '1', '1.0', '']
@@ -0,0 +1,64 @@
+'''Tests of the stage manifest in :mod:`checkpoints`.'''
+import checkpoints
+
+def _outputs(tmp_path, *names):
+	paths = []
+	for name in names:
+		pth = tmp_path / name
+		pth.write_text('grid')
+		paths.append(str(pth))
+	return paths
+
+def test_stages_are_reused_across_runs(tmp_path):
+	pth = str(tmp_path / 'manifest.json')
+	manifest = checkpoints.StageManifest(pth)
+	key = manifest.key('inputs', 'dem fingerprint', 60, 10.)
+	assert not manifest.done('agree', key)
+	manifest.record('agree', key, _outputs(tmp_path, 'agree'))
+	rerun = checkpoints.StageManifest(pth)
+	assert rerun.done('agree', key)
+	assert not rerun.done('agree', rerun.key('inputs', 'dem fingerprint', 60, 20.)) # a changed parameter
+	assert not rerun.done('fill', key)
+
+def test_keys_are_chained(tmp_path):
+	manifest = checkpoints.StageManifest(str(tmp_path / 'manifest.json'))
+	agree = manifest.key('inputs', 60)
+	fill = manifest.key(agree, 'fill')
+	manifest.record('agree', agree, _outputs(tmp_path, 'agree'))
+	manifest.record('fill', fill, _outputs(tmp_path, 'hydrodem'))
+	assert manifest.done('fill', manifest.key(manifest.key('inputs', 60), 'fill'))
+	# a change to an earlier stage changes the key of every later stage
+	changedAgree = manifest.key('inputs', 80)
+	assert not manifest.done('agree', changedAgree)
+	assert not manifest.done('fill', manifest.key(changedAgree, 'fill'))
+
+def test_missing_output_invalidates_stage(tmp_path):
+	manifest = checkpoints.StageManifest(str(tmp_path / 'manifest.json'))
+	key = manifest.key('fdr')
+	outputs = _outputs(tmp_path, 'fdr', 'fac')
+	manifest.record('fac', key, outputs)
+	assert manifest.done('fac', key)
+	(tmp_path / 'fac').unlink()
+	assert not manifest.done('fac', key)
+
+def test_exists_function_is_used(tmp_path):
+	manifest = checkpoints.StageManifest(str(tmp_path / 'manifest.json'), exists = lambda out: out.endswith('.gdb/fdr'))
+	manifest.record('fdr', 'k', ['ws.gdb/fdr'])
+	assert manifest.done('fdr', 'k')
+
+def test_corrupt_manifest_reruns_every_stage(tmp_path):
+	pth = tmp_path / 'manifest.json'
+	manifest = checkpoints.StageManifest(str(pth))
+	manifest.record('agree', 'k', _outputs(tmp_path, 'agree'))
+	for text in [pth.read_text()[:20], '[1, 2]']: # truncated, or not a manifest
+		pth.write_text(text)
+		rerun = checkpoints.StageManifest(str(pth))
+		assert not rerun.done('agree', 'k')
+		rerun.record('agree', 'k', [str(tmp_path / 'agree')]) # and is rewritten
+		assert checkpoints.StageManifest(str(pth)).done('agree', 'k')
+
+def test_disabled_manifest(tmp_path):
+	manifest = checkpoints.StageManifest(None)
+	manifest.record('agree', 'k', _outputs(tmp_path, 'agree'))
+	assert not manifest.enabled and not manifest.done('agree', 'k')
+	assert list(tmp_path.iterdir()) == [tmp_path / 'agree']
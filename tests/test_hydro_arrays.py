@@ -0,0 +1,514 @@
+'''Tests of the array engines in :mod:`hydro_arrays` on small synthetic DEMs, checked against plain reference implementations. Only NumPy and SciPy are needed.'''
+import heapq
+
+import numpy as np
+import pytest
+from scipy import ndimage
+
+import hydro_arrays as ha
+
+def _dem(seed, shape = (61, 47), nodata = True):
+	'''Rough random DEM with pits and, optionally, a NoData corner and hole.'''
+	rng = np.random.default_rng(seed)
+	dem = ndimage.gaussian_filter(rng.random(shape), 1.5) * 100 + rng.random(shape)
+	dem = dem.astype(np.float32)
+	if nodata:
+		dem[:4, :6] = np.nan
+		dem[30:33, 20:22] = np.nan
+	return dem
+
+def _reference_fill(dem):
+	'''Textbook Priority-Flood (Barnes and others, 2014, algorithm 1).'''
+	nrows, ncols = dem.shape
+	valid = ~np.isnan(dem)
+	filled = dem.copy()
+	closed = ~valid
+	heap = []
+	for r in range(nrows):
+		for c in range(ncols):
+			if not valid[r, c]:
+				continue
+			edge = r in (0, nrows - 1) or c in (0, ncols - 1) or not valid[max(r - 1, 0):r + 2, max(c - 1, 0):c + 2].all()
+			if edge:
+				heapq.heappush(heap, (dem[r, c], r, c))
+				closed[r, c] = True
+	while heap:
+		z, r, c = heapq.heappop(heap)
+		for k in range(8):
+			nr, nc = r + ha.D8_ROWS[k], c + ha.D8_COLS[k]
+			if 0 <= nr < nrows and 0 <= nc < ncols and not closed[nr, nc]:
+				closed[nr, nc] = True
+				filled[nr, nc] = max(filled[nr, nc], z)
+				heapq.heappush(heap, (filled[nr, nc], nr, nc))
+	return filled
+
+def _downstream(fdr, r, c):
+	'''Cell a cell flows into, None if it flows off the grid, into NoData or is a sink.'''
+	k = ha._D8_INDEX[fdr[r, c]]
+	if k < 0:
+		return None
+	nr, nc = r + ha.D8_ROWS[k], c + ha.D8_COLS[k]
+	if not (0 <= nr < fdr.shape[0] and 0 <= nc < fdr.shape[1]) or fdr[nr, nc] == ha.FDR_NODATA:
+		return None
+	return nr, nc
+
+def _reference_accumulation(fdr):
+	'''Number of cells upstream of each cell, by walking down from every cell.'''
+	acc = np.zeros(fdr.shape, dtype=np.int64)
+	for r, c in zip(*np.nonzero(fdr != ha.FDR_NODATA)):
+		cell = _downstream(fdr, r, c)
+		while cell is not None:
+			acc[cell] += 1
+			cell = _downstream(fdr, *cell)
+	return acc
+
+@pytest.mark.parametrize('tileSize, workers', [(8, 1), (17, 2), (30, 3)])
+def test_agree_invariant_to_tiling(tileSize, workers):
+	dem = _dem(9)
+	dendrite = np.zeros(dem.shape, dtype=bool)
+	dendrite[10:50, 25] = True
+	dendrite[40, 5:40] = True
+	args = (dem, dendrite, 60, -5, -50, 10.)
+	ref = ha.agree(*args, tileSize = 1000)
+	np.testing.assert_array_equal(ha.agree(*args, tileSize = tileSize, workers = workers), ref)
+	assert np.isnan(ref[~np.isfinite(dem)]).all()
+	assert (ref[dendrite & np.isfinite(dem)] < dem[dendrite & np.isfinite(dem)]).all()
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_fill_matches_reference_priority_flood(seed):
+	dem = _dem(seed)
+	filled, depth = ha.priority_flood_fill(dem)
+	ref = _reference_fill(dem)
+	np.testing.assert_array_equal(filled, ref)
+	np.testing.assert_allclose(depth, ref - dem)
+
+def test_fill_integer_dem():
+	dem = (_dem(3, nodata = False) * 10).astype(np.int32)
+	filled = ha.priority_flood_fill(dem)[0]
+	np.testing.assert_array_equal(filled, _reference_fill(dem.astype(np.float64)).astype(np.int32))
+
+def test_flow_direction_steepest_descent():
+	dem = _dem(5, nodata = False)
+	fdr = ha.flow_direction(dem)
+	for r in range(1, dem.shape[0] - 1):
+		for c in range(1, dem.shape[1] - 1):
+			drops = [(dem[r, c] - dem[r + ha.D8_ROWS[k], c + ha.D8_COLS[k]]) / ha.D8_DIST[k] for k in range(8)]
+			if max(drops) > 0:
+				assert fdr[r, c] == ha.D8_CODES[int(np.argmax(drops))]
+
+def test_flats_drain_to_their_outlet():
+	# a flat plateau walled in on three sides, spilling through one cell on the south edge
+	dem = np.full((15, 12), 10., dtype=np.float32)
+	dem[0, :] = dem[:, 0] = dem[:, -1] = 20.
+	dem[-1, :] = 20.
+	dem[-1, 6] = 5.
+	fdr = ha.flow_direction(dem)
+	for r in range(1, 14):
+		for c in range(1, 11):
+			assert fdr[r, c] in ha.D8_CODES
+			cell, steps = (r, c), 0
+			while cell != (14, 6):
+				cell = _downstream(fdr, *cell)
+				steps += 1
+				assert cell is not None and steps < dem.size # no loops or dead ends on the flat
+
+def test_filled_dem_drains_off_the_grid():
+	fdr = ha.flow_direction(ha.priority_flood_fill(_dem(8))[0], tileSize = 9)
+	for r, c in zip(*np.nonzero(fdr != ha.FDR_NODATA)):
+		cell, steps = (r, c), 0
+		while True:
+			nxt = _downstream(fdr, *cell)
+			if nxt is None:
+				break
+			cell = nxt
+			steps += 1
+			assert steps < fdr.size
+		assert fdr[cell] != 0
+
+def test_flow_accumulation_matches_brute_force():
+	fdr = ha.flow_direction(ha.priority_flood_fill(_dem(7))[0])
+	fac = ha.flow_accumulation(fdr, dtype = np.int64)
+	ref = _reference_accumulation(fdr)
+	valid = fdr != ha.FDR_NODATA
+	np.testing.assert_array_equal(fac[valid], ref[valid])
+	assert (fac[~valid] == ha.fac_nodata(np.int64)).all()
+
+@pytest.mark.parametrize('tileSize, workers', [(7, 1), (16, 1), (25, 2), (9, 3), (1000, 1)])
+def test_tiled_fill_matches_untiled(tmp_path, tileSize, workers):
+	dem = _dem(4)
+	filled, depth = ha.priority_flood_fill(dem)
+	store = ha.ArrayStore(str(tmp_path))
+	demS = store.create('dem', dem.shape, dem.dtype)
+	demS[...] = dem
+	out, outDepth = ha.priority_flood_fill_tiled(demS, out = store.create('filled', dem.shape, dem.dtype), depth = store.create('depth', dem.shape, dem.dtype), labels = store.create('labels', dem.shape, np.int32), tileSize = tileSize, workers = workers)
+	np.testing.assert_array_equal(out, filled)
+	np.testing.assert_array_equal(outDepth, depth)
+
+@pytest.mark.parametrize('tileSize', [5, 13, 32])
+def test_tiled_flow_direction_and_accumulation_match_untiled(tileSize):
+	filled = ha.priority_flood_fill(_dem(6))[0]
+	fdr = ha.flow_direction(filled, tileSize = 1000)
+	np.testing.assert_array_equal(ha.flow_direction(filled, tileSize = tileSize), fdr)
+	fac = ha.flow_accumulation(fdr, tileSize = 1000)
+	np.testing.assert_array_equal(ha.flow_accumulation(fdr, tileSize = tileSize), fac)
+	np.testing.assert_array_equal(ha.flow_accumulation_tiled(fdr, tileSize = tileSize), fac)
+
+def test_flats_resolved_across_tiles(tmp_path):
+	# a flat winding between walls across many tiles, spilling through one cell on the south edge
+	dem = np.full((40, 36), 10., dtype=np.float32)
+	dem[0, :] = dem[-1, :] = dem[:, 0] = dem[:, -1] = 20.
+	dem[-1, 3] = 5.
+	for r in range(8, 36, 8):
+		if r % 16:
+			dem[r, 1:-4] = 30.
+		else:
+			dem[r, 4:-1] = 30.
+	ref = ha.flow_direction(dem, tileSize = 1000)
+	store = ha.ArrayStore(str(tmp_path))
+	for tileSize in [3, 7, 16]:
+		labels = store.create('labels%s'%tileSize, dem.shape, np.int32, fill = 5) # stale values are ignored
+		distances = store.create('distances%s'%tileSize, (2,) + dem.shape, np.int32, fill = 9)
+		np.testing.assert_array_equal(ha.flow_direction(dem, labels = labels, distances = distances, tileSize = tileSize), ref)
+	for r, c in zip(*np.nonzero(dem == 10.)):
+		cell, steps = (r, c), 0
+		while cell != (39, 3):
+			cell = _downstream(ref, *cell)
+			steps += 1
+			assert cell is not None and steps < dem.size
+
+def _con_chain(elev, stream, ridge, huc, outwallht, eucd, bowldepth, inwall, inwallht, plugs):
+	'''The Spatial Analyst walling, bowling, inwalling and drain plug chain of hydrodem, one grid per step with NaN for NoData.'''
+	f32 = np.float32
+	ridgeW = ridge & ~huc # SetNull((IsNull(ridgeNL) == 0) & (IsNull(ridgeEXP) == 0), ridgeEXP)
+	demRidge8 = elev + np.where(ridgeW & ~stream, f32(outwallht), f32(0))
+	demRidge8wb = demRidge8 - np.where(~np.isnan(eucd), f32(bowldepth) / (eucd + f32(1)), f32(0))
+	dem_enforced = demRidge8wb + np.where(inwall & ~stream, f32(inwallht), f32(0))
+	dem_enforced = np.where(plugs, np.nan, dem_enforced) # Con(IsNull(dpg), dem_enforced)
+	return np.where(ridge, dem_enforced, np.nan).astype(np.float32) # masked to ridgeEXP
+
+@pytest.mark.parametrize('tileSize', [7, 1000])
+def test_enforce_matches_con_chain(tileSize):
+	elev = _dem(14)
+	shape = elev.shape
+	huc = np.zeros(shape, dtype=bool)
+	huc[6:55, 5:42] = True
+	ridge = ndimage.binary_dilation(huc, iterations = 2)
+	stream = np.zeros(shape, dtype=bool)
+	stream[:, 20] = True
+	polys = np.zeros(shape, dtype=bool)
+	polys[15:30, 10:30] = True
+	lines = np.zeros(shape, dtype=bool)
+	lines[22, 12:28] = True
+	eucd = np.where(polys, ndimage.distance_transform_edt(~lines) * 10., np.nan).astype(np.float32) # EucDistance in map units
+	inwall = np.zeros(shape, dtype=bool)
+	inwall[40:43, 8:38] = True
+	plugs = np.zeros(shape, dtype=bool)
+	plugs[[41, 50], [20, 30]] = True
+	ref = _con_chain(elev, stream, ridge, huc, 1000., eucd, 25., inwall, 150., plugs)
+	out = ha.enforce(elev, stream, ridge, huc, 1000., eucd, 25., inwall, 150., plugs, mask = ridge, tileSize = tileSize)
+	np.testing.assert_array_equal(out, ref)
+	inplace = elev.copy()
+	ha.enforce(inplace, stream, ridge, huc, 1000., eucd, 25., inwall, 150., plugs, mask = ridge, out = inplace, tileSize = tileSize)
+	np.testing.assert_array_equal(inplace, ref)
+
+def _even_odd(rings, x, y):
+	'''Brute-force even-odd test of whether each point is inside a set of rings.'''
+	inside = np.zeros(x.shape, dtype=bool)
+	for ring in rings:
+		for (xa, ya), (xb, yb) in zip(ring, np.roll(ring, -1, axis = 0)):
+			crosses = (ya > y) != (yb > y)
+			with np.errstate(divide='ignore', invalid='ignore'):
+				xc = xa + (y - ya) / (yb - ya) * (xb - xa)
+			inside ^= crosses & (x < xc)
+	return inside
+
+BURN_GRID = ha.GridSpec(1000., 2000., 10., 40, 50) # upper left corner at (1000, 2000), 10 m cells
+
+def _cell_centers(grid):
+	rows, cols = np.mgrid[0:grid.nrows, 0:grid.ncols]
+	return grid.xmin + (cols + 0.5) * grid.cellsize, grid.ymax - (rows + 0.5) * grid.cellsize
+
+@pytest.mark.parametrize('seed', [0, 1, 2, 3])
+def test_burn_polygons_matches_even_odd(seed):
+	rng = np.random.default_rng(seed)
+	# a star-shaped outer ring, partly off the grid, with a hole
+	angles = np.sort(rng.random(15)) * 2 * np.pi
+	radius = 80 + rng.random(15) * 150
+	outer = np.column_stack([1230 + radius * np.cos(angles), 1800 + radius * np.sin(angles)])
+	hole = np.array([[1200., 1780.], [1260., 1790.], [1240., 1840.]])
+	rings = [outer, hole]
+	x, y = _cell_centers(BURN_GRID)
+	out = ha.burn_polygons([(rings, 7)], BURN_GRID)
+	np.testing.assert_array_equal(out == 7, _even_odd(rings, x, y))
+	assert set(np.unique(out)) <= {0, 7}
+
+def test_burn_polygons_last_wins():
+	square = lambda x0, y0, s: [np.array([[x0, y0], [x0 + s, y0], [x0 + s, y0 - s], [x0, y0 - s]])]
+	out = ha.burn_polygons([(square(1000., 2000., 200.), 1), (square(1100., 1900., 200.), 2)], BURN_GRID, dtype = np.uint8)
+	assert out.dtype == np.uint8
+	assert (out[:10, :10] == 1).all() and (out[10:30, 10:30] == 2).all() and out[:10, 20:].max() == 0
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_burn_lines_is_supercover(seed):
+	rng = np.random.default_rng(seed)
+	path = np.column_stack([980 + rng.random(6) * 540, 1580 + rng.random(6) * 440]) # may leave the grid
+	out = ha.burn_lines([([path], 3)], BURN_GRID)
+	# cells holding densely sampled points along every segment
+	ref = np.zeros(BURN_GRID.shape, dtype=bool)
+	t = np.linspace(0, 1, 200001)[1:-1]
+	for a, b in zip(path[:-1], path[1:]):
+		pts = a + t[:, None] * (b - a)
+		rows = np.floor((BURN_GRID.ymax - pts[:, 1]) / BURN_GRID.cellsize).astype(int)
+		cols = np.floor((pts[:, 0] - BURN_GRID.xmin) / BURN_GRID.cellsize).astype(int)
+		ok = (rows >= 0) & (rows < BURN_GRID.nrows) & (cols >= 0) & (cols < BURN_GRID.ncols)
+		ref[rows[ok], cols[ok]] = True
+	np.testing.assert_array_equal(out == 3, ref)
+
+def test_burn_points():
+	points = np.array([[1005., 1995.], [1499., 1601.], [1250., 1800.], [900., 1800.]])
+	out = ha.burn_points([(points, 4), (points[:1], 9)], BURN_GRID)
+	assert out[0, 0] == 9 and out[39, 49] == 4 and out[20, 25] == 4 # the last feature wins
+	assert (out > 0).sum() == 3 # the point off the grid is dropped
+
+def test_rasterize_cache(tmp_path):
+	cache = ha.RasterizeCache(str(tmp_path / 'cache'))
+	key = cache.key('fingerprint', 'polygons', BURN_GRID)
+	assert cache.get(key) is None
+	grid = ha.burn_points([(np.array([[1005., 1995.]]), 1)], BURN_GRID)
+	cache.put(key, grid)
+	np.testing.assert_array_equal(cache.get(key), grid) # a hit
+	cache.put(key, grid * 2) # replaced
+	np.testing.assert_array_equal(cache.get(key), grid * 2)
+	assert key == cache.key('fingerprint', 'polygons', BURN_GRID)
+	assert len({key, cache.key('changed', 'polygons', BURN_GRID), cache.key('fingerprint', 'lines', BURN_GRID), cache.key('fingerprint', 'polygons', BURN_GRID._replace(ncols = 51))}) == 4
+	assert [p.name for p in (tmp_path / 'cache').iterdir()] == ['%s.npy'%key] # no temporary files left
+
+def test_rasterize_cache_ignores_truncated_grid(tmp_path):
+	cache = ha.RasterizeCache(str(tmp_path))
+	key = cache.key('fingerprint', 'lines', BURN_GRID)
+	cache.put(key, np.ones(BURN_GRID.shape, dtype=np.int32))
+	pth = tmp_path / ('%s.npy'%key)
+	data = pth.read_bytes()
+	pth.write_bytes(data[:len(data) // 2]) # an interrupted write
+	assert cache.get(key) is None
+
+def test_tiled_fill_workers_need_memory_mapped_arrays():
+	dem = _dem(4)
+	with pytest.raises(ValueError):
+		ha.priority_flood_fill_tiled(dem, tileSize = 16, workers = 2)
+
+@pytest.mark.parametrize('tileSize', [5, 12, 1000])
+def test_sink_table_matches_scipy_labels(tileSize):
+	dem = _dem(11)
+	filled, depth = ha.priority_flood_fill(dem)
+	table, labels = ha.sink_table(depth, filled, threshold = 0.5, cellArea = 4., tileSize = tileSize)
+	inside = np.nan_to_num(depth) > 0.5
+	ref, n = ndimage.label(inside, structure = np.ones((3, 3), dtype=bool))
+	assert len(table) == n
+	np.testing.assert_array_equal(labels > 0, inside)
+	for row in table:
+		cells = labels == row['id']
+		assert row['cells'] == cells.sum()
+		assert len(np.unique(ref[cells])) == 1 and (ref == ref[cells][0]).sum() == row['cells'] # one scipy component
+		assert row['max_depth'] == pytest.approx(depth[cells].max())
+		assert row['volume'] == pytest.approx(depth[cells].sum() * 4.)
+		rows, cols = np.nonzero(cells)
+		assert (row['row_min'], row['row_max'], row['col_min'], row['col_max']) == (rows.min(), rows.max(), cols.min(), cols.max())
+
+def _cone_pit():
+	# a cone around (10, 10) whose only outlet is a channel running east along row 10 from (10, 18) to the edge
+	rows, cols = np.mgrid[0:21, 0:21]
+	dem = (1 + np.hypot(rows - 10, cols - 10)).astype(np.float32)
+	dem[10, 19:] = [5, 4]
+	return dem
+
+@pytest.mark.parametrize('tileSize', [4, 7, 1000])
+def test_sink_spill_cell_is_the_outlet(tileSize):
+	filled, depth = ha.priority_flood_fill(_cone_pit())
+	table, labels = ha.sink_table(depth, filled, tileSize = tileSize)
+	assert len(table) == 1
+	assert (table['spill_row'][0], table['spill_col'][0]) == (10, 18)
+	assert depth[10, 18] == 0 and filled[10, 18] == filled[10, 10]
+
+@pytest.mark.parametrize('tileSize', [6, 1000])
+def test_sink_spill_cells_drain_the_depression(tileSize):
+	dem = _dem(15)
+	filled, depth = ha.priority_flood_fill(dem)
+	table, labels = ha.sink_table(depth, filled, threshold = 0.5, tileSize = tileSize)
+	assert len(table) and (table['spill_row'] >= 0).all()
+	padded = np.pad(filled.astype(np.float64), 1, constant_values = np.nan)
+	for row in table:
+		r, c = row['spill_row'], row['spill_col']
+		cells = labels == row['id']
+		level = filled[cells][np.argmax(depth[cells])] # fill level of the depression
+		assert filled[r, c] == level and depth[r, c] == 0
+		nbrs = padded[r:r + 3, c:c + 3]
+		assert np.isnan(nbrs).any() or np.nanmin(nbrs) < level # water leaves through it
+
+def test_sparse_cells_from_points_last_wins():
+	points = np.array([[1005., 1995.], [1255., 1795.], [1499., 1601.], [2000., 1800.]])
+	cells = ha.SparseCells.from_points([(points, 1), (points[1:2] + 2., 2), (points[:1], 3)], BURN_GRID)
+	assert cells.shape == BURN_GRID.shape
+	np.testing.assert_array_equal(cells.index, [0, 20 * 50 + 25, 39 * 50 + 49]) # sorted, the point off the grid dropped
+	np.testing.assert_array_equal(cells.ids, [3, 2, 1]) # where points share a cell the last one wins
+	burned = ha.burn_points([(points, 1), (points[1:2] + 2., 2), (points[:1], 3)], BURN_GRID)
+	np.testing.assert_array_equal(burned.reshape(-1)[cells.index], cells.ids)
+	assert (burned > 0).sum() == cells.size
+
+def test_sparse_cells_window_and_contains():
+	mask = np.zeros((9, 7), dtype=bool)
+	mask[[0, 2, 2, 5, 8], [6, 1, 4, 3, 0]] = True
+	ids = np.arange(63).reshape(9, 7)
+	cells = ha.SparseCells.from_mask(mask, ids)
+	np.testing.assert_array_equal(cells.ids, ids[mask])
+	for r0, r1, c0, c1 in [(0, 9, 0, 7), (2, 6, 2, 5), (1, 2, 0, 7), (0, 3, 4, 7)]:
+		rows, cols, wids = cells.window(r0, r1, c0, c1)
+		np.testing.assert_array_equal((rows, cols), np.nonzero(mask[r0:r1, c0:c1]))
+		np.testing.assert_array_equal(wids, ids[r0:r1, c0:c1][mask[r0:r1, c0:c1]])
+	np.testing.assert_array_equal(cells.contains(np.array([6, 15, 16, 17, 62])), [True, True, False, False, False])
+
+def test_sparse_plugs_match_plug_grid():
+	filled = ha.priority_flood_fill(_dem(16))[0]
+	plugs = np.zeros(filled.shape, dtype=bool)
+	plugs[[20, 40, 41], [10, 30, 30]] = True
+	sparse = ha.SparseCells.from_mask(plugs)
+	for tileSize in [8, 1000]:
+		np.testing.assert_array_equal(ha.flow_direction(filled, plugs = sparse, tileSize = tileSize), ha.flow_direction(filled, plugs = plugs, tileSize = tileSize))
+		np.testing.assert_array_equal(ha.enforce(filled, plugs, plugs = sparse, tileSize = tileSize), ha.enforce(filled, plugs, plugs = plugs, tileSize = tileSize))
+	assert (ha.flow_direction(filled, plugs = sparse)[plugs] == 0).all()
+
+@pytest.mark.parametrize('tileSize, workers', [(6, 1), (20, 2), (1000, 1)])
+def test_region_distance_matches_brute_force(tileSize, workers):
+	rng = np.random.default_rng(10)
+	sources = rng.random((40, 33)) > 0.995
+	region = np.zeros(sources.shape, dtype=bool)
+	region[5:12, 3:9] = region[25:38, 20:30] = True
+	dist = ha.region_distance(sources, region, tileSize = tileSize, workers = workers)
+	sr, sc = np.nonzero(sources)
+	for r, c in zip(*np.nonzero(region)):
+		assert dist[r, c] == pytest.approx(np.sqrt((sr - r) ** 2 + (sc - c) ** 2).min(), rel = 1e-6)
+	assert np.isinf(dist[~region]).all()
+	np.testing.assert_array_equal(ha.source_distance(sources, region, tileSize = tileSize), dist)
+
+def test_label_components_across_tiles():
+	mask = _dem(17, nodata = False) > 50
+	ref, n = ndimage.label(mask, structure = np.ones((3, 3), dtype=bool))
+	for tileSize in [4, 9, 1000]:
+		labels, boxes = ha.label_components(mask, tileSize = tileSize)
+		assert len(boxes) == n
+		for i in range(1, n + 1): # the same components as scipy, each with its bounding box
+			cells = labels == i
+			assert len(np.unique(ref[cells])) == 1 and (ref == ref[cells][0]).sum() == cells.sum()
+			rows, cols = np.nonzero(cells)
+			np.testing.assert_array_equal(boxes[i - 1], [rows.min(), rows.max() + 1, cols.min(), cols.max() + 1])
+
+def test_propagate_paths_matches_walks():
+	fdr = ha.flow_direction(ha.priority_flood_fill(_dem(12))[0])
+	fdr[45, 30] = 0 # a sink stops the paths
+	starts = [(10, 10), (50, 40), (20, 35), (10, 10)]
+	values = [5, 7, 11, 2]
+	ref = {}
+	for (r, c), value in zip(starts, values):
+		cell = (r, c)
+		while cell is not None:
+			ref[cell] = ref.get(cell, 0) + value
+			cell = _downstream(fdr, *cell) if fdr[cell] != 0 else None
+	for tileSize in [4, 16, 1000]:
+		cells, totals = ha.propagate_paths(fdr, starts, values, tileSize)
+		flat = sorted(r * fdr.shape[1] + c for r, c in ref)
+		np.testing.assert_array_equal(cells, flat)
+		np.testing.assert_array_equal(totals, [ref[divmod(i, fdr.shape[1])] for i in flat])
+
+@pytest.mark.parametrize('encoding', ['scaled', 'log'])
+def test_accumulation_encoding_round_trip(encoding):
+	values = np.array([0, 1, 999, 1000, 123456789, 5e12, 3e15, np.nan])
+	codes = ha.encode_accumulation(values, encoding)
+	assert codes.dtype == np.uint32 and codes[-1] == ha.fac_nodata(np.uint32)
+	assert (np.diff(codes[:-1].astype(np.int64)) >= 0).all() # order is kept
+	decoded = ha.decode_accumulation(codes, encoding)
+	assert np.isnan(decoded[-1])
+	if encoding == 'scaled':
+		inRange = values[:-1] < ha.ACCUMULATION_SCALES['scaled'] * (ha.fac_nodata(np.uint32) - 1)
+		assert (np.abs(decoded[:-1] - values[:-1])[inRange] < ha.ACCUMULATION_SCALES['scaled']).all()
+		assert (codes[:-1][~inRange] == ha.fac_nodata(np.uint32) - 1).all() # clipped below NoData
+	else:
+		np.testing.assert_allclose(decoded[:-1], values[:-1], rtol = 1e-7, atol = 1e-7)
+
+def test_save_and_load_accumulation(tmp_path):
+	pth = str(tmp_path / 'acc.npz')
+	ha.save_accumulation(pth, [3, 7], [2**40, 5], (4, 5), 'scaled', 1000.)
+	acc = ha.load_accumulation(pth)
+	assert acc['shape'] == (4, 5) and acc['encoding'] == 'scaled' and acc['scale'] == 1000.
+	np.testing.assert_array_equal(acc['values'], [2**40, 5])
+	np.testing.assert_array_equal(ha.accumulation_values(acc, [3, 4], np.array([0, 17], dtype=np.uint32)), [2**40, 17000])
+
+# a Y-shaped network: a stem down column 2 and a tributary along row 2 joining it at (2, 2)
+_E, _S, _W = 1, 4, 16
+HAND_FDR = np.array([
+	[_S, _S, _S, _W, _W],
+	[_S, _S, _S, _W, _W],
+	[_E, _E, _S, _W, _W],
+	[_E, _E, _S, _W, _W],
+	[_E, _E, _S, _W, _W]], dtype=np.uint8)
+HAND_STREAM = [(0, 2), (1, 2), (2, 2), (3, 2), (4, 2), (2, 0), (2, 1)]
+
+def _hand_links():
+	cells = np.sort([r * 5 + c for r, c in HAND_STREAM])
+	links = ha.stream_links(cells, HAND_FDR.ravel()[cells], HAND_FDR.shape)
+	lnk = np.zeros(HAND_FDR.shape, dtype=np.int32)
+	lnk.ravel()[cells] = links
+	return lnk
+
+def test_stream_links_hand_built():
+	lnk = _hand_links()
+	# heads at (0, 2) and (2, 0) and the junction at (2, 2), numbered in row order
+	expected = np.zeros((5, 5), dtype=np.int32)
+	expected[0:2, 2] = 1
+	expected[2, 0:2] = 2
+	expected[2:5, 2] = 3
+	np.testing.assert_array_equal(lnk, expected)
+
+HAND_CAT = np.array([
+	[2, 2, 1, 1, 1],
+	[2, 2, 1, 1, 1],
+	[2, 2, 3, 3, 3],
+	[3, 3, 3, 3, 3],
+	[3, 3, 3, 3, 3]], dtype=np.int32)
+
+@pytest.mark.parametrize('tileSize', [1, 2, 3, 100])
+def test_catchment_grid_hand_built(tileSize):
+	np.testing.assert_array_equal(ha.catchment_grid(HAND_FDR, _hand_links(), tileSize = tileSize), HAND_CAT)
+
+def test_catchment_grid_nodata_and_unlinked_cells():
+	fdr = HAND_FDR.copy()
+	fdr[0, 0] = ha.FDR_NODATA
+	fdr[4, 4] = 0 # a sink holding (4, 4) only
+	lnk = _hand_links()
+	lnk[0, 0] = 9 # links on NoData are ignored
+	cat = ha.catchment_grid(fdr, lnk, tileSize = 2)
+	assert cat[0, 0] == 0 and cat[4, 4] == 0
+	assert cat[4, 3] == 3
+
+def test_catchments_on_synthetic_dem():
+	fdr = ha.flow_direction(ha.priority_flood_fill(_dem(13))[0])
+	fac = ha.flow_accumulation(fdr, dtype = np.int64)
+	cells = np.flatnonzero((fac > 25) & (fdr != ha.FDR_NODATA))
+	lnk = np.zeros(fdr.shape, dtype=np.int32)
+	lnk.ravel()[cells] = ha.stream_links(cells, fdr.ravel()[cells], fdr.shape)
+	cat = ha.catchment_grid(fdr, lnk, tileSize = 1000)
+	for tileSize in [4, 11]:
+		np.testing.assert_array_equal(ha.catchment_grid(fdr, lnk, tileSize = tileSize), cat)
+	# every cell takes the link of the first stream cell down its path
+	for r, c in zip(*np.nonzero(fdr != ha.FDR_NODATA)):
+		cell = (r, c)
+		while cell is not None and lnk[cell] == 0:
+			cell = _downstream(fdr, *cell)
+		assert cat[r, c] == (0 if cell is None else lnk[cell])
+
+@pytest.mark.parametrize('tileSize', [2, 3, 100])
+def test_catchment_outlets_hand_built(tileSize):
+	fac = ha.flow_accumulation(HAND_FDR)
+	outlets = ha.catchment_outlets(fac, HAND_CAT, ha.fac_nodata(fac.dtype), tileSize)
+	assert outlets['id'].tolist() == [1, 2, 3]
+	assert list(zip(outlets['row'].tolist(), outlets['col'].tolist())) == [(1, 2), (2, 1), (4, 2)]
+	assert outlets['value'].tolist() == [fac[1, 2], fac[2, 1], fac[4, 2]]
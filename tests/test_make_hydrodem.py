@@ -0,0 +1,102 @@
+'''Tests of the array helpers in :mod:`make_hydrodem` that do not need ArcGIS, with the arcpy calls they make stubbed out.'''
+from collections import namedtuple
+import types
+
+import numpy as np
+import pytest
+
+import make_hydrodem as mh
+
+Extent = namedtuple('Extent', ['XMin', 'YMin', 'XMax', 'YMax'])
+
+class _Template(object):
+	'''Raster with 10 rows and 8 columns of 30 m cells, the upper left corner at (1000, 2000).'''
+	extent = Extent(1000., 1700., 1240., 2000.)
+	meanCellWidth = meanCellHeight = 30.
+	width, height = 8, 10
+
+@pytest.mark.parametrize('extent, window', [
+	(Extent(1000., 1700., 1240., 2000.), (0, 10, 0, 8)), # the whole template
+	(Extent(1030., 1790., 1120., 1940.), (2, 7, 1, 4)), # on cell edges
+	(Extent(1035., 1785., 1115., 1945.), (1, 8, 1, 4)), # widened to whole cells
+	(Extent(900., 1500., 1100., 1950.), (1, 10, 0, 4)), # clipped to the template
+])
+def test_extent_window(extent, window):
+	assert mh._extentWindow(_Template(), extent) == window
+
+def test_array_to_raster_window(monkeypatch):
+	monkeypatch.setattr(mh.arcpy, 'Point', lambda x, y: (x, y), raising = False)
+	monkeypatch.setattr(mh.arcpy, 'NumPyArrayToRaster', lambda *args: args, raising = False)
+	arr = np.arange(80, dtype=np.uint8).reshape(10, 8)
+	block, lowerLeft, cw, ch, nodata = mh._arrayToRaster(arr, _Template(), 255, (2, 7, 1, 4))
+	np.testing.assert_array_equal(block, arr[2:7, 1:4])
+	assert lowerLeft == (1030., 1790.) and nodata == 255
+	assert mh._arrayToRaster(arr, _Template(), 255)[1] == (1000., 1700.)
+
+class _FakeRaster(_Template):
+	'''The template as a raster of a fac or fac_global grid.'''
+	def __init__(self, pth):
+		self.pth = pth
+
+@pytest.fixture
+def fakeFac(monkeypatch):
+	# a grid whose largest cell, (3, 4), holds 4000 and flows east
+	monkeypatch.setattr(mh, 'Raster', _FakeRaster, raising = False)
+	monkeypatch.setattr(mh, '_rasterMaxCell', lambda rast: (3, 4, np.uint32(4000)))
+	monkeypatch.setattr(mh, '_rasterCell', lambda rast, x, y: np.uint8(1))
+
+def test_find_outlet_local_fac(tmp_path, fakeFac):
+	outlet = mh.find_outlet(str(tmp_path / 'fac'), str(tmp_path / 'fdr'))
+	assert outlet['fac'] == 4000
+	assert (outlet['x'], outlet['y']) == (1000. + 5.5 * 30, 2000. - 3.5 * 30)
+	assert outlet['extent'] == [1000., 1700., 1240., 2000.]
+
+@pytest.mark.parametrize('encoding', ['scaled', 'log'])
+def test_find_outlet_decodes_fac_global(tmp_path, monkeypatch, fakeFac, encoding):
+	facPth = str(tmp_path / 'fac_global')
+	code = int(mh.hydro_arrays.encode_accumulation(np.array([4e9]), encoding)[0])
+	monkeypatch.setattr(mh, '_rasterMaxCell', lambda rast: (3, 4, np.uint32(code)))
+	mh.hydro_arrays.save_accumulation(mh._accumulationPth(facPth), [], [], (10, 8), encoding)
+	assert mh.find_outlet(facPth, str(tmp_path / 'fdr'))['fac'] == pytest.approx(4e9, rel = 1e-3)
+
+def test_find_outlet_uses_saved_values(tmp_path, fakeFac):
+	facPth = str(tmp_path / 'fac_global')
+	# clipped in a uint32 grid: the outlet at (3, 4) and a cell upstream of it both hold the largest value
+	mh.hydro_arrays.save_accumulation(mh._accumulationPth(facPth), [2 * 8 + 3, 3 * 8 + 4], [2**33, 2**33 + 10], (10, 8))
+	outlet = mh.find_outlet(facPth, str(tmp_path / 'fdr'))
+	assert outlet['fac'] == 2**33 + 10 and isinstance(outlet['fac'], int)
+
+# two inlets at the top corners whose paths join at (1, 1) and leave the grid below (3, 1)
+MERGING_FDR = np.array([
+	[2, 4, 8],
+	[0, 4, 0],
+	[0, 4, 0],
+	[0, 4, 0],
+], dtype=np.uint8)
+MERGING_STARTS = [(0, 0), (0, 2)]
+
+@pytest.fixture
+def fakeAdjust(monkeypatch):
+	# adjust_accum_simple on MERGING_FDR, returning what it adds to the fac grid
+	monkeypatch.setattr(mh.arcpy, 'Exists', lambda pth: True, raising = False)
+	monkeypatch.setattr(mh.arcpy, 'env', types.SimpleNamespace(), raising = False)
+	monkeypatch.setattr(mh, 'Raster', lambda pth: types.SimpleNamespace(height = 4, width = 3), raising = False)
+	monkeypatch.setattr(mh, '_RasterBlocks', lambda pth, nodata: MERGING_FDR)
+	added = {}
+	def addToCells(rast, outPth, cells, values, tileSize = 1024):
+		rows, cols = np.divmod(cells, MERGING_FDR.shape[1])
+		added.update(((r, c), v) for r, c, v in zip(rows, cols, values))
+	monkeypatch.setattr(mh, '_addToCells', addToCells)
+	return added
+
+def test_adjust_accum_simple_merging_inlets(monkeypatch, fakeAdjust):
+	# without a field every cell on the paths is raised once, as by Con(costPth, incrval)
+	monkeypatch.setattr(mh, '_inletCells', lambda ptin, incrField, incrval, template: (MERGING_STARTS, [incrval] * 2))
+	mh.adjust_accum_simple('inlets', 'fdr', 'fac', 'fil', 'facout', 5, engine = 'numpy')
+	assert fakeAdjust == {(0, 0): 5, (0, 2): 5, (1, 1): 5, (2, 1): 5, (3, 1): 5}
+
+def test_adjust_accum_simple_merging_inlets_field(monkeypatch, fakeAdjust):
+	# with a field the values are summed below the junction
+	monkeypatch.setattr(mh, '_inletCells', lambda ptin, incrField, incrval, template: (MERGING_STARTS, [5, 7]))
+	mh.adjust_accum_simple('inlets', 'fdr', 'fac', 'fil', 'facout', 5, incrField = 'INCR')
+	assert fakeAdjust == {(0, 0): 5, (0, 2): 7, (1, 1): 12, (2, 1): 12, (3, 1): 12}
@@ -0,0 +1,38 @@
+'''Tests of the stage records written by :mod:`profiling`.'''
+import json
+import sys
+
+import pytest
+
+import profiling
+
+def _records(pth):
+	with open(pth) as fl:
+		return [json.loads(line) for line in fl]
+
+def test_failed_stage_is_recorded(tmp_path):
+	pth = str(tmp_path / 'profile.jsonl')
+	profiler = profiling.StageProfiler(pth, {'workspace': 'ws'})
+	with pytest.raises(RuntimeError):
+		with profiler:
+			profiler.start('agree', cells = 10)
+			profiler.start('fill')
+			raise RuntimeError('out of memory')
+	records = _records(pth)
+	assert [r['stage'] for r in records] == ['agree', 'fill']
+	assert records[0]['error'] is None and records[0]['cells'] == 10 and records[0]['workspace'] == 'ws'
+	assert records[1]['error'] == 'RuntimeError: out of memory'
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason = 'the peak can only be reset on Linux')
+def test_peak_memory_is_per_stage(tmp_path):
+	pth = str(tmp_path / 'profile.jsonl')
+	with profiling.StageProfiler(pth) as profiler:
+		profiler.start('large')
+		block = bytearray(200 * 2**20)
+		block[::4096] = b'x' * len(block[::4096]) # touch every page
+		del block
+		profiler.start('small')
+	large, small = _records(pth)
+	if large['peak_rss_bytes'] is None:
+		pytest.skip('/proc/self/clear_refs is not writable')
+	assert large['peak_rss_bytes'] - small['peak_rss_bytes'] > 150 * 2**20